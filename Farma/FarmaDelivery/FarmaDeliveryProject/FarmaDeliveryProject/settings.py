@@ -11,6 +11,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -152,6 +153,68 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Configuración de geocodificación (Nominatim + caché en GeocodeCache)
+GEOCODIFICACION_URL = 'https://nominatim.openstreetmap.org/search'
+GEOCODIFICACION_TIMEOUT = 6  # segundos
+GEOCODIFICACION_TTL = timedelta(days=30)  # direcciones encontradas
+GEOCODIFICACION_TTL_NEGATIVO = timedelta(days=1)  # direcciones no encontradas
+GEOCODIFICACION_MAX_INTENTOS = 8  # reintentos del worker antes de abandonar una dirección
+GEOCODIFICACION_MAX_POR_SEGUNDO = 1  # política de uso de Nominatim
+
+# Ubicaciones de repartidores (ver core/ubicaciones.py)
+UBICACIONES_INTERVALO_VOLCADO = 5  # segundos entre escrituras por lote de los pings de GPS
+UBICACIONES_MAX_PENDIENTES = 500  # volcar antes si se acumulan tantos repartidores
+UBICACIONES_TTL_PEDIDOS = 10  # segundos que se reutiliza la grilla de pedidos disponibles
+UBICACIONES_MAX_PUNTOS_LOTE = 1000  # puntos aceptados por envío en /api/ubicacion/lote/
+UBICACIONES_MAX_DIAS_ATRASO = 7  # antigüedad máxima de un punto subido por lote
+RECORRIDOS_DIR = BASE_DIR / 'recorridos'  # archivos diarios de recorridos (core/recorridos.py)
+RECORRIDOS_MAX_INDICES = 14  # días con el índice por repartidor en memoria (se descartan los leídos hace más tiempo)
+
+# Estimación de hora de entrega (ver core/eta.py)
+ETA_VELOCIDAD_KMH = {'BICI': 12, 'MOTO': 25}  # velocidad promedio en ciudad por tipo de vehículo
+ETA_VEHICULO_POR_DEFECTO = 'BICI'  # antes de asignar repartidor se estima con el más lento
+ETA_FACTOR_RUTA = 1.3  # distancia por calles / distancia en línea recta
+ETA_MINUTOS_PREPARACION = 15
+ETA_MINUTOS_POR_PEDIDO_EN_COLA = 5  # por cada pedido PENDIENTE/PREPARANDO de la farmacia
+ETA_MINUTOS_RETIRO = 10  # hasta que un repartidor llega a la farmacia
+ETA_DISTANCIA_POR_DEFECTO_KM = 3  # si la dirección todavía no tiene coordenadas
+ETA_TTL_ESTADISTICAS = 30  # segundos que se reutilizan las estadísticas por farmacia
+
+# Despacho centralizado de pedidos (ver core/despacho.py y manage.py despachar_pedidos)
+DESPACHO_CENTRALIZADO = False  # False: cada repartidor toma pedidos cercanos por su cuenta
+DESPACHO_INTERVALO = 15  # segundos entre rondas de asignación
+DESPACHO_SEGUNDOS_OFERTA = 60  # tiempo que tiene el repartidor para aceptar antes de reasignar
+DESPACHO_RADIO_KM = 5  # distancia máxima del repartidor a la farmacia
+DESPACHO_KM_POR_MINUTO_DE_ESPERA = 0.05  # cuánto "acerca" un pedido cada minuto que lleva esperando
+
+# Zonas de reparto (ver core/zonas.py)
+RADIO_REPARTO_POR_DEFECTO_KM = 2  # alcance de farmacias y repartidores que no tienen zona dibujada
+ZONAS_TTL = 60  # segundos antes de rearmar el índice de zonas con cambios de otros procesos
+
+# Búsqueda de productos (ver core/busqueda.py)
+BUSQUEDA_MAX_RESULTADOS = None  # tope opcional de resultados del índice de texto completo (None: todos)
+BUSQUEDA_CACHE_TTL = 300  # segundos que vive un resultado guardado en el cache de búsquedas
+BUSQUEDA_CACHE_MAX = 500  # máximo de búsquedas guardadas (se descartan las usadas hace más tiempo)
+TRIGRAMAS_UMBRAL = 0.25  # similitud mínima (0 a 1) para la búsqueda tolerante a errores de tipeo
+TRIGRAMAS_TTL = 600  # segundos antes de rearmar completo el índice de trigramas
+TRIGRAMAS_MAX_RESULTADOS = 50  # resultados de la búsqueda aproximada (después de aplicar los filtros)
+AUTOCOMPLETAR_TTL = 600  # segundos antes de rearmar completa la lista de nombres del autocompletado
+AUTOCOMPLETAR_TTL_CERCANIA = 300  # segundos que se recuerdan las farmacias cercanas de cada cliente
+AUTOCOMPLETAR_MAX_SUGERENCIAS = 10
+
+# Orden de resultados por precio, distancia y stock (ver core/ranking.py)
+RANKING_PESO_PRECIO = 0.6  # peso del precio final normalizado en el orden "recomendado"
+RANKING_PESO_DISTANCIA = 0.4  # peso de la distancia normalizada en el orden "recomendado"
+RANKING_POCO_STOCK = 5  # unidades desde las que se considera poco stock
+RANKING_PENALIZACION_POCO_STOCK = 0.15
+
+# Búsqueda por código de barras (ver core/catalogo.py)
+CATALOGO_MAX_CODIGOS_LOTE = 100  # códigos por consulta en /api/productos/por-codigo/
+
+# Rutas de repartidores con varios pedidos (ver core/rutas.py)
+RUTAS_DESVIO_MAX_KM = 1.5  # kilómetros extra aceptables para sugerir sumar un pedido LISTO
+RUTAS_MAX_SUGERENCIAS = 3
+
 # Configuración de sesiones
 SESSION_COOKIE_AGE = 86400  # 24 horas
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
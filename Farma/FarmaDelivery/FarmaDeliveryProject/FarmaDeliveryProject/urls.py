@@ -26,6 +26,8 @@ urlpatterns = [
     path('farmacia/pedido/<int:pedido_id>/cancelar-receta/', core_views.cancelar_pedido_receta, name='cancelar_pedido_receta'),
     path('farmacia/pedido/<int:pedido_id>/entregar-repartidor/', core_views.entregar_al_repartidor, name='entregar_al_repartidor'),
     path('farmacia/pedido/<int:pedido_id>/listo-retiro/', core_views.listo_para_retiro, name='listo_para_retiro'),
+    path('farmacia/pedido/<int:pedido_id>/repartidores-cercanos/', core_views.api_repartidores_cercanos, name='api_repartidores_cercanos'),
+    path('farmacia/pedido/<int:pedido_id>/recorrido/', core_views.api_recorrido_pedido, name='api_recorrido_pedido'),
     # Inventario se gestiona dentro del panel de farmacia (/farmacia/) en la pestaña correspondiente
     path('farmacia/inventario/producto/<int:producto_id>/actualizar-stock/', core_views.actualizar_stock, name='actualizar_stock'),
     path('farmacia/precios/', core_views.configuracion_precios, name='configuracion_precios'),
@@ -5,7 +5,9 @@ from django.utils.html import format_html  # <-- ¡IMPORTACIÓN AÑADIDA!
 from .models import (
     Direccion, ObraSocial, Cliente, Farmacia, Repartidor, 
     Producto, DescuentoObraSocial, ListaProductos, 
-    Pedido, DetallePedido, Rol, EstadoPedido, MetodoPago
+    Pedido, DetallePedido, Rol, EstadoPedido, MetodoPago,
+    GeocodeCache, GeocodificacionPendiente, UbicacionRepartidor, OfertaPedido,
+    ProductoCatalogo, PrecioObraSocial,
 )
 
 # Configuración inline para mostrar direcciones en otros modelos
@@ -107,7 +109,7 @@ class ProductoAdmin(admin.ModelAdmin):
     inlines = [DescuentoObraSocialInline]
     
     # 2. Añadimos un campo de solo lectura para la previsualización
-    readonly_fields = ('get_thumbnail_display',)
+    readonly_fields = ('get_thumbnail_display', 'catalogo')
 
     # 3. Funciones para mostrar la imagen
     def get_thumbnail(self, obj):
@@ -135,7 +137,7 @@ class ProductoAdmin(admin.ModelAdmin):
             'fields': ('imagen', 'get_thumbnail_display')
         }),
         ('Datos Adicionales', {
-            'fields': ('codigo_barras',),
+            'fields': ('codigo_barras', 'catalogo'),
             'classes': ('collapse',)
         }),
     )
@@ -148,6 +150,20 @@ class DescuentoObraSocialAdmin(admin.ModelAdmin):
     search_fields = ['producto__nombre', 'obra_social__nombre']
     ordering = ['producto__nombre', 'obra_social__nombre']
 
+# Configuración del admin para PrecioObraSocial (se calcula desde los descuentos, solo lectura)
+@admin.register(PrecioObraSocial)
+class PrecioObraSocialAdmin(admin.ModelAdmin):
+    list_display = ['producto', 'obra_social', 'descuento_aplicado', 'precio_final']
+    list_filter = ['obra_social']
+    search_fields = ['producto__nombre', 'obra_social__nombre']
+    list_select_related = ['producto__farmacia', 'obra_social']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Configuración del admin para ListaProductos
 @admin.register(ListaProductos)
 class ListaProductosAdmin(admin.ModelAdmin):
@@ -179,3 +195,58 @@ class DetallePedidoAdmin(admin.ModelAdmin):
     list_filter = ['pedido__estado', 'pedido__farmacia']
     search_fields = ['pedido__numero_pedido', 'producto__nombre']
     ordering = ['pedido__fecha_creacion']
+
+
+# Configuración del admin para GeocodeCache
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ['direccion_normalizada', 'encontrada', 'latitud', 'longitud', 'fecha_expiracion']
+    list_filter = ['encontrada']
+    search_fields = ['direccion_normalizada', 'direccion_encontrada']
+    ordering = ['direccion_normalizada']
+
+
+# Configuración del admin para GeocodificacionPendiente
+@admin.register(GeocodificacionPendiente)
+class GeocodificacionPendienteAdmin(admin.ModelAdmin):
+    list_display = ['direccion', 'intentos', 'proximo_intento', 'ultimo_error']
+    search_fields = ['direccion__calle', 'direccion__ciudad']
+    ordering = ['proximo_intento']
+
+
+# Configuración del admin para UbicacionRepartidor
+@admin.register(UbicacionRepartidor)
+class UbicacionRepartidorAdmin(admin.ModelAdmin):
+    list_display = ['repartidor', 'fecha', 'latitud', 'longitud']
+    list_filter = ['repartidor']
+    date_hierarchy = 'fecha'
+    ordering = ['-fecha']
+
+
+# Configuración del admin para OfertaPedido
+@admin.register(OfertaPedido)
+class OfertaPedidoAdmin(admin.ModelAdmin):
+    list_display = ['pedido', 'repartidor', 'distancia_km', 'fecha_creacion', 'fecha_expiracion']
+    search_fields = ['pedido__numero_pedido', 'repartidor__user__username']
+    ordering = ['fecha_expiracion']
+
+
+# Ofertas de cada farmacia dentro de la entrada del catálogo
+class OfertaCatalogoInline(admin.TabularInline):
+    model = Producto
+    fk_name = 'catalogo'
+    fields = ['farmacia', 'precio_base', 'stock_disponible', 'activo']
+    readonly_fields = ['farmacia']
+    extra = 0
+    can_delete = False
+    show_change_link = True
+
+
+# Configuración del admin para ProductoCatalogo
+@admin.register(ProductoCatalogo)
+class ProductoCatalogoAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'codigo_barras', 'laboratorio', 'categoria', 'requiere_receta']
+    list_filter = ['requiere_receta', 'categoria', 'laboratorio']
+    search_fields = ['nombre', 'codigo_barras', 'laboratorio']
+    ordering = ['nombre']
+    inlines = [OfertaCatalogoInline]
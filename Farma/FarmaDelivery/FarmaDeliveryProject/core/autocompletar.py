@@ -0,0 +1,177 @@
+"""
+Autocompletado de nombres de productos para la caja de búsqueda.
+
+Los nombres de los productos activos se guardan normalizados (minúsculas, sin
+acentos) en una lista ordenada: las sugerencias para un prefijo son el tramo
+de la lista que empieza en bisect_left(prefijo). Para cada nombre se lleva
+cuántos productos activos lo tienen en cada farmacia, así la respuesta se
+puede limitar a las farmacias cercanas al cliente sin consultar la base.
+
+La lista se arma en el primer uso, se mantiene al guardar o borrar productos
+(ver core/signals.py) y se rearma completa cada AUTOCOMPLETAR_TTL segundos.
+Las farmacias cercanas de cada usuario (con sus distancias) también se guardan
+en memoria durante AUTOCOMPLETAR_TTL_CERCANIA segundos, para no recalcularlas
+en cada tecla; buscar_productos usa el mismo cache.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+
+from .models import Cliente, Farmacia, Producto
+from .trigramas import normalizar
+
+
+def _configuracion():
+    return {
+        'ttl': getattr(settings, 'AUTOCOMPLETAR_TTL', 600),
+        'ttl_cercania': getattr(settings, 'AUTOCOMPLETAR_TTL_CERCANIA', 300),
+        'max_sugerencias': getattr(settings, 'AUTOCOMPLETAR_MAX_SUGERENCIAS', 10),
+    }
+
+
+def clave_de(nombre):
+    return ' '.join(normalizar(nombre).split())
+
+
+class IndiceNombres:
+    """Nombres de productos activos ordenados, con sus farmacias"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._armado = None
+        self._claves = []
+        self._nombres = {}
+        self._farmacias = {}
+        self._productos = {}
+
+    def _agregar(self, producto_id, nombre, farmacia_id, ordenar=True):
+        clave = clave_de(nombre)
+        if not clave:
+            return
+        self._productos[producto_id] = (clave, farmacia_id)
+        if clave not in self._nombres:
+            if ordenar:
+                insort(self._claves, clave)
+            self._nombres[clave] = nombre.strip()
+            self._farmacias[clave] = Counter()
+        self._farmacias[clave][farmacia_id] += 1
+
+    def _quitar(self, producto_id):
+        anterior = self._productos.pop(producto_id, None)
+        if anterior is None:
+            return
+        clave, farmacia_id = anterior
+        farmacias = self._farmacias[clave]
+        farmacias[farmacia_id] -= 1
+        if farmacias[farmacia_id] <= 0:
+            del farmacias[farmacia_id]
+        if not farmacias:
+            # Ningún producto activo con ese nombre: sale de la lista
+            del self._claves[bisect_left(self._claves, clave)]
+            del self._nombres[clave]
+            del self._farmacias[clave]
+
+    def _armar_si_vencido(self):
+        # Se llama con el lock tomado
+        if self._armado is not None and time.monotonic() - self._armado < _configuracion()['ttl']:
+            return
+        self._claves, self._nombres, self._farmacias, self._productos = [], {}, {}, {}
+        productos = Producto.objects.filter(activo=True).values_list('id', 'nombre', 'farmacia_id')
+        for producto_id, nombre, farmacia_id in productos.iterator(chunk_size=2000):
+            # Se ordena una sola vez al final
+            self._agregar(producto_id, nombre, farmacia_id, ordenar=False)
+        self._claves = sorted(self._nombres)
+        self._armado = time.monotonic()
+
+    def actualizar(self, producto):
+        """Refleja un producto guardado (no hace nada si la lista no está armada)"""
+        with self._lock:
+            if self._armado is None:
+                return
+            self._quitar(producto.id)
+            if producto.activo:
+                self._agregar(producto.id, producto.nombre, producto.farmacia_id)
+
+    def quitar(self, producto_id):
+        with self._lock:
+            if self._armado is not None:
+                self._quitar(producto_id)
+
+    def invalidar(self):
+        with self._lock:
+            self._armado = None
+
+    def sugerir(self, prefijo, farmacias=None, limite=None):
+        """
+        Nombres que empiezan con `prefijo`, en orden alfabético. Si se pasa
+        `farmacias` (ids), solo los que tienen algún producto en esas farmacias.
+        """
+        limite = limite or _configuracion()['max_sugerencias']
+        prefijo = clave_de(prefijo)
+        if not prefijo:
+            return []
+        sugerencias = []
+        with self._lock:
+            self._armar_si_vencido()
+            claves = self._claves
+            for i in range(bisect_left(claves, prefijo), len(claves)):
+                clave = claves[i]
+                if not clave.startswith(prefijo):
+                    break
+                if farmacias is not None and farmacias.isdisjoint(self._farmacias[clave]):
+                    continue
+                sugerencias.append(self._nombres[clave])
+                if len(sugerencias) >= limite:
+                    break
+        return sugerencias
+
+
+class CercaniaUsuarios:
+    """
+    Farmacias cercanas a cada usuario cliente como {farmacia_id: distancia en km}
+    (None = sin dirección geocodificada, sin filtro por cercanía)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_usuario = {}
+
+    def distancias(self, user):
+        ahora = time.monotonic()
+        with self._lock:
+            guardado = self._por_usuario.get(user.id)
+        if guardado is not None and guardado[0] > ahora:
+            return guardado[1]
+
+        distancias = None
+        try:
+            direccion = Cliente.objects.select_related('direccion').get(user=user).direccion
+        except Cliente.DoesNotExist:
+            direccion = None
+        if direccion and direccion.latitud and direccion.longitud:
+            distancias = {
+                f['farmacia'].id: f['distancia']
+                for f in Farmacia.farmacias_cercanas(direccion)
+            }
+        with self._lock:
+            self._por_usuario[user.id] = (ahora + _configuracion()['ttl_cercania'], distancias)
+        return distancias
+
+    def farmacias(self, user):
+        """Ids de las farmacias cercanas, o None"""
+        distancias = self.distancias(user)
+        return distancias.keys() if distancias is not None else None
+
+    def invalidar(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._por_usuario.clear()
+            else:
+                self._por_usuario.pop(user_id, None)
+
+
+indice_nombres = IndiceNombres()
+cercania_usuarios = CercaniaUsuarios()
@@ -0,0 +1,218 @@
+"""
+Búsqueda de productos por texto.
+
+En SQLite con FTS5 se usa el índice core_producto_fts (ver la migración
+0018_producto_fts), que cubre nombre, descripción, laboratorio y categoría,
+ignora mayúsculas y acentos y ordena por relevancia (bm25, con más peso en el
+nombre). Cada palabra buscada se toma como prefijo: "ibup" encuentra
+"Ibuprofeno" e "IBUPIRAC". Los filtros de la búsqueda (categoría, farmacias
+cercanas, activo...) se aplican en la misma consulta, antes de ordenar y
+limitar, para no perder coincidencias cercanas detrás de miles de lejanas.
+
+En otras bases de datos se usa icontains sobre los mismos campos, sin ranking.
+"""
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+# Peso de cada columna del índice en el ranking: nombre, descripcion, laboratorio, categoria
+PESOS_COLUMNAS = (10.0, 1.0, 4.0, 2.0)
+
+_PATRON_PALABRA = re.compile(r'\w+', re.UNICODE)
+
+_fts_disponible = {}
+
+
+def fts_disponible():
+    """True si la base es SQLite y tiene la tabla core_producto_fts"""
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts_disponible:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'core_producto_fts'")
+            _fts_disponible[connection.alias] = cursor.fetchone() is not None
+    return _fts_disponible[connection.alias]
+
+
+def palabras(texto):
+    return _PATRON_PALABRA.findall(texto or '')
+
+
+def consulta_fts(texto):
+    """Convierte el texto del usuario en una consulta FTS5 segura: cada palabra como prefijo, todas requeridas"""
+    return ' '.join(f'"{palabra}"*' for palabra in palabras(texto))
+
+
+def buscar_ids(texto, productos, limite=None):
+    """
+    [(id, farmacia_id, puntaje)] de los productos de `productos` (QuerySet
+    con los filtros de la búsqueda) que coinciden con el texto, del más al
+    menos relevante (menor puntaje bm25 primero, a igual puntaje por id).
+    Retorna None si no hay índice FTS (el llamador usa filtrar_por_texto).
+
+    `limite` (o BUSQUEDA_MAX_RESULTADOS) es opcional: por defecto se traen
+    todas las coincidencias.
+    """
+    if not fts_disponible():
+        return None
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    limite = limite or getattr(settings, 'BUSQUEDA_MAX_RESULTADOS', None)
+    # Los filtros van como subconsulta en el JOIN; SQLite la aplana y recorre
+    # primero las coincidencias del índice, buscando cada producto por id
+    filtrados, parametros = productos.order_by().values_list('id', 'farmacia_id').query.sql_with_params()
+    sql = (
+        f"SELECT p.id, p.farmacia_id, bm25(core_producto_fts, {', '.join(str(peso) for peso in PESOS_COLUMNAS)}) "
+        f"FROM core_producto_fts JOIN ({filtrados}) p ON p.id = core_producto_fts.rowid "
+        "WHERE core_producto_fts MATCH %s ORDER BY 3, 1"
+    )
+    parametros = [*parametros, consulta]
+    if limite:
+        sql += " LIMIT %s"
+        parametros.append(limite)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
+
+
+# Ids por consulta al filtrar una lista grande de ids (límite de parámetros de SQLite)
+TANDA_IDS = 900
+
+
+def filas_por_ids(productos, ids):
+    """[(id, farmacia_id)] de los productos de `productos` con esos ids, consultando por tandas"""
+    ids = list(ids)
+    filas = []
+    for inicio in range(0, len(ids), TANDA_IDS):
+        filas.extend(productos.filter(id__in=ids[inicio:inicio + TANDA_IDS]).values_list('id', 'farmacia_id'))
+    return filas
+
+
+def filas_a_resultado(filas):
+    """
+    Columnas compactas (array) de filas (id, farmacia_id, puntaje) ya
+    ordenadas por puntaje e id: es lo que se guarda en el cache de búsquedas.
+    """
+    return {
+        'ids': array('q', (fila[0] for fila in filas)),
+        'farmacias': array('q', (fila[1] for fila in filas)),
+        'puntajes': array('d', (fila[2] for fila in filas)),
+    }
+
+
+class IdsPorDistancia:
+    """
+    Ids de un resultado del cache en el orden en que se muestran a un cliente:
+    relevancia, distancia de la farmacia (`distancias` = {farmacia_id: km} del
+    cliente) e id. Se arma en cada pedido porque clientes distintos con las
+    mismas farmacias cercanas comparten la entrada del cache.
+
+    El resultado ya viene ordenado por puntaje e id y la distancia solo
+    desempata entre puntajes iguales, así que para una página alcanza con
+    reordenar los tramos de igual puntaje que la tocan: el costo de la página
+    1 no depende de la cantidad de resultados.
+    """
+
+    def __init__(self, resultado, distancias):
+        self._ids = resultado['ids']
+        self._farmacias = resultado['farmacias']
+        self._puntajes = resultado['puntajes']
+        self._distancias = distancias
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, indice):
+        if not isinstance(indice, slice):
+            return self[indice:indice + 1][0] if indice >= 0 else self[len(self) + indice]
+        inicio, fin, paso = indice.indices(len(self))
+        if inicio >= fin:
+            return []
+        if not self._distancias:
+            return list(self._ids[inicio:fin:paso])
+        # Extender la porción hasta los bordes de los tramos de igual puntaje
+        puntajes = self._puntajes
+        desde = bisect_left(puntajes, puntajes[inicio], 0, inicio)
+        hasta = bisect_right(puntajes, puntajes[fin - 1], fin)
+        sin_distancia = float('inf')
+        posiciones = sorted(
+            range(desde, hasta),
+            key=lambda i: (puntajes[i], self._distancias.get(self._farmacias[i], sin_distancia), self._ids[i]),
+        )
+        return [self._ids[i] for i in posiciones[inicio - desde:fin - desde:paso]]
+
+
+def productos_por_distancia(productos, distancias):
+    """
+    Ordena `productos` por distancia de la farmacia e id en la base, para
+    paginar en SQL los resultados que no tienen puntaje de relevancia.
+    """
+    if not distancias:
+        return productos.order_by('id')
+    return productos.annotate(distancia=Case(
+        *[When(farmacia_id=farmacia_id, then=Value(distancia)) for farmacia_id, distancia in distancias.items()],
+        default=Value(None),
+        output_field=FloatField(),
+    )).order_by('distancia', 'id')
+
+
+def coinciden_con_texto(productos, texto):
+    """Restringe `productos` a los que coinciden con el texto en el índice FTS (para contar facetas)"""
+    return productos.filter(id__in=RawSQL(
+        "SELECT rowid FROM core_producto_fts WHERE core_producto_fts MATCH %s", [consulta_fts(texto)],
+    ))
+
+
+def filtrar_por_texto(productos, texto):
+    """Alternativa sin FTS: cada palabra tiene que aparecer en alguno de los campos"""
+    for palabra in palabras(texto):
+        productos = productos.filter(
+            Q(nombre__icontains=palabra) | Q(descripcion__icontains=palabra)
+            | Q(laboratorio__icontains=palabra) | Q(categoria__icontains=palabra)
+        )
+    return productos
+
+
+def contar_facetas(productos):
+    """
+    Cantidad de productos por categoría, laboratorio, receta y farmacia, con
+    una sola consulta agrupada por las cuatro columnas; los totales de cada
+    faceta se suman acá. Retorna {faceta: [(valor, etiqueta, cantidad)]} de
+    mayor a menor cantidad.
+    """
+    grupos = productos.order_by().values(
+        'categoria', 'laboratorio', 'requiere_receta', 'farmacia_id', 'farmacia__nombre',
+    ).annotate(cantidad=Count('id'))
+
+    totales = {'categoria': {}, 'laboratorio': {}, 'requiere_receta': {}, 'farmacia': {}}
+    for grupo in grupos:
+        cantidad = grupo['cantidad']
+        claves = {
+            'categoria': (grupo['categoria'], grupo['categoria']),
+            'laboratorio': (grupo['laboratorio'], grupo['laboratorio']),
+            'requiere_receta': (
+                ('con_receta', 'Con Receta') if grupo['requiere_receta'] else ('venta_libre', 'Venta Libre')
+            ),
+            'farmacia': (grupo['farmacia_id'], grupo['farmacia__nombre']),
+        }
+        for faceta, clave in claves.items():
+            if clave[0] in ('', None):
+                continue
+            totales[faceta][clave] = totales[faceta].get(clave, 0) + cantidad
+
+    return {
+        faceta: sorted(
+            ((valor, etiqueta, cantidad) for (valor, etiqueta), cantidad in conteo.items()),
+            key=lambda f: (-f[2], str(f[1]).lower()),
+        )
+        for faceta, conteo in totales.items()
+    }
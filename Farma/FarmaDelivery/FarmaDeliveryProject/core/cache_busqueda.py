@@ -0,0 +1,152 @@
+"""
+Cache en memoria de resultados de búsqueda de productos.
+
+Cada entrada guarda los productos encontrados (id, farmacia y puntaje de
+relevancia, en arrays compactos) y las cantidades por faceta, con clave
+(texto normalizado, filtros, farmacias cercanas del cliente). Dos clientes
+del mismo barrio que buscan "ibuprofeno" comparten la entrada, así que no se
+guarda nada que dependa de cada cliente: el orden por distancia
+(busqueda.IdsPorDistancia, solo sobre la página pedida) se aplica en cada
+pedido después de leer el cache. Las búsquedas sin puntaje de relevancia
+(solo filtros) guardan únicamente las facetas y se paginan en SQL.
+
+Tampoco se guardan precios ni stock. El orden por precio, stock o
+recomendado (ranking.ordenar) y los precios con descuento de la página
+(PrecioObraSocial) se leen de la base en cada pedido, después del cache. Por
+eso cambiar precio_base o stock_disponible no invalida entradas (ver
+CAMPOS_DE_BUSQUEDA en core/signals.py); solo los campos que deciden qué
+productos coinciden con la búsqueda.
+
+Cada entrada recuerda de qué farmacias depende: las cercanas al cliente, la
+del filtro de farmacia o todas (sin dirección ni filtro). Al guardar o borrar
+un producto o una farmacia (ver core/signals.py) se descartan solo las
+entradas que dependen de esa farmacia. Además cada entrada vence a los
+BUSQUEDA_CACHE_TTL segundos, para tomar cambios de otros procesos o de
+QuerySet.update(), y se guardan como mucho BUSQUEDA_CACHE_MAX entradas
+(se descartan las usadas hace más tiempo).
+
+metricas() informa aciertos, fallos y el tiempo ahorrado: en cada acierto se
+suma lo que costó calcular la entrada.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .trigramas import normalizar
+
+
+def _configuracion():
+    return {
+        'ttl': getattr(settings, 'BUSQUEDA_CACHE_TTL', 300),
+        'max_entradas': getattr(settings, 'BUSQUEDA_CACHE_MAX', 500),
+    }
+
+
+def clave_busqueda(texto, categoria=None, farmacia_id=None, laboratorio=None, farmacias_cercanas=None):
+    # Categoría y laboratorio se filtran por valor exacto (iexact): sin quitar
+    # acentos, para que 'analgesicos' no comparta resultados con 'Analgésicos'
+    return (
+        ' '.join(normalizar(texto).split()),
+        (categoria or '').strip().lower(),
+        farmacia_id,
+        (laboratorio or '').strip().lower(),
+        frozenset(farmacias_cercanas) if farmacias_cercanas is not None else None,
+    )
+
+
+class CacheBusquedas:
+    """Resultados por clave de búsqueda, invalidados por farmacia"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        # farmacia_id -> claves que dependen de ella; las que dependen de todas van aparte
+        self._por_farmacia = {}
+        self._globales = set()
+        self._aciertos = 0
+        self._fallos = 0
+        self._invalidadas = 0
+        self._segundos_ahorrados = 0.0
+
+    def obtener(self, clave):
+        """El resultado guardado o None"""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada['vence'] <= ahora:
+                if entrada is not None:
+                    self._descartar(clave)
+                self._fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._aciertos += 1
+            self._segundos_ahorrados += entrada['costo']
+            return entrada['resultado']
+
+    def guardar(self, clave, resultado, farmacias, costo):
+        """
+        `farmacias`: ids de las farmacias de las que depende el resultado, o
+        None si depende de todas. `costo`: segundos que llevó calcularlo.
+        """
+        config = _configuracion()
+        with self._lock:
+            if clave in self._entradas:
+                self._descartar(clave)
+            self._entradas[clave] = {
+                'resultado': resultado,
+                'farmacias': frozenset(farmacias) if farmacias is not None else None,
+                'costo': costo,
+                'vence': time.monotonic() + config['ttl'],
+            }
+            if farmacias is None:
+                self._globales.add(clave)
+            else:
+                for farmacia_id in farmacias:
+                    self._por_farmacia.setdefault(farmacia_id, set()).add(clave)
+            while len(self._entradas) > config['max_entradas']:
+                self._descartar(next(iter(self._entradas)))
+
+    def _descartar(self, clave):
+        # Se llama con el lock tomado
+        entrada = self._entradas.pop(clave)
+        if entrada['farmacias'] is None:
+            self._globales.discard(clave)
+            return
+        for farmacia_id in entrada['farmacias']:
+            claves = self._por_farmacia.get(farmacia_id)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self._por_farmacia[farmacia_id]
+
+    def invalidar_farmacia(self, farmacia_id):
+        """Descarta las entradas que pueden incluir productos de la farmacia"""
+        with self._lock:
+            claves = self._por_farmacia.get(farmacia_id, set()) | self._globales
+            for clave in claves:
+                self._descartar(clave)
+            self._invalidadas += len(claves)
+
+    def invalidar(self):
+        with self._lock:
+            self._invalidadas += len(self._entradas)
+            self._entradas.clear()
+            self._por_farmacia.clear()
+            self._globales.clear()
+
+    def metricas(self):
+        with self._lock:
+            consultas = self._aciertos + self._fallos
+            return {
+                'entradas': len(self._entradas),
+                'aciertos': self._aciertos,
+                'fallos': self._fallos,
+                'tasa_aciertos': round(self._aciertos / consultas, 4) if consultas else None,
+                'invalidadas': self._invalidadas,
+                'ms_ahorrados': round(self._segundos_ahorrados * 1000, 1),
+            }
+
+
+cache_busquedas = CacheBusquedas()
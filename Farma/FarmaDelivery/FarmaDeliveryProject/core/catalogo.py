@@ -0,0 +1,66 @@
+"""
+Búsqueda de productos por código de barras (lector de una farmacia, foto de una
+receta con varios productos).
+
+Todas las ofertas de todos los códigos pedidos salen de una sola consulta: el
+filtro usa el índice de Producto.codigo_barras, el catálogo y la farmacia van
+por JOIN y el precio final para la obra social del cliente por un LEFT JOIN a
+PrecioObraSocial (hay a lo sumo una fila por producto y obra social).
+"""
+from django.conf import settings
+
+from .models import PrecioObraSocial, Producto
+
+
+def max_codigos_lote():
+    return getattr(settings, 'CATALOGO_MAX_CODIGOS_LOTE', 100)
+
+
+def ofertas_por_codigo(codigos, obra_social_id=None, farmacias_ids=None):
+    """
+    {código: {'producto': datos del catálogo, 'ofertas': [...]}} para los
+    códigos que tienen alguna oferta activa, con las ofertas de menor a mayor
+    precio final. `farmacias_ids` limita a esas farmacias (p. ej. las cercanas).
+    """
+    productos = PrecioObraSocial.anotar(Producto.objects.filter(
+        codigo_barras__in=set(codigos), activo=True, farmacia__activa=True,
+    ), obra_social_id)
+    if farmacias_ids is not None:
+        productos = productos.filter(farmacia_id__in=farmacias_ids)
+    campos = [
+        'id', 'codigo_barras', 'nombre', 'descripcion', 'laboratorio', 'categoria', 'requiere_receta',
+        'precio_base', 'precio_final', 'stock_disponible', 'farmacia_id', 'farmacia__nombre', 'catalogo_id',
+        'catalogo__nombre', 'catalogo__descripcion', 'catalogo__laboratorio', 'catalogo__categoria',
+        'catalogo__requiere_receta',
+    ]
+
+    resultado = {}
+    for fila in productos.values(*campos):
+        codigo = fila['codigo_barras']
+        if codigo not in resultado:
+            # Datos del catálogo si el producto está vinculado; si no, los del propio producto
+            prefijo = 'catalogo__' if fila['catalogo_id'] else ''
+            resultado[codigo] = {
+                'producto': {
+                    'codigo_barras': codigo,
+                    'catalogo_id': fila['catalogo_id'],
+                    'nombre': fila[f'{prefijo}nombre'],
+                    'descripcion': fila[f'{prefijo}descripcion'],
+                    'laboratorio': fila[f'{prefijo}laboratorio'],
+                    'categoria': fila[f'{prefijo}categoria'],
+                    'requiere_receta': fila[f'{prefijo}requiere_receta'],
+                },
+                'ofertas': [],
+            }
+        resultado[codigo]['ofertas'].append({
+            'producto_id': fila['id'],
+            'farmacia_id': fila['farmacia_id'],
+            'farmacia': fila['farmacia__nombre'],
+            'precio_base': fila['precio_base'],
+            'precio_final': fila['precio_final'],
+            'stock_disponible': fila['stock_disponible'],
+        })
+
+    for datos in resultado.values():
+        datos['ofertas'].sort(key=lambda oferta: (oferta['precio_final'], oferta['producto_id']))
+    return resultado
@@ -0,0 +1,196 @@
+"""
+Despacho centralizado de pedidos listos (opcional, DESPACHO_CENTRALIZADO = True).
+
+En lugar de que cada repartidor recorra todos los pedidos LISTO y los tome por
+orden de llegada, una ronda periódica (manage.py despachar_pedidos) arma una
+matriz de costos repartidor × pedido y resuelve la asignación de una sola vez:
+
+    costo = distancia del repartidor a la farmacia - peso * minutos que lleva esperando el pedido
+
+Cada pedido se ofrece a un único repartidor durante DESPACHO_SEGUNDOS_OFERTA
+segundos (OfertaPedido). Si no lo acepta a tiempo o lo rechaza, vuelve a la
+ronda siguiente. A un repartidor con zona de cobertura solo se le ofrecen
+pedidos que se entregan dentro de su zona.
+
+La asignación usa el método húngaro de SciPy si está instalado y si no un
+greedy sobre los costos ordenados.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .distancias import matriz_distancias_km
+from .models import (
+    EstadoPedido, MINUTOS_DISPONIBILIDAD, OfertaPedido, Pedido, PedidoRechazado, Repartidor,
+)
+from .zonas import zonas_repartidores
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # SciPy es opcional
+    linear_sum_assignment = None
+
+# Costo de un par imposible (fuera de radio o de zona, o pedido rechazado por el repartidor)
+COSTO_IMPOSIBLE = float('inf')
+
+
+def _configuracion():
+    return {
+        'activo': getattr(settings, 'DESPACHO_CENTRALIZADO', False),
+        'segundos_oferta': getattr(settings, 'DESPACHO_SEGUNDOS_OFERTA', 60),
+        'radio_km': getattr(settings, 'DESPACHO_RADIO_KM', 5),
+        'km_por_minuto_de_espera': getattr(settings, 'DESPACHO_KM_POR_MINUTO_DE_ESPERA', 0.05),
+    }
+
+
+def despacho_activo():
+    return _configuracion()['activo']
+
+
+def resolver_asignacion(costos):
+    """
+    Retorna los pares (fila, columna) de menor costo total, cada fila y columna
+    usada a lo sumo una vez, sin pares de costo COSTO_IMPOSIBLE.
+    `costos` es un ndarray o una lista de listas.
+    """
+    if np is not None:
+        costos = np.asarray(costos, dtype=np.float64)
+        if costos.size == 0:
+            return []
+        posibles = np.isfinite(costos)
+        if linear_sum_assignment is not None:
+            # El método húngaro no acepta infinitos: se reemplazan por un costo mayor a cualquier par posible
+            grande = (np.abs(costos[posibles]).max() + 1) * costos.size if posibles.any() else 1
+            filas, columnas = linear_sum_assignment(np.where(posibles, costos, grande))
+            return [(f, c) for f, c in zip(filas.tolist(), columnas.tolist()) if posibles[f, c]]
+        orden = np.argsort(costos, axis=None, kind='stable')
+        orden = orden[posibles.ravel()[orden]]
+        pares = zip(*np.unravel_index(orden, costos.shape))
+    else:
+        pares = sorted(
+            ((f, c) for f, fila in enumerate(costos) for c, costo in enumerate(fila) if costo != COSTO_IMPOSIBLE),
+            key=lambda par: costos[par[0]][par[1]],
+        )
+
+    # Greedy: tomar los pares más baratos sin repetir repartidor ni pedido
+    asignados = []
+    filas_usadas, columnas_usadas = set(), set()
+    for fila, columna in pares:
+        fila, columna = int(fila), int(columna)
+        if fila in filas_usadas or columna in columnas_usadas:
+            continue
+        asignados.append((fila, columna))
+        filas_usadas.add(fila)
+        columnas_usadas.add(columna)
+    return asignados
+
+
+def ronda_de_despacho():
+    """Ofrece los pedidos listos sin oferta a los repartidores libres; retorna las ofertas creadas"""
+    config = _configuracion()
+    ahora = timezone.now()
+    OfertaPedido.objects.filter(fecha_expiracion__lte=ahora).delete()
+
+    pedidos = [
+        pedido for pedido in Pedido.objects.filter(
+            estado=EstadoPedido.LISTO, repartidor__isnull=True, oferta__isnull=True,
+        ).select_related('farmacia__direccion', 'direccion_entrega')
+        if pedido.farmacia.direccion.latitud is not None and pedido.farmacia.direccion.longitud is not None
+    ]
+    if not pedidos:
+        return []
+
+    repartidores = []
+    ubicaciones = []
+    for repartidor in Repartidor.objects.filter(
+        activo=True,
+        ultima_actualizacion_ubicacion__gt=ahora - timedelta(minutes=MINUTOS_DISPONIBILIDAD),
+        ofertas__isnull=True,
+    ):
+        ubicacion = repartidor.ubicacion_para_busqueda()
+        if ubicacion is not None:
+            repartidores.append(repartidor)
+            ubicaciones.append(ubicacion)
+    if not repartidores:
+        return []
+
+    distancias = matriz_distancias_km(
+        [u[0] for u in ubicaciones], [u[1] for u in ubicaciones],
+        [p.farmacia.direccion.latitud for p in pedidos], [p.farmacia.direccion.longitud for p in pedidos],
+    )
+    esperas = [(ahora - p.fecha_creacion).total_seconds() / 60 for p in pedidos]
+    posicion_repartidor = {r.id: i for i, r in enumerate(repartidores)}
+    posicion_pedido = {p.id: j for j, p in enumerate(pedidos)}
+    rechazados = PedidoRechazado.objects.filter(
+        pedido_id__in=posicion_pedido, repartidor_id__in=posicion_repartidor,
+    ).values_list('repartidor_id', 'pedido_id')
+
+    # Pares fuera de la zona de cobertura del repartidor
+    fuera_de_zona = []
+    ids_con_zona = zonas_repartidores.con_zona()
+    con_zona = [r.id for r in repartidores if r.id in ids_con_zona]
+    if con_zona:
+        for pedido in pedidos:
+            entrega = pedido.direccion_entrega
+            cubren = set()
+            if entrega.latitud is not None and entrega.longitud is not None:
+                cubren = zonas_repartidores.que_contienen(entrega.latitud, entrega.longitud)
+            fuera_de_zona.extend((repartidor_id, pedido.id) for repartidor_id in con_zona if repartidor_id not in cubren)
+
+    if np is not None:
+        costos = distancias - config['km_por_minuto_de_espera'] * np.asarray(esperas)[None, :]
+        costos[distancias > config['radio_km']] = COSTO_IMPOSIBLE
+        for repartidor_id, pedido_id in [*rechazados, *fuera_de_zona]:
+            costos[posicion_repartidor[repartidor_id], posicion_pedido[pedido_id]] = COSTO_IMPOSIBLE
+    else:
+        costos = [
+            [
+                distancia - config['km_por_minuto_de_espera'] * espera if distancia <= config['radio_km'] else COSTO_IMPOSIBLE
+                for distancia, espera in zip(fila, esperas)
+            ]
+            for fila in distancias
+        ]
+        for repartidor_id, pedido_id in [*rechazados, *fuera_de_zona]:
+            costos[posicion_repartidor[repartidor_id]][posicion_pedido[pedido_id]] = COSTO_IMPOSIBLE
+
+    expiracion = ahora + timedelta(seconds=config['segundos_oferta'])
+    ofertas = [
+        OfertaPedido(
+            pedido=pedidos[j],
+            repartidor=repartidores[i],
+            distancia_km=round(float(distancias[i][j]), 2),
+            fecha_expiracion=expiracion,
+        )
+        for i, j in resolver_asignacion(costos)
+    ]
+    # ignore_conflicts: si otra ronda ya ofreció el pedido, se respeta esa oferta
+    OfertaPedido.objects.bulk_create(ofertas, ignore_conflicts=True)
+    return ofertas
+
+
+def pedidos_ofrecidos(repartidor):
+    """Ofertas vigentes del repartidor, con el mismo formato que Repartidor.pedidos_cercanos()"""
+    ofertas = OfertaPedido.objects.filter(
+        repartidor=repartidor,
+        fecha_expiracion__gt=timezone.now(),
+        pedido__estado=EstadoPedido.LISTO,
+        pedido__repartidor__isnull=True,
+    ).select_related('pedido__farmacia__direccion', 'pedido__cliente__user', 'pedido__direccion_entrega')
+    return [
+        {'pedido': oferta.pedido, 'distancia': oferta.distancia_km, 'expira': oferta.fecha_expiracion}
+        for oferta in ofertas
+    ]
+
+
+def tiene_oferta(repartidor, pedido):
+    """True si el pedido está ofrecido a este repartidor, la oferta sigue vigente y el pedido sigue LISTO"""
+    return OfertaPedido.objects.filter(
+        repartidor=repartidor, pedido=pedido, fecha_expiracion__gt=timezone.now(),
+        pedido__estado=EstadoPedido.LISTO, pedido__repartidor__isnull=True,
+    ).exists()
@@ -0,0 +1,76 @@
+"""
+Cálculo de distancias Haversine en lote.
+
+Dado un origen y N coordenadas (o dos listas de N y M coordenadas) calcula
+todas las distancias de una sola vez con NumPy. Si NumPy no está instalado se
+usa el mismo cálculo en Python puro, punto por punto.
+"""
+from math import asin, cos, radians, sin, sqrt
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+# Radio de la Tierra en kilómetros
+RADIO_TIERRA_KM = 6371
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distancia en kilómetros entre dos puntos (versión escalar)"""
+    lat1, lon1 = radians(float(lat1)), radians(float(lon1))
+    lat2, lon2 = radians(float(lat2)), radians(float(lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * asin(sqrt(a)) * RADIO_TIERRA_KM
+
+
+def distancias_km(lat_origen, lon_origen, latitudes, longitudes):
+    """Retorna la lista de distancias desde un origen a cada punto (lat, lon)"""
+    if len(latitudes) == 0:
+        return []
+    if np is None:
+        return [haversine_km(lat_origen, lon_origen, lat, lon) for lat, lon in zip(latitudes, longitudes)]
+
+    lat1 = np.radians(float(lat_origen))
+    lon1 = np.radians(float(lon_origen))
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return (2 * np.arcsin(np.sqrt(a)) * RADIO_TIERRA_KM).tolist()
+
+
+def matriz_distancias_km(latitudes_a, longitudes_a, latitudes_b, longitudes_b):
+    """Retorna la matriz N×M de distancias entre los puntos de A y los de B
+
+    Con NumPy retorna un ndarray; sin NumPy, una lista de listas.
+    """
+    if np is None:
+        return [
+            [haversine_km(lat_a, lon_a, lat_b, lon_b) for lat_b, lon_b in zip(latitudes_b, longitudes_b)]
+            for lat_a, lon_a in zip(latitudes_a, longitudes_a)
+        ]
+
+    lat1 = np.radians(np.asarray(latitudes_a, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(longitudes_a, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(latitudes_b, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(longitudes_b, dtype=np.float64))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(a)) * RADIO_TIERRA_KM
+
+
+def longitud_recorrido_km(latitudes, longitudes):
+    """Suma de las distancias entre puntos consecutivos de un recorrido"""
+    if len(latitudes) < 2:
+        return 0.0
+    if np is None:
+        return sum(
+            haversine_km(latitudes[i], longitudes[i], latitudes[i + 1], longitudes[i + 1])
+            for i in range(len(latitudes) - 1)
+        )
+
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    return float((2 * np.arcsin(np.sqrt(a)) * RADIO_TIERRA_KM).sum())
@@ -0,0 +1,133 @@
+"""
+Estimación de la hora de entrega de un pedido.
+
+La estimación suma tres tramos:
+    - la espera en la farmacia: preparación + pedidos PENDIENTE/PREPARANDO que tiene por delante
+    - el retiro: lo que tarda un repartidor en llegar a la farmacia
+    - el viaje de la farmacia al cliente, según la distancia y la velocidad del vehículo
+
+Las coordenadas de cada farmacia y el largo de su cola se leen de una caché en
+memoria que se refresca cada pocos segundos con dos consultas para todas las
+farmacias, así que estimar durante la compra no agrega consultas.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .distancias import haversine_km
+from .models import EstadoPedido, Farmacia, Pedido
+
+
+def _configuracion():
+    return {
+        'velocidades_kmh': getattr(settings, 'ETA_VELOCIDAD_KMH', {'BICI': 12, 'MOTO': 25}),
+        'vehiculo_por_defecto': getattr(settings, 'ETA_VEHICULO_POR_DEFECTO', 'BICI'),
+        'factor_ruta': getattr(settings, 'ETA_FACTOR_RUTA', 1.3),
+        'minutos_preparacion': getattr(settings, 'ETA_MINUTOS_PREPARACION', 15),
+        'minutos_por_pedido_en_cola': getattr(settings, 'ETA_MINUTOS_POR_PEDIDO_EN_COLA', 5),
+        'minutos_retiro': getattr(settings, 'ETA_MINUTOS_RETIRO', 10),
+        'distancia_por_defecto_km': getattr(settings, 'ETA_DISTANCIA_POR_DEFECTO_KM', 3),
+        'ttl_estadisticas': getattr(settings, 'ETA_TTL_ESTADISTICAS', 30),
+    }
+
+
+class EstadisticasFarmacias:
+    """Coordenadas y pedidos en cola por farmacia, refrescados cada ETA_TTL_ESTADISTICAS segundos"""
+
+    def __init__(self):
+        self._farmacias = {}
+        self._actualizadas = None
+        self._lock = threading.Lock()
+
+    def _refrescar_si_vencidas(self):
+        ttl = _configuracion()['ttl_estadisticas']
+        with self._lock:
+            if self._actualizadas is not None and time.monotonic() - self._actualizadas < ttl:
+                return self._farmacias
+            farmacias = {
+                fila['id']: {'latitud': fila['direccion__latitud'], 'longitud': fila['direccion__longitud'], 'en_cola': 0}
+                for fila in Farmacia.objects.values('id', 'direccion__latitud', 'direccion__longitud')
+            }
+            colas = Pedido.objects.filter(
+                estado__in=[EstadoPedido.PENDIENTE, EstadoPedido.PREPARANDO]
+            ).values('farmacia_id').annotate(cantidad=Count('id'))
+            for fila in colas:
+                if fila['farmacia_id'] in farmacias:
+                    farmacias[fila['farmacia_id']]['en_cola'] = fila['cantidad']
+            self._farmacias = farmacias
+            self._actualizadas = time.monotonic()
+            return farmacias
+
+    def de_farmacia(self, farmacia_id):
+        """{'latitud', 'longitud', 'en_cola'} de una farmacia, o None si no está en la caché"""
+        return self._refrescar_si_vencidas().get(farmacia_id)
+
+    def sumar_a_cola(self, farmacia_id):
+        """Cuenta un pedido nuevo sin esperar al próximo refresco"""
+        with self._lock:
+            if farmacia_id in self._farmacias:
+                self._farmacias[farmacia_id]['en_cola'] += 1
+
+    def invalidar(self):
+        with self._lock:
+            self._actualizadas = None
+
+
+estadisticas_farmacias = EstadisticasFarmacias()
+
+
+def minutos_de_viaje(distancia_km, tipo_vehiculo=None):
+    """Minutos para recorrer una distancia en línea recta con el vehículo indicado"""
+    config = _configuracion()
+    velocidades = config['velocidades_kmh']
+    velocidad = velocidades.get(tipo_vehiculo) or velocidades[config['vehiculo_por_defecto']]
+    # Las calles no van en línea recta: se corrige la distancia con un factor de ruta
+    return distancia_km * config['factor_ruta'] / velocidad * 60
+
+
+def _distancia_km(origen, latitud, longitud):
+    if origen is None or origen['latitud'] is None or origen['longitud'] is None or latitud is None or longitud is None:
+        return _configuracion()['distancia_por_defecto_km']
+    return haversine_km(origen['latitud'], origen['longitud'], latitud, longitud)
+
+
+def estimar_entrega(farmacia_id, latitud, longitud, desde=None):
+    """
+    Hora estimada de entrega de un pedido nuevo de una farmacia a unas coordenadas
+    (pueden ser None si la dirección todavía no está geocodificada).
+    Todavía no hay repartidor asignado: se usa el vehículo por defecto.
+    """
+    config = _configuracion()
+    farmacia = estadisticas_farmacias.de_farmacia(farmacia_id)
+    en_cola = farmacia['en_cola'] if farmacia else 0
+    minutos = (
+        config['minutos_preparacion']
+        + en_cola * config['minutos_por_pedido_en_cola']
+        + config['minutos_retiro']
+        + minutos_de_viaje(_distancia_km(farmacia, latitud, longitud))
+    )
+    return (desde or timezone.now()) + timedelta(minutes=round(minutos))
+
+
+def estimar_entrega_con_repartidor(pedido, repartidor, desde=None):
+    """
+    Hora estimada de entrega de un pedido ya listo que toma un repartidor:
+    viaje del repartidor a la farmacia y de la farmacia al cliente con su vehículo.
+    """
+    farmacia = estadisticas_farmacias.de_farmacia(pedido.farmacia_id)
+    direccion = pedido.direccion_entrega
+
+    ubicacion = repartidor.ubicacion_para_busqueda()
+    if ubicacion is None:
+        minutos_retiro = _configuracion()['minutos_retiro']
+    else:
+        minutos_retiro = minutos_de_viaje(_distancia_km(farmacia, *ubicacion), repartidor.tipo_vehiculo)
+
+    minutos = minutos_retiro + minutos_de_viaje(
+        _distancia_km(farmacia, direccion.latitud, direccion.longitud), repartidor.tipo_vehiculo
+    )
+    return (desde or timezone.now()) + timedelta(minutes=round(minutos))
@@ -22,16 +22,21 @@ class BusquedaProductoForm(forms.Form):
         }),
         required=False
     )
-    categoria = forms.ChoiceField(
-        choices=[
-            ('', 'Todas las categorías'),
-            ('con_receta', 'Con Receta'),
-            ('venta_libre', 'Venta Libre'),
-        ],
-        widget=forms.Select(attrs={
-            'class': 'form-control',
-            'id': 'categoria-producto'
-        }),
+    # CharField y no ChoiceField: además de con_receta/venta_libre acepta
+    # cualquier categoría de producto (los enlaces de las facetas)
+    categoria = forms.CharField(
+        max_length=100,
+        widget=forms.Select(
+            choices=[
+                ('', 'Todas las categorías'),
+                ('con_receta', 'Con Receta'),
+                ('venta_libre', 'Venta Libre'),
+            ],
+            attrs={
+                'class': 'form-control',
+                'id': 'categoria-producto'
+            }
+        ),
         required=False
     )
     farmacia = forms.ModelChoiceField(
@@ -43,6 +48,42 @@ class BusquedaProductoForm(forms.Form):
         }),
         required=False
     )
+    laboratorio = forms.CharField(
+        max_length=100,
+        widget=forms.HiddenInput(),
+        required=False
+    )
+    # Un orden desconocido no invalida el formulario (se perderían la búsqueda
+    # y los filtros): se ignora y se ordena por relevancia
+    ORDENES = [
+        ('', 'Más relevantes'),
+        ('precio', 'Menor precio'),
+        ('distancia', 'Más cercanos'),
+        ('recomendado', 'Precio y cercanía'),
+    ]
+    orden = forms.CharField(
+        widget=forms.Select(
+            choices=ORDENES,
+            attrs={
+                'class': 'form-control',
+                'id': 'orden-producto'
+            }
+        ),
+        required=False
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Una categoría elegida desde las facetas se agrega como opción del
+        # select para que siga seleccionada al volver a enviar el formulario
+        categoria = (self.data.get('categoria') or '').strip() if self.is_bound else ''
+        widget = self.fields['categoria'].widget
+        if categoria and categoria not in dict(widget.choices):
+            widget.choices = [*widget.choices, (categoria, categoria)]
+
+    def clean_orden(self):
+        orden = self.cleaned_data.get('orden')
+        return orden if orden in dict(self.ORDENES) else ''
 
 class RecetaForm(forms.Form):
     """Formulario para subir receta médica"""
@@ -510,6 +551,15 @@ class ProductoForm(forms.ModelForm):
         if farmacia:
             self.instance.farmacia = farmacia
 
+    def clean_codigo_barras(self):
+        codigo = self.cleaned_data.get('codigo_barras', '').strip()
+        farmacia_id = self.instance.farmacia_id
+        if codigo and farmacia_id:
+            repetidos = Producto.objects.filter(farmacia_id=farmacia_id, codigo_barras=codigo).exclude(pk=self.instance.pk)
+            if repetidos.exists():
+                raise forms.ValidationError('Ya tienes un producto con este código de barras.')
+        return codigo
+
     def clean_precio_base(self):
         precio = self.cleaned_data.get('precio_base')
         if precio is not None and precio <= 0:
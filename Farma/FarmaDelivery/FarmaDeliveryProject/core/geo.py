@@ -0,0 +1,120 @@
+"""
+Índice espacial por grilla fija para las direcciones.
+
+Cada Dirección con coordenadas guarda la celda de la grilla en la que cae
+(`celda_geo`). Una búsqueda por radio calcula qué celdas toca el círculo y
+filtra por ellas en la base de datos, de modo que solo se calcula la distancia
+exacta para los candidatos de esas celdas.
+
+Las zonas de reparto son polígonos [[latitud, longitud], ...]; la misma grilla
+sirve para indexarlos (ver core/zonas.py).
+"""
+from math import asin, cos, degrees, floor, pi, radians, sin
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .distancias import RADIO_TIERRA_KM
+
+# Tamaño de la celda en grados (~2,2 km de latitud)
+TAMANO_CELDA_GRADOS = 0.02
+
+# Kilómetros por grado de latitud, con el mismo radio que usa Haversine
+KM_POR_GRADO = RADIO_TIERRA_KM * pi / 180
+
+
+def radio_reparto_km():
+    """Alcance de farmacias y repartidores sin zona dibujada (RADIO_REPARTO_POR_DEFECTO_KM)"""
+    return getattr(settings, 'RADIO_REPARTO_POR_DEFECTO_KM', 2)
+
+
+def indices_celda(latitud, longitud):
+    """Retorna (fila, columna) de la celda que contiene las coordenadas"""
+    return floor(float(latitud) / TAMANO_CELDA_GRADOS), floor(float(longitud) / TAMANO_CELDA_GRADOS)
+
+
+def celda_para(latitud, longitud):
+    """Retorna la clave de celda ('fila:columna') para unas coordenadas"""
+    if latitud is None or longitud is None:
+        return ''
+    fila, columna = indices_celda(latitud, longitud)
+    return f"{fila}:{columna}"
+
+
+def caja_en_radio(latitud, longitud, radio_km):
+    """Retorna (lat_min, lat_max, lon_min, lon_max) que contiene el círculo"""
+    latitud = float(latitud)
+    longitud = float(longitud)
+    angulo = radio_km / RADIO_TIERRA_KM
+    delta_lat = degrees(angulo)
+    # Medio ancho exacto en longitud del círculo (no radio / km por grado, que
+    # queda corto); si el círculo llega al polo abarca todas las longitudes
+    seno = sin(angulo) / max(cos(radians(latitud)), 1e-12)
+    delta_lon = degrees(asin(seno)) if seno < 1 else 180.0
+    return (latitud - delta_lat, latitud + delta_lat,
+            longitud - delta_lon, longitud + delta_lon)
+
+
+def celdas_en_radio(latitud, longitud, radio_km):
+    """Retorna las claves de todas las celdas que toca el círculo"""
+    return celdas_en_caja(*caja_en_radio(latitud, longitud, radio_km))
+
+
+def celdas_en_caja(lat_min, lat_max, lon_min, lon_max):
+    """Retorna las claves de todas las celdas que toca la caja"""
+    filas = range(floor(lat_min / TAMANO_CELDA_GRADOS), floor(lat_max / TAMANO_CELDA_GRADOS) + 1)
+    columnas = range(floor(lon_min / TAMANO_CELDA_GRADOS), floor(lon_max / TAMANO_CELDA_GRADOS) + 1)
+    return [f"{fila}:{columna}" for fila in filas for columna in columnas]
+
+
+def celdas_en_anillo(fila, columna, anillo):
+    """Retorna las claves de las celdas a exactamente `anillo` celdas de distancia (anillo 0 = la celda)"""
+    if anillo == 0:
+        return [f"{fila}:{columna}"]
+    celdas = []
+    for f in range(fila - anillo, fila + anillo + 1):
+        for c in range(columna - anillo, columna + anillo + 1):
+            if max(abs(f - fila), abs(c - columna)) == anillo:
+                celdas.append(f"{f}:{c}")
+    return celdas
+
+
+def km_minimos_por_celda(latitud):
+    """Lado más corto de una celda en km (el de longitud se achica con la latitud)"""
+    return TAMANO_CELDA_GRADOS * KM_POR_GRADO * min(1.0, cos(radians(float(latitud))))
+
+
+def validar_poligono(valor):
+    """Valida que el valor sea una lista de al menos 3 vértices [latitud, longitud]"""
+    if valor in (None, ''):
+        return
+    if not isinstance(valor, list) or len(valor) < 3:
+        raise ValidationError('La zona debe ser una lista de al menos 3 puntos [latitud, longitud].')
+    for vertice in valor:
+        if (not isinstance(vertice, (list, tuple)) or len(vertice) != 2
+                or not all(isinstance(c, (int, float)) and not isinstance(c, bool) for c in vertice)):
+            raise ValidationError('Cada punto de la zona debe ser [latitud, longitud].')
+        if not (-90 <= vertice[0] <= 90 and -180 <= vertice[1] <= 180):
+            raise ValidationError('Hay puntos de la zona fuera de rango.')
+
+
+def caja_de_poligono(poligono):
+    """Retorna (lat_min, lat_max, lon_min, lon_max) del polígono"""
+    latitudes = [v[0] for v in poligono]
+    longitudes = [v[1] for v in poligono]
+    return min(latitudes), max(latitudes), min(longitudes), max(longitudes)
+
+
+def punto_en_poligono(latitud, longitud, poligono):
+    """True si el punto cae dentro del polígono (ray casting; los bordes pueden caer de cualquier lado)"""
+    latitud = float(latitud)
+    longitud = float(longitud)
+    dentro = False
+    lat_j, lon_j = poligono[-1]
+    for lat_i, lon_i in poligono:
+        if (lat_i > latitud) != (lat_j > latitud):
+            cruce = lon_i + (latitud - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if longitud < cruce:
+                dentro = not dentro
+        lat_j, lon_j = lat_i, lon_i
+    return dentro
@@ -0,0 +1,204 @@
+"""
+Servicio de geocodificación compartido.
+
+Todas las búsquedas de coordenadas pasan por acá: primero se intenta el
+geocodificador local de La Plata, después la caché (GeocodeCache) y solo si no
+hay un resultado vigente se llama a Nominatim.
+Se guardan tanto las direcciones encontradas como las no encontradas, cada una
+con su tiempo de vida, para no repetir llamadas que ya sabemos que fallan.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import geocodificador_la_plata
+from .models import GeocodeCache, GeocodificacionPendiente
+
+
+class ErrorGeocodificacion(Exception):
+    """El servicio externo no respondió correctamente (distinto de 'dirección no encontrada')"""
+
+
+def _configuracion():
+    return {
+        'url': getattr(settings, 'GEOCODIFICACION_URL', 'https://nominatim.openstreetmap.org/search'),
+        'user_agent': getattr(settings, 'GEOCODIFICACION_USER_AGENT', 'FarmaDelivery/1.0'),
+        'timeout': getattr(settings, 'GEOCODIFICACION_TIMEOUT', 6),
+        'ttl': getattr(settings, 'GEOCODIFICACION_TTL', timedelta(days=30)),
+        'ttl_negativo': getattr(settings, 'GEOCODIFICACION_TTL_NEGATIVO', timedelta(days=1)),
+        'max_intentos': getattr(settings, 'GEOCODIFICACION_MAX_INTENTOS', 8),
+    }
+
+
+class LimitadorTasa:
+    """Limita la cantidad de llamadas por segundo (compartido entre hilos)"""
+
+    def __init__(self, max_por_segundo):
+        self.pausa = 1 / max_por_segundo if max_por_segundo > 0 else 0
+        self.proximo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def esperar(self):
+        with self.lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self.proximo)
+            self.proximo = turno + self.pausa
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def texto_direccion(calle, numero, ciudad, provincia):
+    """Arma el texto de búsqueda que se envía al geocodificador"""
+    return f"{calle} {numero}, {ciudad}, {provincia}, Argentina"
+
+
+LARGO_CLAVE = GeocodeCache._meta.get_field('direccion_normalizada').max_length
+
+
+def normalizar_direccion(texto):
+    """
+    Clave de caché: minúsculas, sin acentos y con espacios/comas uniformes.
+    Si no entra en LARGO_CLAVE se guarda el principio y un hash del texto
+    completo, para que dos direcciones largas no compartan la entrada.
+    """
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'\s*,\s*', ', ', texto.lower())
+    texto = ' '.join(texto.split())
+    if len(texto) <= LARGO_CLAVE:
+        return texto
+    resumen = hashlib.sha256(texto.encode()).hexdigest()
+    return f"{texto[:LARGO_CLAVE - len(resumen) - 1]}#{resumen}"
+
+
+def _consultar_nominatim(texto, timeout):
+    """Llama a Nominatim; retorna el resultado o None si la dirección no existe"""
+    import requests
+
+    config = _configuracion()
+    params = {'q': texto, 'format': 'json', 'limit': 1, 'countrycodes': 'ar'}
+    headers = {'User-Agent': config['user_agent']}
+    try:
+        respuesta = requests.get(config['url'], params=params, headers=headers,
+                                 timeout=timeout or config['timeout'])
+        if respuesta.status_code != 200:
+            raise ErrorGeocodificacion(f"El servicio respondió {respuesta.status_code}")
+        data = respuesta.json()
+    except (requests.RequestException, ValueError) as e:
+        raise ErrorGeocodificacion(str(e)) from e
+
+    if not data:
+        return None
+    # Una respuesta 200 con otro formato es una falla del servicio, no "no encontrada"
+    try:
+        return {
+            'latitud': float(data[0]['lat']),
+            'longitud': float(data[0]['lon']),
+            'direccion_encontrada': str(data[0].get('display_name') or ''),
+        }
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+        raise ErrorGeocodificacion(f"Respuesta inesperada del servicio: {e!r}") from e
+
+
+def _desde_cache(entrada):
+    if not entrada.encontrada:
+        return None
+    return {
+        'latitud': float(entrada.latitud),
+        'longitud': float(entrada.longitud),
+        'direccion_encontrada': entrada.direccion_encontrada,
+    }
+
+
+def geocodificar(texto, timeout=None, antes_de_consultar=None):
+    """
+    Retorna {'latitud', 'longitud', 'direccion_encontrada'} o None si la dirección
+    no existe. Lanza ErrorGeocodificacion si el servicio externo falla.
+
+    antes_de_consultar (opcional) se llama justo antes de salir a la red, por
+    ejemplo para aplicar un límite de consultas por segundo.
+    """
+    clave = normalizar_direccion(texto)
+    ahora = timezone.now()
+
+    entrada = GeocodeCache.objects.filter(direccion_normalizada=clave, fecha_expiracion__gt=ahora).first()
+    if entrada is not None:
+        return _desde_cache(entrada)
+
+    if antes_de_consultar is not None:
+        antes_de_consultar()
+    resultado = _consultar_nominatim(texto, timeout)
+
+    config = _configuracion()
+    GeocodeCache.objects.update_or_create(
+        direccion_normalizada=clave,
+        defaults={
+            'encontrada': resultado is not None,
+            'latitud': resultado['latitud'] if resultado else None,
+            'longitud': resultado['longitud'] if resultado else None,
+            'direccion_encontrada': resultado['direccion_encontrada'][:500] if resultado else '',
+            'fecha_expiracion': ahora + (config['ttl'] if resultado else config['ttl_negativo']),
+        }
+    )
+    return resultado
+
+
+def geocodificar_partes(calle, numero, ciudad, provincia, timeout=None, antes_de_consultar=None):
+    """Como geocodificar(), pero probando antes el geocodificador local de La Plata"""
+    resultado = geocodificador_la_plata.geocodificar(calle, numero, ciudad)
+    if resultado is not None:
+        return resultado
+    return geocodificar(texto_direccion(calle, numero, ciudad, provincia), timeout=timeout,
+                        antes_de_consultar=antes_de_consultar)
+
+
+def pendientes_a_procesar(limite):
+    """Direcciones encoladas cuyo próximo intento ya venció"""
+    return list(
+        GeocodificacionPendiente.objects.filter(
+            proximo_intento__lte=timezone.now(),
+            intentos__lt=_configuracion()['max_intentos'],
+        ).select_related('direccion')[:limite]
+    )
+
+
+def procesar_pendiente(pendiente, timeout=None, antes_de_consultar=None):
+    """
+    Geocodifica una dirección encolada; retorna True si quedó resuelta.
+    antes_de_consultar: como en geocodificar().
+    """
+    direccion = pendiente.direccion
+    try:
+        resultado = geocodificar_partes(direccion.calle, direccion.numero, direccion.ciudad,
+                                        direccion.provincia, timeout=timeout,
+                                        antes_de_consultar=antes_de_consultar)
+    except ErrorGeocodificacion as e:
+        # Falla del servicio: reintentar con espera exponencial (2, 4, 8... minutos, hasta 1 día)
+        espera = min(timedelta(minutes=2 ** (pendiente.intentos + 1)), timedelta(days=1))
+        _reprogramar(pendiente, espera, str(e))
+        return False
+
+    if resultado is None:
+        # No encontrada: no tiene sentido reintentar antes de que venza la caché negativa
+        _reprogramar(pendiente, _configuracion()['ttl_negativo'], 'Dirección no encontrada')
+        return False
+
+    direccion.latitud = resultado['latitud']
+    direccion.longitud = resultado['longitud']
+    # Al guardar coordenadas nuevas la dirección sale de la cola (ver Direccion.save)
+    direccion.save(update_fields=['latitud', 'longitud'])
+    GeocodificacionPendiente.objects.filter(pk=pendiente.pk).delete()
+    return True
+
+
+def _reprogramar(pendiente, espera, error):
+    pendiente.intentos += 1
+    pendiente.proximo_intento = timezone.now() + espera
+    pendiente.ultimo_error = error[:255]
+    pendiente.save(update_fields=['intentos', 'proximo_intento', 'ultimo_error'])
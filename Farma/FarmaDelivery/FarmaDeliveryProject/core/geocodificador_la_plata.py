@@ -0,0 +1,80 @@
+"""
+Geocodificador local para la grilla numerada de La Plata.
+
+Las calles del casco urbano forman una grilla regular: las calles 1 a 31 son
+perpendiculares a las calles 32 a 72. Una dirección como "calle 1, 47-48"
+(calle 1 entre 47 y 48) se resuelve con el punto medio de las dos esquinas,
+leídas de core/data/la_plata_intersecciones.csv, sin consultar ningún servicio.
+"""
+import csv
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+
+ARCHIVO_INTERSECCIONES = Path(__file__).resolve().parent / 'data' / 'la_plata_intersecciones.csv'
+
+# Familias de calles de la grilla
+CALLES = range(1, 32)
+TRANSVERSALES = range(32, 73)
+
+# "7", "calle 7", "Av. 7", "avenida 51". Las calles "bis" (p. ej. "7 bis") no
+# están en el archivo de intersecciones: no coinciden y se consultan afuera
+_PATRON_CALLE = re.compile(r'^(?:calle|avenida|av)?\.?\s*(\d{1,3})$')
+# "47-48", "47 y 48", "e/ 47 y 48", "entre 47 y 48"
+_PATRON_ENTRE = re.compile(r'^(?:entre|e/)?\s*(\d{1,3})\s*(?:-|y|/)\s*(\d{1,3})$')
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+@lru_cache(maxsize=1)
+def _intersecciones():
+    """Carga el archivo de intersecciones: {(calle, transversal): (latitud, longitud)}"""
+    intersecciones = {}
+    with open(ARCHIVO_INTERSECCIONES, newline='', encoding='utf-8') as archivo:
+        filas = (linea for linea in archivo if not linea.startswith('#'))
+        for fila in csv.DictReader(filas):
+            clave = (int(fila['calle']), int(fila['transversal']))
+            intersecciones[clave] = (float(fila['latitud']), float(fila['longitud']))
+    return intersecciones
+
+
+def _esquina(calle_a, calle_b):
+    """Coordenadas de la esquina entre dos calles (en cualquier orden) o None"""
+    if calle_a in CALLES and calle_b in TRANSVERSALES:
+        return _intersecciones().get((calle_a, calle_b))
+    if calle_b in CALLES and calle_a in TRANSVERSALES:
+        return _intersecciones().get((calle_b, calle_a))
+    return None
+
+
+def geocodificar(calle, numero, ciudad):
+    """
+    Retorna {'latitud', 'longitud', 'direccion_encontrada'} para direcciones de
+    La Plata escritas como calle + "entre calles", o None si no se puede resolver
+    localmente (otra ciudad, numeración, diagonales, fuera del casco).
+    """
+    if _normalizar(ciudad) != 'la plata':
+        return None
+
+    coincidencia_calle = _PATRON_CALLE.match(_normalizar(calle))
+    coincidencia_entre = _PATRON_ENTRE.match(_normalizar(numero))
+    if not (coincidencia_calle and coincidencia_entre):
+        return None
+
+    numero_calle = int(coincidencia_calle.group(1))
+    entre_a, entre_b = int(coincidencia_entre.group(1)), int(coincidencia_entre.group(2))
+    esquina_a = _esquina(numero_calle, entre_a)
+    esquina_b = _esquina(numero_calle, entre_b)
+    if esquina_a is None or esquina_b is None:
+        return None
+
+    return {
+        'latitud': round((esquina_a[0] + esquina_b[0]) / 2, 7),
+        'longitud': round((esquina_a[1] + esquina_b[1]) / 2, 7),
+        'direccion_encontrada': f"Calle {numero_calle} e/ {entre_a} y {entre_b}, La Plata",
+    }
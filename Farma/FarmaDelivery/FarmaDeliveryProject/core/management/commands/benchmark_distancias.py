@@ -0,0 +1,57 @@
+"""
+Compara el cálculo de distancias escalar (uno por uno, como
+Direccion.calcular_distancia) con el cálculo en lote de core.distancias.
+
+Uso: python manage.py benchmark_distancias [--puntos 10000 100000]
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import distancias
+from core.distancias import distancias_km, haversine_km
+
+# Centro de La Plata
+LAT_CENTRO = -34.9214
+LON_CENTRO = -57.9544
+
+
+class Command(BaseCommand):
+    help = 'Compara el cálculo de distancias escalar contra el cálculo en lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puntos', type=int, nargs='+', default=[10000, 100000],
+                            help='Cantidades de puntos a medir')
+        parser.add_argument('--repeticiones', type=int, default=3,
+                            help='Repeticiones por medición (se toma la mejor)')
+
+    def handle(self, *args, **options):
+        if distancias.np is None:
+            self.stdout.write(self.style.WARNING('NumPy no está instalado: el cálculo en lote usa Python puro'))
+
+        random.seed(0)
+        for n in options['puntos']:
+            latitudes = [LAT_CENTRO + random.uniform(-0.2, 0.2) for _ in range(n)]
+            longitudes = [LON_CENTRO + random.uniform(-0.2, 0.2) for _ in range(n)]
+
+            escalar = self._medir(options['repeticiones'], lambda: [
+                haversine_km(LAT_CENTRO, LON_CENTRO, lat, lon) for lat, lon in zip(latitudes, longitudes)
+            ])
+            lote = self._medir(options['repeticiones'], lambda: distancias_km(
+                LAT_CENTRO, LON_CENTRO, latitudes, longitudes
+            ))
+
+            self.stdout.write(
+                f"{n:>8} puntos | escalar: {escalar * 1000:8.2f} ms | "
+                f"lote: {lote * 1000:8.2f} ms | x{escalar / lote:.1f}"
+            )
+
+    def _medir(self, repeticiones, funcion):
+        mejor = None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            duracion = time.perf_counter() - inicio
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return mejor
@@ -0,0 +1,45 @@
+"""
+Worker del despacho centralizado: cada pocos segundos ofrece los pedidos
+listos a los repartidores libres (ver core/despacho.py).
+
+Solo tiene efecto con DESPACHO_CENTRALIZADO = True en settings.
+
+Uso: python manage.py despachar_pedidos [--una-vez] [--intervalo 15]
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.despacho import despacho_activo, ronda_de_despacho
+
+
+class Command(BaseCommand):
+    help = 'Asigna en lote los pedidos listos a los repartidores disponibles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Hace una sola ronda y termina en lugar de quedar escuchando')
+        parser.add_argument('--intervalo', type=float,
+                            default=getattr(settings, 'DESPACHO_INTERVALO', 15),
+                            help='Segundos entre rondas de despacho')
+
+    def handle(self, *args, **options):
+        if not despacho_activo():
+            self.stdout.write(self.style.WARNING(
+                "⚠️  DESPACHO_CENTRALIZADO está desactivado: los repartidores toman los pedidos por su cuenta"
+            ))
+            return
+
+        while True:
+            inicio = time.monotonic()
+            ofertas = ronda_de_despacho()
+            if ofertas:
+                distancia_total = sum(oferta.distancia_km for oferta in ofertas)
+                self.stdout.write(self.style.SUCCESS(
+                    f"🛵 {len(ofertas)} pedidos ofrecidos ({distancia_total:.1f} km hasta las farmacias) "
+                    f"en {(time.monotonic() - inicio) * 1000:.0f} ms"
+                ))
+            if options['una_vez']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,148 @@
+"""
+Completa en bloque las coordenadas de todas las direcciones que no las tienen.
+
+Recorre las direcciones por id en lotes, las resuelve en paralelo con un pool
+de hilos (respetando un límite global de consultas por segundo al servicio
+externo) y guarda cada lote con bulk_update. El último id procesado se guarda
+en un archivo de control para poder retomar desde ahí si se corta; al
+terminar completo se borra.
+
+Uso: python manage.py geocode_direcciones [--hilos 4] [--lote 200] [--reiniciar]
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from core.geo import celda_para
+from core.geocodificacion import ErrorGeocodificacion, LimitadorTasa, geocodificar_partes
+from core.models import Direccion, GeocodificacionPendiente
+
+# Marca de una dirección que falló por un error del servicio (no por no existir)
+ERROR_SERVICIO = object()
+
+# Solo mientras corre el comando (varios hilos escriben a la vez): en SQLite
+# tomar el lock al iniciar la transacción y esperar en vez de fallar
+OPCIONES_SQLITE = {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+
+
+class Command(BaseCommand):
+    help = 'Completa en bloque las coordenadas de las direcciones que no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=200,
+                            help='Direcciones leídas y guardadas por lote')
+        parser.add_argument('--hilos', type=int, default=4,
+                            help='Consultas de geocodificación en paralelo')
+        parser.add_argument('--max-por-segundo', type=float,
+                            default=getattr(settings, 'GEOCODIFICACION_MAX_POR_SEGUNDO', 1),
+                            help='Máximo global de consultas por segundo al servicio externo')
+        parser.add_argument('--archivo-control', default=str(settings.BASE_DIR / 'geocode_direcciones.checkpoint'),
+                            help='Archivo donde se guarda el último id procesado')
+        parser.add_argument('--reiniciar', action='store_true',
+                            help='Ignora el archivo de control y empieza desde el principio')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            return self._geocodificar(options)
+        # Las conexiones de los hilos se crean con este mismo diccionario de configuración
+        configuracion = connection.settings_dict
+        opciones_originales = configuracion.get('OPTIONS', {})
+        connection.close()
+        configuracion['OPTIONS'] = {**opciones_originales, **OPCIONES_SQLITE}
+        try:
+            self._geocodificar(options)
+        finally:
+            connection.close()
+            configuracion['OPTIONS'] = opciones_originales
+
+    def _geocodificar(self, options):
+        archivo_control = Path(options['archivo_control'])
+        ultimo_id = 0
+        if archivo_control.exists() and not options['reiniciar']:
+            ultimo_id = int(archivo_control.read_text().strip() or 0)
+            self.stdout.write(f"↪️  Retomando desde la dirección #{ultimo_id}")
+
+        limitador = LimitadorTasa(options['max_por_segundo'])
+        sin_coordenadas = Direccion.objects.filter(Q(latitud=None) | Q(longitud=None)).only(
+            'id', 'calle', 'numero', 'ciudad', 'provincia'
+        ).order_by('id')
+
+        procesadas = resueltas = errores = 0
+        inicio = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            while True:
+                lote = list(sin_coordenadas.filter(id__gt=ultimo_id)[:options['lote']])
+                if not lote:
+                    break
+
+                resultados = list(pool.map(lambda d: self._resolver(d, limitador), lote))
+
+                actualizadas = []
+                fallidas = []
+                for direccion, resultado in zip(lote, resultados):
+                    if resultado is None:
+                        continue
+                    if resultado is ERROR_SERVICIO:
+                        fallidas.append(direccion)
+                        continue
+                    direccion.latitud = resultado['latitud']
+                    direccion.longitud = resultado['longitud']
+                    direccion.celda_geo = celda_para(direccion.latitud, direccion.longitud)
+                    actualizadas.append(direccion)
+
+                # bulk_update no pasa por Direccion.save: la celda y la cola se actualizan acá
+                Direccion.objects.bulk_update(actualizadas, ['latitud', 'longitud', 'celda_geo'])
+                GeocodificacionPendiente.objects.filter(direccion__in=[d.id for d in actualizadas]).delete()
+                # Las que fallaron por el servicio quedan para el worker geocodificar_pendientes
+                GeocodificacionPendiente.objects.bulk_create(
+                    [GeocodificacionPendiente(direccion=d) for d in fallidas], ignore_conflicts=True
+                )
+
+                procesadas += len(lote)
+                errores += len(fallidas)
+                resueltas += len(actualizadas)
+                ultimo_id = lote[-1].id
+                archivo_control.write_text(str(ultimo_id))
+
+                duracion = time.monotonic() - inicio
+                self.stdout.write(
+                    f"📍 {procesadas} procesadas, {resueltas} resueltas, {errores} con error "
+                    f"({procesadas / duracion:.1f} dir/s)"
+                )
+
+        # Terminó completo: la próxima corrida empieza desde el principio
+        archivo_control.unlink(missing_ok=True)
+
+        duracion = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Listo: {resueltas}/{procesadas} direcciones resueltas en {duracion:.1f} s "
+            f"({procesadas / duracion if duracion else 0:.1f} dir/s)"
+        ))
+        if errores:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  {errores} direcciones fallaron por errores del servicio; "
+                "quedan en la cola de geocodificar_pendientes"
+            ))
+
+    def _resolver(self, direccion, limitador):
+        """Geocodifica una dirección en un hilo del pool; retorna el resultado, None o ERROR_SERVICIO"""
+        try:
+            return geocodificar_partes(
+                direccion.calle, direccion.numero, direccion.ciudad, direccion.provincia,
+                antes_de_consultar=limitador.esperar,
+            )
+        except ErrorGeocodificacion:
+            return ERROR_SERVICIO
+        except Exception as e:
+            # Un error inesperado en una dirección no corta todo el proceso: queda en la cola
+            self.stderr.write(f"❌ Dirección #{direccion.id}: {e!r}")
+            return ERROR_SERVICIO
+        finally:
+            # Cada hilo abre su propia conexión a la base; se cierra al terminar
+            connection.close()
@@ -0,0 +1,46 @@
+"""
+Worker que completa las coordenadas de las direcciones encoladas en
+GeocodificacionPendiente, fuera del ciclo de request/response.
+
+Uso: python manage.py geocodificar_pendientes [--una-vez] [--intervalo 30]
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.geocodificacion import LimitadorTasa, pendientes_a_procesar, procesar_pendiente
+
+
+class Command(BaseCommand):
+    help = 'Geocodifica en segundo plano las direcciones sin coordenadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Procesa lo pendiente y termina en lugar de quedar escuchando')
+        parser.add_argument('--intervalo', type=float, default=30,
+                            help='Segundos de espera cuando no hay direcciones pendientes')
+        parser.add_argument('--lote', type=int, default=50,
+                            help='Direcciones a leer de la cola por vuelta')
+        parser.add_argument('--max-por-segundo', type=float,
+                            default=getattr(settings, 'GEOCODIFICACION_MAX_POR_SEGUNDO', 1),
+                            help='Máximo de consultas por segundo al geocodificador')
+
+    def handle(self, *args, **options):
+        # Solo esperan las consultas que salen al servicio externo; las que se
+        # resuelven con la grilla de La Plata o la caché no
+        limitador = LimitadorTasa(options['max_por_segundo'])
+
+        while True:
+            pendientes = pendientes_a_procesar(options['lote'])
+            if not pendientes:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            for pendiente in pendientes:
+                if procesar_pendiente(pendiente, antes_de_consultar=limitador.esperar):
+                    self.stdout.write(self.style.SUCCESS(f"✅ {pendiente.direccion}"))
+                else:
+                    self.stdout.write(self.style.WARNING(f"⚠️  {pendiente.direccion}: {pendiente.ultimo_error}"))
@@ -0,0 +1,22 @@
+"""
+Rehace la tabla de precios por obra social (PrecioObraSocial) a partir de los
+descuentos activos. Las señales la mantienen al día; hace falta después de
+cambiar precios o descuentos con QuerySet.update() o directo en la base.
+
+Uso: python manage.py recalcular_precios [--producto ID ...]
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import PrecioObraSocial
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los precios finales por obra social'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--producto', type=int, action='append', dest='productos',
+                            help='Recalcula solo este producto (se puede repetir)')
+
+    def handle(self, *args, **options):
+        cantidad = PrecioObraSocial.recalcular(options['productos'])
+        self.stdout.write(self.style.SUCCESS(f'{cantidad} precios por obra social recalculados'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+from core.geo import celda_para
+
+
+def calcular_celdas(apps, schema_editor):
+    Direccion = apps.get_model('core', 'Direccion')
+    direcciones = list(Direccion.objects.exclude(latitud=None).exclude(longitud=None))
+    for direccion in direcciones:
+        direccion.celda_geo = celda_para(direccion.latitud, direccion.longitud)
+    Direccion.objects.bulk_update(direcciones, ['celda_geo'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_merge_20251030_2032'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='direccion',
+            name='celda_geo',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.RunPython(calcular_celdas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_direccion_celda_geo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='direccion',
+            index=models.Index(fields=['latitud', 'longitud'], name='direccion_coords_idx'),
+        ),
+    ]
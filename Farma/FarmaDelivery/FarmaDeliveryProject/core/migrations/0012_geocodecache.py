@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_direccion_coords_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('direccion_normalizada', models.CharField(max_length=255, unique=True)),
+                ('encontrada', models.BooleanField(default=False)),
+                ('latitud', models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True)),
+                ('longitud', models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True)),
+                ('direccion_encontrada', models.CharField(blank=True, max_length=500)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('fecha_expiracion', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Caché de Geocodificación',
+                'verbose_name_plural': 'Caché de Geocodificación',
+            },
+        ),
+    ]
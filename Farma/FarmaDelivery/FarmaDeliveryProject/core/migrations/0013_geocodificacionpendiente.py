@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def encolar_direcciones_sin_coordenadas(apps, schema_editor):
+    Direccion = apps.get_model('core', 'Direccion')
+    GeocodificacionPendiente = apps.get_model('core', 'GeocodificacionPendiente')
+    sin_coordenadas = Direccion.objects.filter(Q(latitud=None) | Q(longitud=None)).values_list('id', flat=True)
+    GeocodificacionPendiente.objects.bulk_create(
+        [GeocodificacionPendiente(direccion_id=direccion_id) for direccion_id in sin_coordenadas],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_geocodecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodificacionPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('ultimo_error', models.CharField(blank=True, max_length=255)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('direccion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='geocodificacion_pendiente', to='core.direccion')),
+            ],
+            options={
+                'verbose_name': 'Geocodificación Pendiente',
+                'verbose_name_plural': 'Geocodificaciones Pendientes',
+                'ordering': ['proximo_intento'],
+            },
+        ),
+        migrations.RunPython(encolar_direcciones_sin_coordenadas, migrations.RunPython.noop),
+    ]
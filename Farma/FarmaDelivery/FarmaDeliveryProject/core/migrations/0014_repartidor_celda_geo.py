@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:47
+
+from django.db import migrations, models
+
+from core.geo import celda_para
+
+
+def calcular_celdas(apps, schema_editor):
+    Repartidor = apps.get_model('core', 'Repartidor')
+    repartidores = list(Repartidor.objects.all())
+    for repartidor in repartidores:
+        if repartidor.ubicacion_fija and repartidor.latitud_fija and repartidor.longitud_fija:
+            repartidor.celda_geo = celda_para(repartidor.latitud_fija, repartidor.longitud_fija)
+        elif repartidor.latitud_actual and repartidor.longitud_actual:
+            repartidor.celda_geo = celda_para(repartidor.latitud_actual, repartidor.longitud_actual)
+    Repartidor.objects.bulk_update(repartidores, ['celda_geo'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_geocodificacionpendiente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repartidor',
+            name='celda_geo',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.RunPython(calcular_celdas, migrations.RunPython.noop),
+    ]
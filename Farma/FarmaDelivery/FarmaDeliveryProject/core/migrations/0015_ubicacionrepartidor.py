@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_repartidor_celda_geo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UbicacionRepartidor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitud', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('longitud', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('fecha', models.DateTimeField()),
+                ('repartidor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_ubicaciones', to='core.repartidor')),
+            ],
+            options={
+                'verbose_name': 'Ubicación de Repartidor',
+                'verbose_name_plural': 'Historial de Ubicaciones',
+                'ordering': ['repartidor', 'fecha'],
+                'indexes': [models.Index(fields=['repartidor', 'fecha'], name='ubicacion_repartidor_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_ubicacionrepartidor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfertaPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distancia_km', models.FloatField(help_text='Distancia del repartidor a la farmacia al momento de ofrecerlo')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_expiracion', models.DateTimeField(db_index=True)),
+                ('pedido', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='oferta', to='core.pedido')),
+                ('repartidor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ofertas', to='core.repartidor')),
+            ],
+            options={
+                'verbose_name': 'Oferta de Pedido',
+                'verbose_name_plural': 'Ofertas de Pedidos',
+                'ordering': ['fecha_expiracion'],
+            },
+        ),
+    ]
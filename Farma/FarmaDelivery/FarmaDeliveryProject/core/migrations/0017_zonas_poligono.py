@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:58
+
+import core.geo
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_ofertapedido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farmacia',
+            name='zona_entrega',
+            field=models.JSONField(blank=True, help_text='Polígono [[latitud, longitud], ...] donde la farmacia hace entregas', null=True, validators=[core.geo.validar_poligono]),
+        ),
+        migrations.AddField(
+            model_name='repartidor',
+            name='zona_poligono',
+            field=models.JSONField(blank=True, help_text='Polígono [[latitud, longitud], ...] de la zona de cobertura; vacío = radio alrededor del repartidor', null=True, validators=[core.geo.validar_poligono]),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Índice de búsqueda de texto completo (SQLite FTS5) sobre Producto
+
+from django.db import migrations
+
+CREAR_FTS = [
+    # Tabla de contenido externo: el texto vive en core_producto, el índice en core_producto_fts
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_producto_fts USING fts5(
+        nombre, descripcion, laboratorio, categoria,
+        content='core_producto', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # Los triggers mantienen el índice sincronizado también con update()/bulk_create()
+    """
+    CREATE TRIGGER IF NOT EXISTS core_producto_fts_insertar AFTER INSERT ON core_producto BEGIN
+        INSERT INTO core_producto_fts(rowid, nombre, descripcion, laboratorio, categoria)
+        VALUES (new.id, new.nombre, new.descripcion, new.laboratorio, new.categoria);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_producto_fts_borrar AFTER DELETE ON core_producto BEGIN
+        INSERT INTO core_producto_fts(core_producto_fts, rowid, nombre, descripcion, laboratorio, categoria)
+        VALUES ('delete', old.id, old.nombre, old.descripcion, old.laboratorio, old.categoria);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_producto_fts_actualizar
+    AFTER UPDATE OF nombre, descripcion, laboratorio, categoria ON core_producto BEGIN
+        INSERT INTO core_producto_fts(core_producto_fts, rowid, nombre, descripcion, laboratorio, categoria)
+        VALUES ('delete', old.id, old.nombre, old.descripcion, old.laboratorio, old.categoria);
+        INSERT INTO core_producto_fts(rowid, nombre, descripcion, laboratorio, categoria)
+        VALUES (new.id, new.nombre, new.descripcion, new.laboratorio, new.categoria);
+    END
+    """,
+    "INSERT INTO core_producto_fts(core_producto_fts) VALUES ('rebuild')",
+]
+
+BORRAR_FTS = [
+    "DROP TRIGGER IF EXISTS core_producto_fts_insertar",
+    "DROP TRIGGER IF EXISTS core_producto_fts_borrar",
+    "DROP TRIGGER IF EXISTS core_producto_fts_actualizar",
+    "DROP TABLE IF EXISTS core_producto_fts",
+]
+
+
+def crear_fts(apps, schema_editor):
+    # Solo SQLite con FTS5; en otras bases la búsqueda usa icontains (ver core/busqueda.py)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+        for sql in CREAR_FTS:
+            cursor.execute(sql)
+
+
+def borrar_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in BORRAR_FTS:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_zonas_poligono'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_fts, borrar_fts),
+    ]
@@ -0,0 +1,138 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# En SQLite alterar core_producto rehace la tabla y se pierden los triggers del
+# índice de texto completo (0018_producto_fts): se vuelven a crear al final.
+# Copia del SQL de 0018 para que esta migración no dependa de su código
+CREAR_FTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_producto_fts USING fts5(
+        nombre, descripcion, laboratorio, categoria,
+        content='core_producto', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_producto_fts_insertar AFTER INSERT ON core_producto BEGIN
+        INSERT INTO core_producto_fts(rowid, nombre, descripcion, laboratorio, categoria)
+        VALUES (new.id, new.nombre, new.descripcion, new.laboratorio, new.categoria);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_producto_fts_borrar AFTER DELETE ON core_producto BEGIN
+        INSERT INTO core_producto_fts(core_producto_fts, rowid, nombre, descripcion, laboratorio, categoria)
+        VALUES ('delete', old.id, old.nombre, old.descripcion, old.laboratorio, old.categoria);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_producto_fts_actualizar
+    AFTER UPDATE OF nombre, descripcion, laboratorio, categoria ON core_producto BEGIN
+        INSERT INTO core_producto_fts(core_producto_fts, rowid, nombre, descripcion, laboratorio, categoria)
+        VALUES ('delete', old.id, old.nombre, old.descripcion, old.laboratorio, old.categoria);
+        INSERT INTO core_producto_fts(rowid, nombre, descripcion, laboratorio, categoria)
+        VALUES (new.id, new.nombre, new.descripcion, new.laboratorio, new.categoria);
+    END
+    """,
+    "INSERT INTO core_producto_fts(core_producto_fts) VALUES ('rebuild')",
+]
+
+
+def recrear_fts(apps, schema_editor):
+    # Mismas condiciones que 0018: solo SQLite con FTS5
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+        for sql in CREAR_FTS:
+            cursor.execute(sql)
+
+
+def armar_catalogo(apps, schema_editor):
+    """
+    Crea una entrada del catálogo por cada código de barras existente (con los
+    datos del primer producto que lo tiene) y vincula los productos con ese
+    código. No modifica los datos de los productos: productos con el mismo
+    nombre y distinto código quedan en entradas distintas, y los que no tienen
+    código quedan sin catálogo (igual que en Producto.save).
+    """
+    Producto = apps.get_model('core', 'Producto')
+    ProductoCatalogo = apps.get_model('core', 'ProductoCatalogo')
+
+    por_codigo = {}
+    for producto in Producto.objects.exclude(codigo_barras='').order_by('id'):
+        por_codigo.setdefault(producto.codigo_barras, []).append(producto)
+
+    for codigo, productos in por_codigo.items():
+        base = productos[0]
+        catalogo = ProductoCatalogo.objects.create(
+            codigo_barras=codigo,
+            nombre=base.nombre,
+            descripcion=base.descripcion,
+            categoria=base.categoria,
+            laboratorio=base.laboratorio,
+            requiere_receta=base.requiere_receta,
+        )
+        Producto.objects.filter(id__in=[producto.id for producto in productos]).update(catalogo=catalogo)
+
+
+def desarmar_catalogo(apps, schema_editor):
+    """
+    Desvincula los productos y borra el catálogo (los códigos de barras no se
+    tocaron). Para revertir, los códigos tienen que volver a ser únicos en toda
+    la tabla, incluido el vacío, como exigía el esquema anterior.
+    """
+    apps.get_model('core', 'Producto').objects.update(catalogo=None)
+    apps.get_model('core', 'ProductoCatalogo').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_producto_fts'),
+    ]
+
+    operations = [
+        # Al revertir, los triggers se vuelven a crear después de rehacer la tabla
+        migrations.RunPython(migrations.RunPython.noop, recrear_fts),
+        migrations.CreateModel(
+            name='ProductoCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo_barras', models.CharField(max_length=50, unique=True)),
+                ('nombre', models.CharField(max_length=200)),
+                ('descripcion', models.TextField(blank=True)),
+                ('categoria', models.CharField(blank=True, max_length=100)),
+                ('laboratorio', models.CharField(blank=True, max_length=100)),
+                ('requiere_receta', models.BooleanField(default=False)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Producto del catálogo',
+                'verbose_name_plural': 'Catálogo de productos',
+            },
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='codigo_barras',
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='catalogo',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ofertas', to='core.productocatalogo'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['catalogo', 'precio_base'], name='producto_catalogo_precio_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='producto',
+            constraint=models.UniqueConstraint(condition=models.Q(('codigo_barras', ''), _negated=True), fields=('farmacia', 'codigo_barras'), name='producto_codigo_por_farmacia'),
+        ),
+        migrations.RunPython(armar_catalogo, desarmar_catalogo),
+        migrations.RunPython(recrear_fts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:13
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def calcular_precios(apps, schema_editor):
+    """Una fila por cada descuento activo, con el mismo cálculo que descuento_obra_social"""
+    DescuentoObraSocial = apps.get_model('core', 'DescuentoObraSocial')
+    PrecioObraSocial = apps.get_model('core', 'PrecioObraSocial')
+
+    precios = []
+    for producto_id, obra_social_id, porcentaje, fijo, precio_base in DescuentoObraSocial.objects.filter(
+        activo=True,
+    ).values_list('producto_id', 'obra_social_id', 'descuento_porcentaje', 'descuento_fijo', 'producto__precio_base'):
+        if porcentaje > 0:
+            descuento = (precio_base * porcentaje / 100).quantize(Decimal('0.01'))
+        elif fijo > 0:
+            descuento = fijo
+        else:
+            descuento = Decimal('0')
+        precios.append(PrecioObraSocial(
+            producto_id=producto_id, obra_social_id=obra_social_id,
+            descuento_aplicado=descuento, precio_final=precio_base - descuento,
+        ))
+    PrecioObraSocial.objects.bulk_create(precios, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_catalogo_productos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecioObraSocial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descuento_aplicado', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('precio_final', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('obra_social', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precios_productos', to='core.obrasocial')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precios_obra_social', to='core.producto')),
+            ],
+            options={
+                'verbose_name': 'Precio por Obra Social',
+                'verbose_name_plural': 'Precios por Obra Social',
+                'unique_together': {('producto', 'obra_social')},
+            },
+        ),
+        migrations.RunPython(calcular_precios, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_precios_obra_social'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='fecha_asignacion',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
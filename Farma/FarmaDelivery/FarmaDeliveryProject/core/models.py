@@ -1,7 +1,29 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import DecimalField, FilteredRelation, Q, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MinLengthValidator, RegexValidator
 
+from .geo import (
+    celda_para, celdas_en_radio, caja_en_radio, celdas_en_anillo, indices_celda, km_minimos_por_celda,
+    caja_de_poligono, punto_en_poligono, radio_reparto_km, validar_poligono,
+)
+from .distancias import haversine_km, distancias_km
+
+# Máxima cantidad de celdas a consultar por IN antes de usar la caja de coordenadas
+MAX_CELDAS_CONSULTA = 400
+
+# Un repartidor está disponible si actualizó su ubicación en este lapso
+MINUTOS_DISPONIBILIDAD = 10
+
+# Campos de Repartidor que definen su ubicación (y por lo tanto su celda)
+CAMPOS_UBICACION_REPARTIDOR = {
+    'latitud_actual', 'longitud_actual', 'ubicacion_fija', 'latitud_fija', 'longitud_fija',
+}
+
 # Enumerativo de roles
 class Rol(models.TextChoices):
     CLIENTE = 'CLIENTE', 'Cliente'
@@ -20,34 +42,66 @@ class Direccion(models.Model):
     # Coordenadas geográficas
     latitud = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
     longitud = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    # Celda de la grilla espacial (ver core/geo.py), se recalcula al guardar
+    celda_geo = models.CharField(max_length=32, blank=True, db_index=True, editable=False)
     
     class Meta:
         verbose_name = 'Dirección'
         verbose_name_plural = 'Direcciones'
+        indexes = [
+            models.Index(fields=['latitud', 'longitud'], name='direccion_coords_idx'),
+        ]
     
     def __str__(self):
         return f"{self.calle} {self.numero}, {self.ciudad}, {self.provincia}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._estado_original = instancia._estado_geo()
+        return instancia
+    
+    def _estado_geo(self):
+        """Campos que determinan la geocodificación (sin disparar consultas por campos diferidos)"""
+        return tuple(self.__dict__.get(campo) for campo in ('calle', 'numero', 'ciudad', 'provincia', 'latitud', 'longitud'))
+    
+    def save(self, *args, **kwargs):
+        """Mantiene actualizada la celda de la grilla espacial y la cola de geocodificación"""
+        if self.latitud and self.longitud:
+            self.celda_geo = celda_para(self.latitud, self.longitud)
+        else:
+            self.celda_geo = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ('latitud' in update_fields or 'longitud' in update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'celda_geo'}
+        creando = self._state.adding
+        super().save(*args, **kwargs)
+        
+        # La cola solo se toca si cambió algún campo de la geocodificación
+        original = getattr(self, '_estado_original', None)
+        actual = self._estado_geo()
+        self._estado_original = actual
+        tiene_coordenadas = bool(self.latitud and self.longitud)
+        if creando:
+            # Sin coordenadas: las completa el worker (manage.py geocodificar_pendientes)
+            if not tiene_coordenadas:
+                GeocodificacionPendiente.objects.create(direccion=self)
+            return
+        if original == actual:
+            return
+        cambio_texto = original is None or original[:4] != actual[:4]
+        cambio_coordenadas = original is None or original[4:] != actual[4:]
+        if not tiene_coordenadas or (cambio_texto and not cambio_coordenadas):
+            # Sin coordenadas, o cambió la dirección pero no las coordenadas (quedaron viejas)
+            GeocodificacionPendiente.objects.get_or_create(direccion=self)
+        else:
+            GeocodificacionPendiente.objects.filter(direccion=self).delete()
+    
     def calcular_distancia(self, otra_direccion):
         """Calcula la distancia en kilómetros entre dos direcciones usando la fórmula de Haversine"""
         if not (self.latitud and self.longitud and otra_direccion.latitud and otra_direccion.longitud):
             return None
-        
-        from math import radians, cos, sin, asin, sqrt
-        
-        # Convertir grados a radianes
-        lat1, lon1 = radians(float(self.latitud)), radians(float(self.longitud))
-        lat2, lon2 = radians(float(otra_direccion.latitud)), radians(float(otra_direccion.longitud))
-        
-        # Fórmula de Haversine
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        
-        # Radio de la Tierra en kilómetros
-        r = 6371
-        return c * r
+        return haversine_km(self.latitud, self.longitud, otra_direccion.latitud, otra_direccion.longitud)
 
 # Modelo ObraSocial
 class ObraSocial(models.Model):
@@ -108,6 +162,11 @@ class Farmacia(models.Model):
     horario_cierre = models.TimeField()
     activa = models.BooleanField(default=True)
     rol = models.CharField(max_length=20, choices=Rol.choices, default=Rol.FARMACIA)
+    # Zona de reparto; si no tiene, se usa un radio alrededor de la farmacia (ver core/zonas.py)
+    zona_entrega = models.JSONField(
+        null=True, blank=True, validators=[validar_poligono],
+        help_text='Polígono [[latitud, longitud], ...] donde la farmacia hace entregas'
+    )
     
     class Meta:
         verbose_name = 'Farmacia'
@@ -117,18 +176,49 @@ class Farmacia(models.Model):
         return f"{self.nombre} - {self.matricula}"
     
     @classmethod
-    def farmacias_cercanas(cls, direccion_cliente, radio_km=2):
-        """Retorna farmacias activas dentro del radio especificado"""
-        farmacias_cercanas = []
+    def farmacias_cercanas(cls, direccion_cliente, radio_km=None):
+        """
+        Retorna farmacias activas que llegan a la dirección: las que tienen zona
+        de entrega y la contienen, y las que no tienen zona y están dentro del radio
+        (por defecto RADIO_REPARTO_POR_DEFECTO_KM)
+        """
+        from .zonas import zonas_farmacias
+        
+        if radio_km is None:
+            radio_km = radio_reparto_km()
+        if not (direccion_cliente.latitud and direccion_cliente.longitud):
+            return []
+        
+        # Farmacias con zona que contiene al cliente (índice en memoria, sin consultas)
+        cubren = zonas_farmacias.que_contienen(direccion_cliente.latitud, direccion_cliente.longitud)
+        con_zona = zonas_farmacias.con_zona()
+        
+        # Solo se leen las farmacias de las celdas que toca el radio
+        candidatas = cls.objects.filter(activa=True).select_related('direccion')
+        celdas = celdas_en_radio(direccion_cliente.latitud, direccion_cliente.longitud, radio_km)
+        if len(celdas) <= MAX_CELDAS_CONSULTA:
+            en_radio = Q(direccion__celda_geo__in=celdas)
+        else:
+            lat_min, lat_max, lon_min, lon_max = caja_en_radio(
+                direccion_cliente.latitud, direccion_cliente.longitud, radio_km
+            )
+            en_radio = Q(direccion__latitud__range=(lat_min, lat_max), direccion__longitud__range=(lon_min, lon_max))
+        candidatas = candidatas.filter(en_radio | Q(id__in=cubren))
         
-        for farmacia in cls.objects.filter(activa=True):
-            if farmacia.direccion.latitud and farmacia.direccion.longitud:
-                distancia = farmacia.direccion.calcular_distancia(direccion_cliente)
-                if distancia is not None and distancia <= radio_km:
-                    farmacias_cercanas.append({
-                        'farmacia': farmacia,
-                        'distancia': round(distancia, 2)
-                    })
+        candidatas = [f for f in candidatas if f.direccion.latitud and f.direccion.longitud]
+        distancias = distancias_km(
+            direccion_cliente.latitud, direccion_cliente.longitud,
+            [f.direccion.latitud for f in candidatas],
+            [f.direccion.longitud for f in candidatas],
+        )
+        
+        farmacias_cercanas = []
+        for farmacia, distancia in zip(candidatas, distancias):
+            if farmacia.id in cubren or (farmacia.id not in con_zona and distancia <= radio_km):
+                farmacias_cercanas.append({
+                    'farmacia': farmacia,
+                    'distancia': round(distancia, 2)
+                })
         
         # Ordenar por distancia
         farmacias_cercanas.sort(key=lambda x: x['distancia'])
@@ -164,6 +254,10 @@ class Repartidor(models.Model):
     patente = models.CharField(max_length=10, blank=True)
     activo = models.BooleanField(default=True)
     zona_cobertura = models.CharField(max_length=100, blank=True)
+    zona_poligono = models.JSONField(
+        null=True, blank=True, validators=[validar_poligono],
+        help_text='Polígono [[latitud, longitud], ...] de la zona de cobertura; vacío = radio alrededor del repartidor'
+    )
     # Ubicación en tiempo real
     latitud_actual = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
     longitud_actual = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
@@ -173,6 +267,8 @@ class Repartidor(models.Model):
     latitud_fija = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True, help_text="Latitud fija para pruebas")
     longitud_fija = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True, help_text="Longitud fija para pruebas")
     rol = models.CharField(max_length=20, choices=Rol.choices, default=Rol.REPARTIDOR)
+    # Celda de la grilla espacial de la ubicación usada para buscar (ver core/geo.py)
+    celda_geo = models.CharField(max_length=32, blank=True, db_index=True, editable=False)
     
     class Meta:
         verbose_name = 'Repartidor'
@@ -181,93 +277,192 @@ class Repartidor(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} (DNI: {self.dni})"
     
-    def actualizar_ubicacion(self, latitud, longitud):
-        """Actualiza la ubicación actual del repartidor"""
-        from django.utils import timezone
-        
-        self.latitud_actual = latitud
-        self.longitud_actual = longitud
-        self.ultima_actualizacion_ubicacion = timezone.now()
-        self.save()
-    
-    def pedidos_cercanos(self, radio_km=2):
-        """Retorna pedidos cercanos al repartidor"""
+    def save(self, *args, **kwargs):
+        """Mantiene actualizada la celda de la grilla espacial"""
+        ubicacion = self.ubicacion_para_busqueda()
+        self.celda_geo = celda_para(*ubicacion) if ubicacion else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and CAMPOS_UBICACION_REPARTIDOR & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'celda_geo'}
+        super().save(*args, **kwargs)
+    
+    def ubicacion_para_busqueda(self):
+        """Retorna (latitud, longitud) a usar para buscar pedidos, o None si no hay ubicación"""
         # Usar ubicación fija si está habilitada, sino usar ubicación actual
         if self.ubicacion_fija and self.latitud_fija and self.longitud_fija:
-            lat = self.latitud_fija
-            lon = self.longitud_fija
-        elif self.latitud_actual and self.longitud_actual:
-            lat = self.latitud_actual
-            lon = self.longitud_actual
-        else:
+            return self.latitud_fija, self.longitud_fija
+        if self.latitud_actual and self.longitud_actual:
+            return self.latitud_actual, self.longitud_actual
+        return None
+    
+    def _pedidos_en_radio(self, pedidos_disponibles, radio_km):
+        """
+        Filtra pedidos por caja de coordenadas en SQL y luego por distancia exacta,
+        o por la zona de cobertura del repartidor si tiene una
+        """
+        ubicacion = self.ubicacion_para_busqueda()
+        if ubicacion is None:
             return []
+        lat, lon = ubicacion
+        if radio_km is None:
+            radio_km = radio_reparto_km()
         
-        # Crear una dirección temporal con la ubicación del repartidor
-        ubicacion_actual = Direccion(
-            latitud=lat,
-            longitud=lon
+        if self.zona_poligono:
+            lat_min, lat_max, lon_min, lon_max = caja_de_poligono(self.zona_poligono)
+        else:
+            lat_min, lat_max, lon_min, lon_max = caja_en_radio(lat, lon, radio_km)
+        candidatos = pedidos_disponibles.filter(
+            direccion_entrega__latitud__range=(lat_min, lat_max),
+            direccion_entrega__longitud__range=(lon_min, lon_max),
+        ).select_related('direccion_entrega')
+        candidatos = list(candidatos)
+        distancias = distancias_km(
+            lat, lon,
+            [p.direccion_entrega.latitud for p in candidatos],
+            [p.direccion_entrega.longitud for p in candidatos],
         )
         
         pedidos_cercanos = []
-        pedidos_disponibles = Pedido.objects.filter(
-            estado__in=[EstadoPedido.LISTO, EstadoPedido.EN_CAMINO],
-            repartidor__isnull=True
-        )
-        
-        for pedido in pedidos_disponibles:
-            if pedido.direccion_entrega.latitud and pedido.direccion_entrega.longitud:
-                distancia = ubicacion_actual.calcular_distancia(pedido.direccion_entrega)
-                if distancia is not None and distancia <= radio_km:
-                    pedidos_cercanos.append({
-                        'pedido': pedido,
-                        'distancia': round(distancia, 2)
-                    })
+        for pedido, distancia in zip(candidatos, distancias):
+            if self.zona_poligono:
+                dentro = punto_en_poligono(
+                    pedido.direccion_entrega.latitud, pedido.direccion_entrega.longitud, self.zona_poligono
+                )
+            else:
+                dentro = distancia <= radio_km
+            if dentro:
+                pedidos_cercanos.append({
+                    'pedido': pedido,
+                    'distancia': round(distancia, 2)
+                })
         
         # Ordenar por distancia
         pedidos_cercanos.sort(key=lambda x: x['distancia'])
         return pedidos_cercanos
     
-    def pedidos_cercanos_filtrado(self, radio_km=2):
-        from .models import PedidoRechazado, Direccion, EstadoPedido, Pedido
+    def pedidos_cercanos(self, radio_km=None):
+        """Retorna pedidos cercanos al repartidor (radio por defecto: RADIO_REPARTO_POR_DEFECTO_KM)"""
+        pedidos_disponibles = Pedido.objects.filter(
+            estado__in=[EstadoPedido.LISTO, EstadoPedido.EN_CAMINO],
+            repartidor__isnull=True
+        )
+        return self._pedidos_en_radio(pedidos_disponibles, radio_km)
+    
+    def pedidos_cercanos_filtrado(self, radio_km=None):
+        """Igual que pedidos_cercanos pero solo LISTO y sin los pedidos rechazados por el repartidor"""
         rechazados_ids = PedidoRechazado.objects.filter(repartidor=self).values_list('pedido_id', flat=True)
-        # Ubicación (igual que pedidos_cercanos)
-        if self.ubicacion_fija and self.latitud_fija and self.longitud_fija:
-            lat = self.latitud_fija
-            lon = self.longitud_fija
-        elif self.latitud_actual and self.longitud_actual:
-            lat = self.latitud_actual
-            lon = self.longitud_actual
-        else:
-            return []
-        ubicacion_actual = Direccion(latitud=lat, longitud=lon)
-        pedidos_cercanos = []
         pedidos_disponibles = Pedido.objects.filter(
             estado=EstadoPedido.LISTO,
             repartidor__isnull=True
         ).exclude(id__in=rechazados_ids)
-        for pedido in pedidos_disponibles:
-            if pedido.direccion_entrega.latitud and pedido.direccion_entrega.longitud:
-                distancia = ubicacion_actual.calcular_distancia(pedido.direccion_entrega)
-                if distancia is not None and distancia <= radio_km:
-                    pedidos_cercanos.append({
-                        'pedido': pedido,
-                        'distancia': round(distancia, 2)
-                    })
-        pedidos_cercanos.sort(key=lambda x: x['distancia'])
-        return pedidos_cercanos
+        return self._pedidos_en_radio(pedidos_disponibles, radio_km)
     
     def esta_disponible(self):
         """Verifica si el repartidor está disponible (ubicación actualizada en los últimos 10 minutos)"""
         if not self.ultima_actualizacion_ubicacion:
             return False
         
-        from django.utils import timezone
         from datetime import timedelta
         
-        tiempo_limite = timezone.now() - timedelta(minutes=10)
+        tiempo_limite = timezone.now() - timedelta(minutes=MINUTOS_DISPONIBILIDAD)
         return self.ultima_actualizacion_ubicacion > tiempo_limite
+    
+    @classmethod
+    def repartidores_cercanos(cls, latitud, longitud, k=5, radio_km=5):
+        """
+        Retorna los k repartidores activos y disponibles más cercanos a un punto,
+        como [{'repartidor', 'distancia'}] ordenado por distancia.
+        
+        Recorre la grilla espacial en anillos crecientes alrededor del punto y se
+        detiene en cuanto ningún repartidor de los anillos siguientes puede estar
+        más cerca que el k-ésimo encontrado.
+        """
+        from datetime import timedelta
+        
+        if k < 1:
+            return []
+        disponibles = cls.objects.filter(
+            activo=True,
+            ultima_actualizacion_ubicacion__gt=timezone.now() - timedelta(minutes=MINUTOS_DISPONIBILIDAD),
+        ).select_related('user')
+        fila, columna = indices_celda(latitud, longitud)
+        km_por_anillo = km_minimos_por_celda(latitud)
+        
+        encontrados = []
+        anillo = 0
+        while True:
+            candidatos = list(disponibles.filter(celda_geo__in=celdas_en_anillo(fila, columna, anillo)))
+            ubicaciones = [r.ubicacion_para_busqueda() for r in candidatos]
+            distancias = distancias_km(
+                latitud, longitud,
+                [u[0] for u in ubicaciones],
+                [u[1] for u in ubicaciones],
+            )
+            for repartidor, distancia in zip(candidatos, distancias):
+                if distancia <= radio_km:
+                    encontrados.append({'repartidor': repartidor, 'distancia': round(distancia, 2)})
+            encontrados.sort(key=lambda x: x['distancia'])
+            
+            # Todo lo que queda sin ver está al menos a esta distancia
+            distancia_minima_restante = anillo * km_por_anillo
+            if distancia_minima_restante > radio_km:
+                break
+            if len(encontrados) >= k and encontrados[k - 1]['distancia'] <= distancia_minima_restante:
+                break
+            anillo += 1
+        
+        return encontrados[:k]
 
-# Modelo Producto
+# Modelo ProductoCatalogo
+class ProductoCatalogo(models.Model):
+    """
+    Producto canónico, uno por código de barras. Cada farmacia lo ofrece con su
+    propio Producto (precio y stock), vinculado por `catalogo`.
+    """
+    codigo_barras = models.CharField(max_length=50, unique=True)
+    nombre = models.CharField(max_length=200)
+    descripcion = models.TextField(blank=True)
+    categoria = models.CharField(max_length=100, blank=True)
+    laboratorio = models.CharField(max_length=100, blank=True)
+    requiere_receta = models.BooleanField(default=False)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Producto del catálogo'
+        verbose_name_plural = 'Catálogo de productos'
+    
+    def __str__(self):
+        return f"{self.nombre} ({self.codigo_barras})"
+    
+    @classmethod
+    def para_producto(cls, producto):
+        """Entrada del catálogo con el código de barras del producto (la crea con sus datos si no existe)"""
+        catalogo, _ = cls.objects.get_or_create(
+            codigo_barras=producto.codigo_barras,
+            defaults={
+                'nombre': producto.nombre,
+                'descripcion': producto.descripcion,
+                'categoria': producto.categoria,
+                'laboratorio': producto.laboratorio,
+                'requiere_receta': producto.requiere_receta,
+            },
+        )
+        return catalogo
+    
+    def ofertas_disponibles(self, farmacias_ids=None, obra_social_id=None):
+        """
+        Productos activos con stock que ofrecen esta entrada, del más barato al
+        más caro según el precio final para la obra social (anotado como en
+        PrecioObraSocial.anotar); `farmacias_ids` limita a esas farmacias
+        (p. ej. las cercanas).
+        """
+        ofertas = self.ofertas.filter(activo=True, stock_disponible__gt=0, farmacia__activa=True)
+        if farmacias_ids is not None:
+            ofertas = ofertas.filter(farmacia_id__in=farmacias_ids)
+        ofertas = PrecioObraSocial.anotar(ofertas.select_related('farmacia'), obra_social_id)
+        return ofertas.order_by('precio_final', 'id')
+
+# Modelo Producto (la oferta de una farmacia: precio y stock propios)
 class Producto(models.Model):
     nombre = models.CharField(max_length=200)
     descripcion = models.TextField(blank=True)
@@ -277,7 +472,13 @@ class Producto(models.Model):
     # -----------------------------
     
     precio_base = models.DecimalField(max_digits=10, decimal_places=2)
-    codigo_barras = models.CharField(max_length=50, unique=True, blank=True)
+    # Único por farmacia (ver Meta): varias farmacias venden el mismo código de barras
+    codigo_barras = models.CharField(max_length=50, blank=True, db_index=True)
+    # Se completa al guardar a partir de codigo_barras
+    catalogo = models.ForeignKey(
+        ProductoCatalogo, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='ofertas', editable=False,
+    )
     categoria = models.CharField(max_length=100, blank=True)
     laboratorio = models.CharField(max_length=100, blank=True)
     requiere_receta = models.BooleanField(default=False)
@@ -289,9 +490,36 @@ class Producto(models.Model):
     class Meta:
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['farmacia', 'codigo_barras'],
+                condition=~Q(codigo_barras=''),
+                name='producto_codigo_por_farmacia',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['catalogo', 'precio_base'], name='producto_catalogo_precio_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nombre} - {self.farmacia.nombre}"
+    
+    def save(self, *args, **kwargs):
+        """Vincula el producto con su entrada del catálogo según el código de barras"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'codigo_barras' in update_fields:
+            self.catalogo = ProductoCatalogo.para_producto(self) if self.codigo_barras else None
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'catalogo'}
+        super().save(*args, **kwargs)
+    
+    def precio_para(self, obra_social_id):
+        """(precio_final, descuento_aplicado) para un afiliado a la obra social (None: sin obra social)"""
+        if obra_social_id is not None:
+            precio = PrecioObraSocial.objects.filter(producto=self, obra_social_id=obra_social_id).first()
+            if precio is not None:
+                return precio.precio_final, precio.descuento_aplicado
+        return self.precio_base, Decimal('0')
 
 
 # Modelo DescuentoObraSocial
@@ -310,6 +538,80 @@ class DescuentoObraSocial(models.Model):
     def __str__(self):
         return f"{self.producto.nombre} - {self.obra_social.nombre} ({self.descuento_porcentaje}%)"
 
+def descuento_obra_social(precio_base, porcentaje, fijo):
+    """Monto a descontar del precio base: el porcentaje si tiene, si no el monto fijo"""
+    if porcentaje and porcentaje > 0:
+        return (precio_base * porcentaje / 100).quantize(Decimal('0.01'))
+    if fijo and fijo > 0:
+        return fijo
+    return Decimal('0')
+
+# Modelo PrecioObraSocial (precio final ya calculado por producto y obra social)
+class PrecioObraSocial(models.Model):
+    """
+    Una fila por cada DescuentoObraSocial activo con el precio que paga el
+    afiliado; sin fila el precio final es precio_base. Se mantiene desde
+    core/signals.py al guardar o borrar un descuento o cambiar precio_base
+    (`manage.py recalcular_precios` después de cambios con QuerySet.update()).
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='precios_obra_social')
+    obra_social = models.ForeignKey(ObraSocial, on_delete=models.CASCADE, related_name='precios_productos')
+    descuento_aplicado = models.DecimalField(max_digits=10, decimal_places=2)
+    precio_final = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    class Meta:
+        verbose_name = 'Precio por Obra Social'
+        verbose_name_plural = 'Precios por Obra Social'
+        unique_together = ['producto', 'obra_social']
+    
+    def __str__(self):
+        return f"{self.producto.nombre} - {self.obra_social.nombre}: ${self.precio_final}"
+    
+    @classmethod
+    def recalcular(cls, productos_ids=None):
+        """Rehace las filas de esos productos (de todos si no se pasan ids)"""
+        descuentos = DescuentoObraSocial.objects.filter(activo=True)
+        if productos_ids is not None:
+            descuentos = descuentos.filter(producto_id__in=productos_ids)
+        precios = []
+        for producto_id, obra_social_id, porcentaje, fijo, precio_base in descuentos.values_list(
+            'producto_id', 'obra_social_id', 'descuento_porcentaje', 'descuento_fijo', 'producto__precio_base',
+        ).iterator(chunk_size=2000):
+            descuento = descuento_obra_social(precio_base, porcentaje, fijo)
+            precios.append(cls(
+                producto_id=producto_id, obra_social_id=obra_social_id,
+                descuento_aplicado=descuento, precio_final=precio_base - descuento,
+            ))
+        with transaction.atomic():
+            anteriores = cls.objects.all()
+            if productos_ids is not None:
+                anteriores = anteriores.filter(producto_id__in=productos_ids)
+            anteriores.delete()
+            cls.objects.bulk_create(precios, batch_size=500)
+        return len(precios)
+    
+    @staticmethod
+    def anotar(productos, obra_social_id):
+        """
+        Agrega `precio_final` y `descuento_aplicado` a un QuerySet de Producto
+        para los afiliados a esa obra social (None: sin obra social), con un
+        solo LEFT JOIN a esta tabla.
+        """
+        monto = DecimalField(max_digits=10, decimal_places=2)
+        if obra_social_id is None:
+            return productos.annotate(
+                precio_final=models.F('precio_base'),
+                descuento_aplicado=Value(Decimal('0'), output_field=monto),
+            )
+        return productos.annotate(
+            precio_afiliado=FilteredRelation(
+                'precios_obra_social', condition=Q(precios_obra_social__obra_social_id=obra_social_id),
+            ),
+        ).annotate(
+            precio_final=Coalesce('precio_afiliado__precio_final', 'precio_base', output_field=monto),
+            descuento_aplicado=Coalesce('precio_afiliado__descuento_aplicado', Value(Decimal('0')), output_field=monto),
+        )
+
 # Modelo ListaProductos
 class ListaProductos(models.Model):
     nombre = models.CharField(max_length=100)
@@ -357,6 +659,8 @@ class Pedido(models.Model):
     observaciones = models.TextField(blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
+    # Cuándo lo tomó el repartidor: desde ahí se reproduce su recorrido
+    fecha_asignacion = models.DateTimeField(null=True, blank=True)
     fecha_entrega_estimada = models.DateTimeField(null=True, blank=True)
     fecha_entrega_real = models.DateTimeField(null=True, blank=True)
     
@@ -427,4 +731,79 @@ class PedidoRechazado(models.Model):
         verbose_name_plural = 'Pedidos Rechazados'
 
     def __str__(self):
-        return f"Pedido #{self.pedido.numero_pedido} rechazado por {self.repartidor.user.get_full_name()}"
\ No newline at end of file
+        return f"Pedido #{self.pedido.numero_pedido} rechazado por {self.repartidor.user.get_full_name()}"
+
+# Modelo GeocodeCache
+class GeocodeCache(models.Model):
+    """Resultado de geocodificación guardado por dirección normalizada (aciertos y no encontrados)"""
+    direccion_normalizada = models.CharField(max_length=255, unique=True)
+    encontrada = models.BooleanField(default=False)
+    latitud = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    longitud = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    direccion_encontrada = models.CharField(max_length=500, blank=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    fecha_expiracion = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        verbose_name = 'Caché de Geocodificación'
+        verbose_name_plural = 'Caché de Geocodificación'
+    
+    def __str__(self):
+        estado = 'encontrada' if self.encontrada else 'no encontrada'
+        return f"{self.direccion_normalizada} ({estado})"
+
+
+# Modelo GeocodificacionPendiente
+class GeocodificacionPendiente(models.Model):
+    """Cola de direcciones a geocodificar fuera del request (ver manage.py geocodificar_pendientes)"""
+    direccion = models.OneToOneField(Direccion, on_delete=models.CASCADE, related_name='geocodificacion_pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now, db_index=True)
+    ultimo_error = models.CharField(max_length=255, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Geocodificación Pendiente'
+        verbose_name_plural = 'Geocodificaciones Pendientes'
+        ordering = ['proximo_intento']
+    
+    def __str__(self):
+        return f"{self.direccion} (intentos: {self.intentos})"
+
+
+# Modelo UbicacionRepartidor
+class UbicacionRepartidor(models.Model):
+    """Historial de posiciones reportadas por un repartidor"""
+    repartidor = models.ForeignKey(Repartidor, on_delete=models.CASCADE, related_name='historial_ubicaciones')
+    latitud = models.DecimalField(max_digits=10, decimal_places=7)
+    longitud = models.DecimalField(max_digits=10, decimal_places=7)
+    fecha = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = 'Ubicación de Repartidor'
+        verbose_name_plural = 'Historial de Ubicaciones'
+        ordering = ['repartidor', 'fecha']
+        indexes = [
+            models.Index(fields=['repartidor', 'fecha'], name='ubicacion_repartidor_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.repartidor} - {self.fecha:%d/%m/%Y %H:%M:%S}"
+
+
+# Modelo OfertaPedido
+class OfertaPedido(models.Model):
+    """Pedido ofrecido a un único repartidor por el despacho centralizado (ver core/despacho.py)"""
+    pedido = models.OneToOneField(Pedido, on_delete=models.CASCADE, related_name='oferta')
+    repartidor = models.ForeignKey(Repartidor, on_delete=models.CASCADE, related_name='ofertas')
+    distancia_km = models.FloatField(help_text='Distancia del repartidor a la farmacia al momento de ofrecerlo')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_expiracion = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        verbose_name = 'Oferta de Pedido'
+        verbose_name_plural = 'Ofertas de Pedidos'
+        ordering = ['fecha_expiracion']
+    
+    def __str__(self):
+        return f"Pedido #{self.pedido.numero_pedido} ofrecido a {self.repartidor}"
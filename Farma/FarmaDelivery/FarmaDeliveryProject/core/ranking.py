@@ -0,0 +1,154 @@
+"""
+Orden de los resultados de búsqueda por precio, distancia y stock.
+
+Estrategias (parámetro `orden` de buscar_productos):
+
+    precio       menor precio final (con el descuento de la obra social del cliente)
+    distancia    farmacia más cercana, y a igual distancia menor precio
+    recomendado  puntaje combinado:
+                 peso_precio * precio normalizado + peso_distancia * distancia normalizada
+                 + penalización si queda poco stock
+
+En todas los productos sin stock van al final. Los datos de los candidatos se
+traen con una consulta por tanda de ids (con el precio final de la obra social
+ya calculado en PrecioObraSocial) y el orden se calcula de una vez con NumPy;
+sin NumPy se usa el mismo cálculo en Python puro.
+"""
+from django.conf import settings
+from django.db import connection
+
+from .models import PrecioObraSocial, Producto
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+PRECIO = 'precio'
+DISTANCIA = 'distancia'
+RECOMENDADO = 'recomendado'
+ESTRATEGIAS = (PRECIO, DISTANCIA, RECOMENDADO)
+
+
+def _configuracion():
+    return {
+        'peso_precio': getattr(settings, 'RANKING_PESO_PRECIO', 0.6),
+        'peso_distancia': getattr(settings, 'RANKING_PESO_DISTANCIA', 0.4),
+        'penalizacion_poco_stock': getattr(settings, 'RANKING_PENALIZACION_POCO_STOCK', 0.15),
+        'poco_stock': getattr(settings, 'RANKING_POCO_STOCK', 5),
+    }
+
+
+# Ids por consulta: con miles de candidatos, id__in del ORM tarda más en
+# preparar los parámetros que la consulta misma; se usa SQL directo por tandas
+TANDA_IDS = 900
+
+
+def _filas_por_ids(sql, ids, parametros_extra=()):
+    filas = []
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(ids), TANDA_IDS):
+            tanda = ids[inicio:inicio + TANDA_IDS]
+            cursor.execute(sql.format(ids=', '.join(['%s'] * len(tanda))), [*parametros_extra, *tanda])
+            filas.extend(cursor.fetchall())
+    return filas
+
+
+def datos_candidatos(ids, obra_social_id=None):
+    """
+    Columnas de los candidatos en el orden de `ids`: (ids, precios finales,
+    farmacias, stocks). El precio final es el de PrecioObraSocial para la obra
+    social, o precio_base si no tiene descuento (o no se pasa obra social).
+    """
+    ids = list(ids)
+    filas = {
+        producto_id: (float(precio), farmacia_id, stock)
+        for producto_id, precio, farmacia_id, stock in _filas_por_ids(
+            f"SELECT p.id, COALESCE(po.precio_final, p.precio_base), p.farmacia_id, p.stock_disponible "
+            f"FROM {Producto._meta.db_table} p LEFT JOIN {PrecioObraSocial._meta.db_table} po "
+            "ON po.producto_id = p.id AND po.obra_social_id = %s "
+            "WHERE p.id IN ({ids})",
+            ids, [obra_social_id],
+        )
+    }
+
+    presentes, precios, farmacias, stocks = [], [], [], []
+    for producto_id in ids:
+        fila = filas.get(producto_id)
+        if fila is None:
+            continue
+        precio, farmacia_id, stock = fila
+        presentes.append(producto_id)
+        precios.append(precio)
+        farmacias.append(farmacia_id)
+        stocks.append(stock)
+    return presentes, precios, farmacias, stocks
+
+
+def _normalizar(valores):
+    """Lleva los valores al rango [0, 1] (todos 0 si son iguales)"""
+    minimo, maximo = valores.min(), valores.max()
+    if maximo == minimo:
+        return np.zeros_like(valores)
+    return (valores - minimo) / (maximo - minimo)
+
+
+def _normalizar_lista(valores):
+    minimo, maximo = min(valores), max(valores)
+    if maximo == minimo:
+        return [0.0] * len(valores)
+    return [(v - minimo) / (maximo - minimo) for v in valores]
+
+
+def ordenar(ids, estrategia, obra_social_id=None, distancias=None):
+    """
+    Reordena `ids` según la estrategia. `distancias` es {farmacia_id: km} o
+    None (sin dirección: la distancia no cuenta). A igualdad se mantiene el
+    orden recibido (relevancia).
+    """
+    if estrategia not in ESTRATEGIAS or not ids:
+        return list(ids)
+    config = _configuracion()
+    ids, precios, farmacias, stocks = datos_candidatos(ids, obra_social_id)
+    if not ids:
+        return []
+    km = [distancias.get(f, 0.0) if distancias else 0.0 for f in farmacias]
+
+    if np is not None:
+        precios = np.asarray(precios, dtype=np.float64)
+        km = np.asarray(km, dtype=np.float64)
+        stocks = np.asarray(stocks, dtype=np.int64)
+        sin_stock = stocks <= 0
+        if estrategia == PRECIO:
+            claves = (precios, sin_stock)
+        elif estrategia == DISTANCIA:
+            claves = (precios, km, sin_stock)
+        else:
+            puntaje = (
+                config['peso_precio'] * _normalizar(precios)
+                + config['peso_distancia'] * _normalizar(km)
+                + config['penalizacion_poco_stock'] * (stocks <= config['poco_stock'])
+            )
+            claves = (puntaje, sin_stock)
+        # lexsort ordena por la última clave primero y es estable
+        orden = np.lexsort(claves)
+        return np.asarray(ids)[orden].tolist()
+
+    sin_stock = [stock <= 0 for stock in stocks]
+    if estrategia == PRECIO:
+        claves = list(zip(sin_stock, precios))
+    elif estrategia == DISTANCIA:
+        claves = list(zip(sin_stock, km, precios))
+    else:
+        precio_n = _normalizar_lista(precios)
+        km_n = _normalizar_lista(km)
+        claves = [
+            (
+                sin_stock[i],
+                config['peso_precio'] * precio_n[i] + config['peso_distancia'] * km_n[i]
+                + config['penalizacion_poco_stock'] * (stocks[i] <= config['poco_stock']),
+            )
+            for i in range(len(ids))
+        ]
+    posiciones = sorted(range(len(ids)), key=lambda i: claves[i])
+    return [ids[i] for i in posiciones]
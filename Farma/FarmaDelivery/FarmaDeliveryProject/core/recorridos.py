@@ -0,0 +1,188 @@
+"""
+Almacén compacto de recorridos de repartidores.
+
+Cada día tiene un archivo binario de solo-agregado (recorridos/AAAA-MM-DD.trk)
+con registros de ancho fijo de 16 bytes:
+
+    repartidor_id (int32) | timestamp epoch en segundos (uint32) | latitud (float32) | longitud (float32)
+
+Las lecturas se hacen con mmap. Por cada archivo se mantiene en memoria un
+índice repartidor -> números de registro, que se construye la primera vez que
+se lee ese día y después solo se extiende con los registros agregados desde la
+última lectura. Así reproducir el recorrido de un pedido lee solo los
+registros de ese repartidor, sin pasar por el ORM. Se guardan los índices de
+los RECORRIDOS_MAX_INDICES días leídos más recientemente.
+"""
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .distancias import longitud_recorrido_km
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+FORMATO_REGISTRO = struct.Struct('<iIff')
+TAMANO_REGISTRO = FORMATO_REGISTRO.size
+
+if np is not None:
+    TIPO_REGISTRO = np.dtype([
+        ('repartidor', '<i4'), ('timestamp', '<u4'), ('latitud', '<f4'), ('longitud', '<f4'),
+    ])
+
+
+def _directorio():
+    return Path(getattr(settings, 'RECORRIDOS_DIR', settings.BASE_DIR / 'recorridos'))
+
+
+def _max_indices():
+    return getattr(settings, 'RECORRIDOS_MAX_INDICES', 14)
+
+
+def _dia_utc(momento):
+    return momento.astimezone(dt_timezone.utc).date()
+
+
+class AlmacenRecorridos:
+    """Escritura y lectura de los archivos diarios de recorridos"""
+
+    def __init__(self, directorio=None):
+        self._directorio = Path(directorio) if directorio else None
+        self._lock_escritura = threading.Lock()
+        self._lock_indices = threading.Lock()
+        # {ruta: (registros_indexados, {repartidor_id: [números de registro]})}, del menos
+        # al más usado recientemente
+        self._indices = OrderedDict()
+
+    @property
+    def directorio(self):
+        return self._directorio or _directorio()
+
+    def ruta(self, dia):
+        return self.directorio / f"{dia.isoformat()}.trk"
+
+    def agregar(self, puntos):
+        """Agrega puntos (repartidor_id, latitud, longitud, momento); un write por archivo diario"""
+        por_dia = {}
+        for repartidor_id, latitud, longitud, momento in puntos:
+            registro = FORMATO_REGISTRO.pack(
+                repartidor_id, int(momento.timestamp()), float(latitud), float(longitud)
+            )
+            por_dia.setdefault(_dia_utc(momento), []).append(registro)
+        if not por_dia:
+            return
+
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        with self._lock_escritura:
+            for dia, registros in por_dia.items():
+                # O_APPEND: cada write completo va al final aunque escriban varios procesos
+                descriptor = os.open(self.ruta(dia), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                try:
+                    os.write(descriptor, b''.join(registros))
+                finally:
+                    os.close(descriptor)
+
+    def _numeros_registro(self, ruta, contenido, total, repartidor_id):
+        """Números de registro del repartidor entre los primeros `total`, extendiendo el índice si hace falta"""
+        with self._lock_indices:
+            indexados, indice = self._indices.get(ruta, (0, {}))
+            if ruta in self._indices:
+                self._indices.move_to_end(ruta)
+            if total < indexados:
+                # El archivo se reemplazó: empezar de nuevo
+                indexados, indice = 0, {}
+            if total > indexados:
+                if np is not None:
+                    nuevos = np.frombuffer(contenido, dtype=TIPO_REGISTRO, count=total - indexados,
+                                           offset=indexados * TAMANO_REGISTRO)['repartidor']
+                    orden = np.argsort(nuevos, kind='stable')
+                    ids, inicios = np.unique(nuevos[orden], return_index=True)
+                    for clave, grupo in zip(ids.tolist(), np.split(orden + indexados, inicios[1:])):
+                        indice.setdefault(clave, []).extend(grupo.tolist())
+                    del nuevos
+                else:
+                    for numero in range(indexados, total):
+                        clave = struct.unpack_from('<i', contenido, numero * TAMANO_REGISTRO)[0]
+                        indice.setdefault(clave, []).append(numero)
+                self._indices[ruta] = (total, indice)
+                while len(self._indices) > _max_indices():
+                    self._indices.popitem(last=False)
+            # Las listas están ordenadas; otro lector pudo haber indexado más registros que `total`
+            numeros = indice.get(repartidor_id, [])
+            return numeros[:bisect_left(numeros, total)]
+
+    def _leer_dia(self, dia, repartidor_id, desde_ts, hasta_ts):
+        ruta = self.ruta(dia)
+        try:
+            archivo = open(ruta, 'rb')
+        except FileNotFoundError:
+            return []
+        with archivo:
+            # Un registro a medio escribir al final del archivo se ignora
+            total = os.fstat(archivo.fileno()).st_size // TAMANO_REGISTRO
+            if total == 0:
+                return []
+            with mmap.mmap(archivo.fileno(), total * TAMANO_REGISTRO, access=mmap.ACCESS_READ) as contenido:
+                numeros = self._numeros_registro(ruta, contenido, total, repartidor_id)
+                if not numeros:
+                    return []
+                if np is not None:
+                    registros = np.frombuffer(contenido, dtype=TIPO_REGISTRO, count=total)[numeros]
+                    registros = registros[(registros['timestamp'] >= desde_ts) & (registros['timestamp'] <= hasta_ts)]
+                    return list(zip(registros['timestamp'].tolist(), registros['latitud'].tolist(),
+                                    registros['longitud'].tolist()))
+                puntos = []
+                for numero in numeros:
+                    _, timestamp, latitud, longitud = FORMATO_REGISTRO.unpack_from(contenido, numero * TAMANO_REGISTRO)
+                    if desde_ts <= timestamp <= hasta_ts:
+                        puntos.append((timestamp, latitud, longitud))
+                return puntos
+
+    def leer(self, repartidor_id, desde, hasta):
+        """Puntos (timestamp, latitud, longitud) de un repartidor entre dos momentos, ordenados por tiempo"""
+        desde_ts, hasta_ts = int(desde.timestamp()), int(hasta.timestamp())
+        puntos = []
+        dia, ultimo_dia = _dia_utc(desde), _dia_utc(hasta)
+        while dia <= ultimo_dia:
+            puntos.extend(self._leer_dia(dia, repartidor_id, desde_ts, hasta_ts))
+            dia += timedelta(days=1)
+        puntos.sort(key=lambda punto: punto[0])
+        return puntos
+
+
+almacen_recorridos = AlmacenRecorridos()
+
+
+def recorrido_pedido(pedido):
+    """
+    Recorrido del repartidor de un pedido: desde que lo tomó hasta la entrega
+    (o hasta ahora si sigue en camino). Retorna None si no tiene repartidor.
+    """
+    if pedido.repartidor_id is None:
+        return None
+    # Pedidos asignados antes de que existiera fecha_asignacion: desde la creación
+    desde = pedido.fecha_asignacion or pedido.fecha_creacion
+    hasta = pedido.fecha_entrega_real or timezone.now()
+    puntos = almacen_recorridos.leer(pedido.repartidor_id, desde, hasta)
+    return {
+        'puntos': [
+            {
+                'latitud': round(latitud, 6),
+                'longitud': round(longitud, 6),
+                'momento': datetime.fromtimestamp(timestamp, tz=dt_timezone.utc).isoformat(),
+            }
+            for timestamp, latitud, longitud in puntos
+        ],
+        'distancia_km': round(longitud_recorrido_km([p[1] for p in puntos], [p[2] for p in puntos]), 2),
+        'duracion_minutos': round((puntos[-1][0] - puntos[0][0]) / 60, 1) if puntos else 0,
+    }
@@ -0,0 +1,212 @@
+"""
+Planificación de la ruta de un repartidor con varios pedidos en curso.
+
+Cada pedido aporta dos paradas: el retiro en la farmacia y la entrega al
+cliente, y el retiro tiene que ir antes que la entrega. La ruta sale de la
+ubicación del repartidor y no vuelve al origen.
+
+La secuencia se arma con vecino más cercano (siempre entre las paradas
+habilitadas) y después se mejora con 2-opt, aceptando solo las inversiones
+que respetan el orden retiro -> entrega. Como esa restricción bloquea muchas
+inversiones, se alterna con un paso que mueve paradas sueltas a otra posición.
+
+Para sugerir pedidos LISTO que convienen sumar se calcula el costo de insertar
+su retiro y su entrega en el mejor lugar de la ruta actual.
+"""
+from django.conf import settings
+
+from .distancias import matriz_distancias_km
+from .geo import caja_en_radio
+
+RETIRO = 'retiro'
+ENTREGA = 'entrega'
+
+
+def _configuracion():
+    return {
+        'desvio_max_km': getattr(settings, 'RUTAS_DESVIO_MAX_KM', 1.5),
+        'max_sugerencias': getattr(settings, 'RUTAS_MAX_SUGERENCIAS', 3),
+    }
+
+
+def paradas_de_pedido(pedido):
+    """Paradas (retiro, entrega) de un pedido, o [] si falta alguna coordenada"""
+    farmacia = pedido.farmacia.direccion
+    cliente = pedido.direccion_entrega
+    if None in (farmacia.latitud, farmacia.longitud, cliente.latitud, cliente.longitud):
+        return []
+    return [
+        {'tipo': RETIRO, 'pedido_id': pedido.id, 'latitud': float(farmacia.latitud), 'longitud': float(farmacia.longitud)},
+        {'tipo': ENTREGA, 'pedido_id': pedido.id, 'latitud': float(cliente.latitud), 'longitud': float(cliente.longitud)},
+    ]
+
+
+def _matriz(puntos):
+    latitudes = [p[0] for p in puntos]
+    longitudes = [p[1] for p in puntos]
+    matriz = matriz_distancias_km(latitudes, longitudes, latitudes, longitudes)
+    return matriz.tolist() if hasattr(matriz, 'tolist') else matriz
+
+
+def _largo(secuencia, distancias):
+    return sum(distancias[a][b] for a, b in zip(secuencia, secuencia[1:]))
+
+
+def _respeta_orden(secuencia, retiro_de):
+    """True si cada entrega aparece después de su retiro"""
+    visitados = set()
+    for nodo in secuencia:
+        retiro = retiro_de.get(nodo)
+        if retiro is not None and retiro not in visitados:
+            return False
+        visitados.add(nodo)
+    return True
+
+
+def _vecino_mas_cercano(distancias, retiro_de, cantidad):
+    secuencia = [0]
+    pendientes = set(range(1, cantidad))
+    visitados = {0}
+    while pendientes:
+        actual = secuencia[-1]
+        habilitadas = [n for n in pendientes if retiro_de.get(n) is None or retiro_de[n] in visitados]
+        siguiente = min(habilitadas, key=lambda n: distancias[actual][n])
+        secuencia.append(siguiente)
+        visitados.add(siguiente)
+        pendientes.remove(siguiente)
+    return secuencia
+
+
+def _dos_opt(secuencia, distancias, retiro_de):
+    """Invierte tramos mientras acorte la ruta sin romper el orden retiro -> entrega"""
+    mejorada = True
+    while mejorada:
+        mejorada = False
+        for i in range(1, len(secuencia) - 1):
+            for k in range(i + 1, len(secuencia)):
+                a, b = secuencia[i - 1], secuencia[i]
+                c = secuencia[k]
+                d = secuencia[k + 1] if k + 1 < len(secuencia) else None
+                # Ruta abierta: si el tramo llega al final no hay arista c-d
+                antes = distancias[a][b] + (distancias[c][d] if d is not None else 0)
+                despues = distancias[a][c] + (distancias[b][d] if d is not None else 0)
+                if despues < antes - 1e-9:
+                    candidata = secuencia[:i] + secuencia[i:k + 1][::-1] + secuencia[k + 1:]
+                    if _respeta_orden(candidata, retiro_de):
+                        secuencia = candidata
+                        mejorada = True
+    return secuencia
+
+
+def _reubicar(secuencia, distancias, retiro_de):
+    """Mueve una parada a otra posición mientras acorte la ruta; retorna (secuencia, mejoró)"""
+    largo_actual = _largo(secuencia, distancias)
+    mejoro = False
+    i = 1
+    while i < len(secuencia):
+        sin_nodo = secuencia[:i] + secuencia[i + 1:]
+        for j in range(1, len(sin_nodo) + 1):
+            if j == i:
+                continue
+            candidata = sin_nodo[:j] + [secuencia[i]] + sin_nodo[j:]
+            largo = _largo(candidata, distancias)
+            if largo < largo_actual - 1e-9 and _respeta_orden(candidata, retiro_de):
+                secuencia, largo_actual, mejoro = candidata, largo, True
+                break
+        i += 1
+    return secuencia, mejoro
+
+
+def planificar_ruta(origen, paradas):
+    """
+    Ordena las paradas saliendo desde `origen` (latitud, longitud).
+    Retorna {'paradas': [...en orden, con 'distancia_km' desde la anterior], 'distancia_km': total}.
+    """
+    if not paradas:
+        return {'paradas': [], 'distancia_km': 0}
+
+    puntos = [origen] + [(p['latitud'], p['longitud']) for p in paradas]
+    distancias = _matriz(puntos)
+    # Nodo 0 = origen; nodo i = paradas[i - 1]
+    nodo_retiro = {p['pedido_id']: i for i, p in enumerate(paradas, start=1) if p['tipo'] == RETIRO}
+    retiro_de = {
+        i: nodo_retiro[p['pedido_id']]
+        for i, p in enumerate(paradas, start=1)
+        if p['tipo'] == ENTREGA and p['pedido_id'] in nodo_retiro
+    }
+
+    secuencia = _vecino_mas_cercano(distancias, retiro_de, len(puntos))
+    mejoro = True
+    while mejoro:
+        secuencia = _dos_opt(secuencia, distancias, retiro_de)
+        secuencia, mejoro = _reubicar(secuencia, distancias, retiro_de)
+
+    ordenadas = [
+        {**paradas[nodo - 1], 'distancia_km': round(distancias[anterior][nodo], 2)}
+        for anterior, nodo in zip(secuencia, secuencia[1:])
+    ]
+    return {'paradas': ordenadas, 'distancia_km': round(_largo(secuencia, distancias), 2)}
+
+
+def costo_de_insercion(origen, ruta, retiro, entrega):
+    """
+    Kilómetros extra de insertar un retiro y su entrega en el mejor lugar de una
+    ruta ya ordenada (lista de paradas, sin el origen).
+    """
+    puntos = [origen] + [(p['latitud'], p['longitud']) for p in ruta] + [
+        (retiro['latitud'], retiro['longitud']), (entrega['latitud'], entrega['longitud']),
+    ]
+    distancias = _matriz(puntos)
+    r, e = len(puntos) - 2, len(puntos) - 1
+    secuencia = list(range(len(ruta) + 1))
+
+    def desvio(nodo, i):
+        # Costo de meter `nodo` entre la posición i y la i+1 (o al final)
+        a = secuencia[i]
+        if i + 1 == len(secuencia):
+            return distancias[a][nodo]
+        b = secuencia[i + 1]
+        return distancias[a][nodo] + distancias[nodo][b] - distancias[a][b]
+
+    mejor = float('inf')
+    for i in range(len(secuencia)):
+        # Retiro y entrega en el mismo hueco
+        a = secuencia[i]
+        if i + 1 == len(secuencia):
+            juntos = distancias[a][r] + distancias[r][e]
+        else:
+            b = secuencia[i + 1]
+            juntos = distancias[a][r] + distancias[r][e] + distancias[e][b] - distancias[a][b]
+        mejor = min(mejor, juntos)
+        # Retiro en el hueco i y entrega en un hueco posterior
+        costo_retiro = desvio(r, i)
+        for j in range(i + 1, len(secuencia)):
+            mejor = min(mejor, costo_retiro + desvio(e, j))
+    return mejor
+
+
+def sugerir_pedidos(origen, ruta, candidatos):
+    """
+    Pedidos de `candidatos` que se pueden sumar a la ruta con menos de
+    RUTAS_DESVIO_MAX_KM de desvío, como [{'pedido', 'desvio_km'}] ordenado por desvío.
+    """
+    config = _configuracion()
+    sugerencias = []
+    for pedido in candidatos:
+        paradas = paradas_de_pedido(pedido)
+        if not paradas:
+            continue
+        desvio = costo_de_insercion(origen, ruta, *paradas)
+        if desvio <= config['desvio_max_km']:
+            sugerencias.append({'pedido': pedido, 'desvio_km': round(desvio, 2)})
+    sugerencias.sort(key=lambda s: s['desvio_km'])
+    return sugerencias[:config['max_sugerencias']]
+
+
+def caja_de_ruta(origen, ruta):
+    """(lat_min, lat_max, lon_min, lon_max) que contiene la ruta con el margen del desvío máximo"""
+    puntos = [origen] + [(p['latitud'], p['longitud']) for p in ruta]
+    margen = _configuracion()['desvio_max_km']
+    cajas = [caja_en_radio(lat, lon, margen) for lat, lon in puntos]
+    return (min(c[0] for c in cajas), max(c[1] for c in cajas),
+            min(c[2] for c in cajas), max(c[3] for c in cajas))
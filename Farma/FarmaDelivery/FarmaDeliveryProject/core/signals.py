@@ -0,0 +1,122 @@
+"""
+Señales de la app core.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .autocompletar import cercania_usuarios, indice_nombres
+from .cache_busqueda import cache_busquedas
+from .models import (
+    DescuentoObraSocial, EstadoPedido, Farmacia, OfertaPedido, Pedido, PrecioObraSocial, Producto, Repartidor,
+)
+from .trigramas import indice_trigramas
+from .ubicaciones import grilla_pedidos
+from .zonas import zonas_farmacias, zonas_repartidores
+
+
+def _toca_campos(update_fields, campos):
+    return update_fields is None or bool(campos & set(update_fields))
+
+
+# Rearmar el índice de zonas cuando cambia una zona (no en cada actualización de ubicación)
+@receiver(post_save, sender=Farmacia)
+def invalidar_zonas_farmacias(sender, instance, update_fields=None, **kwargs):
+    if _toca_campos(update_fields, {'zona_entrega', 'activa'}):
+        zonas_farmacias.invalidar()
+        cercania_usuarios.invalidar()
+
+
+@receiver(post_save, sender=Repartidor)
+def invalidar_zonas_repartidores(sender, instance, update_fields=None, **kwargs):
+    if _toca_campos(update_fields, {'zona_poligono', 'activo'}):
+        zonas_repartidores.invalidar()
+
+
+@receiver(post_delete, sender=Farmacia)
+def invalidar_zonas_farmacias_al_borrar(sender, instance, **kwargs):
+    zonas_farmacias.invalidar()
+    cercania_usuarios.invalidar()
+
+
+@receiver(post_delete, sender=Repartidor)
+def invalidar_zonas_repartidores_al_borrar(sender, instance, **kwargs):
+    zonas_repartidores.invalidar()
+
+
+# Mantener al día los índices en memoria de productos (trigramas y autocompletado)
+@receiver(post_save, sender=Producto)
+def reindexar_trigramas_producto(sender, instance, update_fields=None, **kwargs):
+    if _toca_campos(update_fields, {'nombre', 'laboratorio', 'farmacia', 'activo'}):
+        indice_trigramas.actualizar(instance)
+
+
+@receiver(post_save, sender=Producto)
+def reindexar_autocompletado_producto(sender, instance, update_fields=None, **kwargs):
+    if _toca_campos(update_fields, {'nombre', 'farmacia', 'activo'}):
+        indice_nombres.actualizar(instance)
+
+
+@receiver(post_delete, sender=Producto)
+def quitar_producto_de_indices(sender, instance, **kwargs):
+    indice_trigramas.quitar(instance.id)
+    indice_nombres.quitar(instance.id)
+
+
+# Descartar las búsquedas guardadas que pueden incluir productos de la farmacia.
+# Solo los campos que deciden si un producto coincide: precio_base y
+# stock_disponible no están en el cache (el ranking los lee después)
+CAMPOS_DE_BUSQUEDA = {'nombre', 'descripcion', 'laboratorio', 'categoria', 'requiere_receta', 'farmacia', 'activo'}
+
+
+@receiver(post_save, sender=Producto)
+def invalidar_busquedas_producto(sender, instance, update_fields=None, **kwargs):
+    if _toca_campos(update_fields, CAMPOS_DE_BUSQUEDA):
+        cache_busquedas.invalidar_farmacia(instance.farmacia_id)
+
+
+@receiver(post_delete, sender=Producto)
+def invalidar_busquedas_producto_al_borrar(sender, instance, **kwargs):
+    cache_busquedas.invalidar_farmacia(instance.farmacia_id)
+
+
+@receiver(post_save, sender=Farmacia)
+@receiver(post_delete, sender=Farmacia)
+def invalidar_busquedas_farmacia(sender, instance, **kwargs):
+    cache_busquedas.invalidar_farmacia(instance.id)
+
+
+# Mantener la tabla de precios por obra social (PrecioObraSocial)
+@receiver(post_save, sender=DescuentoObraSocial)
+@receiver(post_delete, sender=DescuentoObraSocial)
+def recalcular_precios_descuento(sender, instance, **kwargs):
+    PrecioObraSocial.recalcular([instance.producto_id])
+
+
+@receiver(post_save, sender=Producto)
+def recalcular_precios_producto(sender, instance, created=False, update_fields=None, **kwargs):
+    # Un producto nuevo todavía no tiene descuentos
+    if not created and _toca_campos(update_fields, {'precio_base'}):
+        PrecioObraSocial.recalcular([instance.id])
+
+
+# Un pedido que deja de estar LISTO (aceptado, cancelado, vuelto a preparación)
+# ya no se puede ofrecer: se borra su oferta del despacho centralizado
+@receiver(post_save, sender=Pedido)
+def quitar_oferta_pedido(sender, instance, created=False, update_fields=None, **kwargs):
+    if created or not _toca_campos(update_fields, {'estado', 'repartidor'}):
+        return
+    if instance.estado != EstadoPedido.LISTO or instance.repartidor_id is not None:
+        OfertaPedido.objects.filter(pedido=instance).delete()
+
+
+# La grilla de pedidos disponibles (cantidad de pedidos cercanos de cada ping)
+# se rearma en la próxima consulta en vez de esperar su TTL
+@receiver(post_save, sender=Pedido)
+def invalidar_grilla_pedidos(sender, instance, update_fields=None, **kwargs):
+    if _toca_campos(update_fields, {'estado', 'repartidor', 'direccion_entrega'}):
+        grilla_pedidos.invalidar()
+
+
+@receiver(post_delete, sender=Pedido)
+def invalidar_grilla_pedidos_al_borrar(sender, instance, **kwargs):
+    grilla_pedidos.invalidar()
@@ -1,3 +1,1341 @@
-from django.test import TestCase
-
-# Create your tests here.
+import io
+import itertools
+import json
+import tempfile
+import threading
+from datetime import time, timedelta, timezone as dt_timezone
+from math import asin, atan2, cos, degrees, radians, sin
+from pathlib import Path
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .autocompletar import cercania_usuarios, indice_nombres
+from .busqueda import IdsPorDistancia, buscar_ids, contar_facetas, filas_a_resultado
+from .cache_busqueda import cache_busquedas, clave_busqueda
+from .despacho import ronda_de_despacho
+from .distancias import RADIO_TIERRA_KM, distancias_km, haversine_km, longitud_recorrido_km, matriz_distancias_km
+from .eta import estadisticas_farmacias, estimar_entrega, estimar_entrega_con_repartidor
+from .forms import ProductoForm
+from .geo import caja_en_radio, celda_para
+from . import geocodificador_la_plata
+from .geocodificacion import (
+    ErrorGeocodificacion, geocodificar, geocodificar_partes, normalizar_direccion, pendientes_a_procesar,
+    procesar_pendiente,
+)
+from .models import (
+    Cliente, DescuentoObraSocial, Direccion, EstadoPedido, Farmacia, GeocodeCache, GeocodificacionPendiente,
+    MetodoPago, ObraSocial, OfertaPedido, Pedido, PrecioObraSocial, Producto, ProductoCatalogo, Repartidor,
+    UbicacionRepartidor,
+)
+from .recorridos import AlmacenRecorridos, almacen_recorridos, recorrido_pedido
+from .rutas import ENTREGA, RETIRO, costo_de_insercion, paradas_de_pedido, planificar_ruta, sugerir_pedidos
+from .trigramas import indice_trigramas
+from .ubicaciones import buffer_ubicaciones, grilla_pedidos
+from .views import resultados_busqueda
+
+_numeros = itertools.count(1)
+
+
+def crear_farmacia(nombre, latitud=-34.9205, longitud=-57.9536):
+    numero = next(_numeros)
+    direccion = Direccion.objects.create(
+        calle='7', numero=str(1000 + numero), ciudad='La Plata', provincia='Buenos Aires',
+        codigo_postal='1900', latitud=latitud, longitud=longitud,
+    )
+    return Farmacia.objects.create(
+        user=User.objects.create_user(username=f'farmacia{numero}', password='clave'),
+        nombre=nombre, direccion=direccion, matricula=f'MP{numero:05d}', cuit=f'{30000000000 + numero}',
+        telefono='221 400 0000', email_contacto=f'farmacia{numero}@example.com',
+        horario_apertura=time(8), horario_cierre=time(20),
+    )
+
+
+def crear_cliente(latitud, longitud):
+    numero = next(_numeros)
+    direccion = Direccion.objects.create(
+        calle='7', numero=str(1000 + numero), ciudad='La Plata', provincia='Buenos Aires',
+        codigo_postal='1900', latitud=latitud, longitud=longitud,
+    )
+    return Cliente.objects.create(
+        user=User.objects.create_user(username=f'cliente{numero}', password='clave'),
+        dni=f'{20000000 + numero}', direccion=direccion,
+    )
+
+
+def crear_producto(farmacia, nombre, **campos):
+    campos.setdefault('precio_base', 100)
+    campos.setdefault('stock_disponible', 10)
+    return Producto.objects.create(farmacia=farmacia, nombre=nombre, **campos)
+
+
+def crear_repartidor(latitud, longitud, **campos):
+    numero = next(_numeros)
+    campos.setdefault('ubicacion_fija', True)
+    campos.setdefault('ultima_actualizacion_ubicacion', timezone.now())
+    return Repartidor.objects.create(
+        user=User.objects.create_user(username=f'repartidor{numero}', password='clave'),
+        dni=f'{30000000 + numero}', telefono='221 500 0000',
+        latitud_fija=latitud, longitud_fija=longitud, **campos,
+    )
+
+
+def crear_pedido(farmacia, cliente, latitud, longitud, estado=EstadoPedido.LISTO, **campos):
+    numero = next(_numeros)
+    direccion = Direccion.objects.create(
+        calle='50', numero=str(numero), ciudad='La Plata', provincia='Buenos Aires',
+        codigo_postal='1900', latitud=latitud, longitud=longitud,
+    )
+    return Pedido.objects.create(
+        cliente=cliente, farmacia=farmacia, numero_pedido=f'P{numero:06d}', estado=estado,
+        metodo_pago=MetodoPago.EFECTIVO, subtotal=100, total=100, direccion_entrega=direccion, **campos,
+    )
+
+
+def punto_a(latitud, longitud, distancia_km, rumbo):
+    """Punto a `distancia_km` de (latitud, longitud) en el rumbo dado (grados desde el norte)"""
+    angulo = distancia_km / RADIO_TIERRA_KM
+    lat1, lon1, rumbo = radians(latitud), radians(longitud), radians(rumbo)
+    lat2 = asin(sin(lat1) * cos(angulo) + cos(lat1) * sin(angulo) * cos(rumbo))
+    lon2 = lon1 + atan2(sin(rumbo) * sin(angulo) * cos(lat1), cos(angulo) - sin(lat1) * sin(lat2))
+    return round(degrees(lat2), 7), round(degrees(lon2), 7)
+
+
+def migrar(destino):
+    """Lleva la base de test a la migración `destino` de core; retorna los modelos de ese estado"""
+    executor = MigrationExecutor(connection)
+    executor.migrate([('core', destino)])
+    executor.loader.build_graph()
+    return executor.loader.project_state([('core', destino)]).apps
+
+
+def ultima_migracion():
+    return MigrationExecutor(connection).loader.graph.leaf_nodes('core')[0][1]
+
+
+class ServidorGeocodificacion:
+    """
+    Servidor HTTP local que responde como Nominatim. `respuesta` es
+    (status, cuerpo) y `consultas` guarda el parámetro q de cada pedido.
+    """
+
+    def __init__(self):
+        self.respuesta = (200, [])
+        self.consultas = []
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                servidor.consultas.append(parse_qs(urlparse(self.path).query).get('q', [''])[0])
+                status, cuerpo = servidor.respuesta
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def log_message(self, *args):
+                pass
+
+        self.http = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.url = f'http://127.0.0.1:{self.http.server_address[1]}/search'
+        self.hilo = threading.Thread(target=self.http.serve_forever, daemon=True)
+
+    def iniciar(self):
+        self.hilo.start()
+
+    def detener(self):
+        self.http.shutdown()
+        self.http.server_close()
+
+
+ENCONTRADA = [{'lat': '-32.9468', 'lon': '-60.6393', 'display_name': 'Córdoba 1200, Rosario, Santa Fe'}]
+
+
+class GeocodificacionTests(TestCase):
+    """Servicio de geocodificación contra un Nominatim local (core/geocodificacion.py)"""
+
+    def setUp(self):
+        self.servidor = ServidorGeocodificacion()
+        self.servidor.iniciar()
+        self.addCleanup(self.servidor.detener)
+        configuracion = override_settings(
+            GEOCODIFICACION_URL=self.servidor.url,
+            GEOCODIFICACION_TIMEOUT=2,
+            GEOCODIFICACION_TTL=timedelta(days=30),
+            GEOCODIFICACION_TTL_NEGATIVO=timedelta(hours=6),
+        )
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def test_segunda_consulta_sale_de_la_cache(self):
+        self.servidor.respuesta = (200, ENCONTRADA)
+        primero = geocodificar('Córdoba 1200, Rosario, Santa Fe, Argentina')
+        # Otra forma de escribir la misma dirección usa la misma entrada
+        segundo = geocodificar('  cordoba 1200 ,Rosario,  Santa Fe, Argentina')
+
+        self.assertEqual(len(self.servidor.consultas), 1)
+        self.assertEqual(primero, segundo)
+        self.assertAlmostEqual(primero['latitud'], -32.9468)
+        entrada = GeocodeCache.objects.get()
+        self.assertTrue(entrada.encontrada)
+        self.assertGreater(entrada.fecha_expiracion, timezone.now() + timedelta(days=29))
+
+    def test_no_encontrada_se_guarda_con_su_ttl(self):
+        self.servidor.respuesta = (200, [])
+        antes = timezone.now()
+        self.assertIsNone(geocodificar('Calle Inexistente 1, Rosario, Santa Fe, Argentina'))
+        self.assertIsNone(geocodificar('Calle Inexistente 1, Rosario, Santa Fe, Argentina'))
+        self.assertEqual(len(self.servidor.consultas), 1)
+
+        entrada = GeocodeCache.objects.get()
+        self.assertFalse(entrada.encontrada)
+        self.assertGreaterEqual(entrada.fecha_expiracion, antes + timedelta(hours=6))
+        self.assertLess(entrada.fecha_expiracion, antes + timedelta(hours=6, minutes=1))
+
+        # Vencida la entrada negativa se vuelve a consultar
+        GeocodeCache.objects.update(fecha_expiracion=timezone.now() - timedelta(seconds=1))
+        self.servidor.respuesta = (200, ENCONTRADA)
+        self.assertIsNotNone(geocodificar('Calle Inexistente 1, Rosario, Santa Fe, Argentina'))
+        self.assertEqual(len(self.servidor.consultas), 2)
+        self.assertTrue(GeocodeCache.objects.get().encontrada)
+
+    def test_error_del_servicio_no_se_guarda(self):
+        self.servidor.respuesta = (503, {'error': 'ocupado'})
+        with self.assertRaises(ErrorGeocodificacion):
+            geocodificar('Córdoba 1200, Rosario, Santa Fe, Argentina')
+        self.assertFalse(GeocodeCache.objects.exists())
+
+        # Al volver el servicio se consulta de nuevo (el error no quedó en la caché)
+        self.servidor.respuesta = (200, ENCONTRADA)
+        self.assertIsNotNone(geocodificar('Córdoba 1200, Rosario, Santa Fe, Argentina'))
+        self.assertEqual(len(self.servidor.consultas), 2)
+
+    def test_respuesta_con_formato_inesperado_es_error_del_servicio(self):
+        for cuerpo in ({'lat': '-32.9'}, [{'lon': '-60.6'}], [{'lat': 'norte', 'lon': '-60.6'}], ['texto']):
+            self.servidor.respuesta = (200, cuerpo)
+            with self.assertRaises(ErrorGeocodificacion):
+                geocodificar('Córdoba 1200, Rosario, Santa Fe, Argentina')
+        self.assertFalse(GeocodeCache.objects.exists())
+
+    def test_direcciones_largas_no_comparten_entrada(self):
+        comun = 'Avenida ' + 'Muy Larga ' * 30
+        primera, segunda = normalizar_direccion(comun + '100'), normalizar_direccion(comun + '200')
+        self.assertNotEqual(primera, segunda)
+        self.assertLessEqual(len(primera), 255)
+        self.assertEqual(normalizar_direccion('Córdoba  1200'), 'cordoba 1200')
+
+        self.servidor.respuesta = (200, ENCONTRADA)
+        geocodificar(comun + '100')
+        geocodificar(comun + '200')
+        self.assertEqual(len(self.servidor.consultas), 2)
+
+    def test_servicio_caido_no_se_guarda(self):
+        self.servidor.detener()
+        with self.assertRaises(ErrorGeocodificacion):
+            geocodificar('Córdoba 1200, Rosario, Santa Fe, Argentina')
+        self.assertFalse(GeocodeCache.objects.exists())
+
+    def test_worker_procesa_la_cola(self):
+        # Una dirección sin coordenadas queda en la cola al guardarse
+        direccion = Direccion.objects.create(
+            calle='Córdoba', numero='1200', ciudad='Rosario', provincia='Santa Fe', codigo_postal='2000',
+        )
+        pendiente = GeocodificacionPendiente.objects.get(direccion=direccion)
+
+        self.servidor.respuesta = (500, {})
+        self.assertFalse(procesar_pendiente(pendiente))
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.intentos, 1)
+        self.assertGreater(pendiente.proximo_intento, timezone.now())
+        self.assertEqual(pendientes_a_procesar(10), [])
+
+        GeocodificacionPendiente.objects.update(proximo_intento=timezone.now())
+        self.servidor.respuesta = (200, ENCONTRADA)
+        [pendiente] = pendientes_a_procesar(10)
+        self.assertTrue(procesar_pendiente(pendiente))
+
+        direccion.refresh_from_db()
+        self.assertAlmostEqual(float(direccion.latitud), -32.9468)
+        self.assertAlmostEqual(float(direccion.longitud), -60.6393)
+        self.assertFalse(GeocodificacionPendiente.objects.exists())
+        self.assertIn('Córdoba 1200, Rosario', self.servidor.consultas[-1])
+
+    def test_limite_de_tasa_solo_para_consultas_externas(self):
+        self.servidor.respuesta = (200, ENCONTRADA)
+        esperas = []
+        for numero in ('1200', '1300'):
+            Direccion.objects.create(
+                calle='Córdoba', numero=numero, ciudad='Rosario', provincia='Santa Fe', codigo_postal='2000',
+            )
+        # La primera ya está en la caché y la segunda sale al servicio
+        geocodificar('Córdoba 1200, Rosario, Santa Fe, Argentina')
+        self.servidor.consultas.clear()
+
+        for pendiente in pendientes_a_procesar(10):
+            self.assertTrue(procesar_pendiente(pendiente, antes_de_consultar=lambda: esperas.append(1)))
+        self.assertEqual(len(esperas), 1)
+        self.assertEqual(len(self.servidor.consultas), 1)
+
+
+class ColaGeocodificacionTests(TestCase):
+    """Direccion.save encola solo lo que hay que geocodificar (core/models.py)"""
+
+    def test_solo_toca_la_cola_si_cambia_la_geocodificacion(self):
+        with self.assertNumQueries(1):
+            direccion = Direccion.objects.create(
+                calle='7', numero='1000', ciudad='La Plata', provincia='Buenos Aires', codigo_postal='1900',
+                latitud=-34.9205, longitud=-57.9536,
+            )
+        with self.assertNumQueries(1):
+            direccion.codigo_postal = 'B1900'
+            direccion.save()
+        self.assertFalse(GeocodificacionPendiente.objects.exists())
+
+        # Cambió la calle y no las coordenadas: quedaron viejas
+        direccion.calle = '8'
+        direccion.save()
+        self.assertTrue(GeocodificacionPendiente.objects.filter(direccion=direccion).exists())
+
+        direccion.latitud = -34.9190
+        direccion.save(update_fields=['latitud'])
+        self.assertFalse(GeocodificacionPendiente.objects.exists())
+
+    def test_direccion_nueva_sin_coordenadas_se_encola(self):
+        direccion = Direccion.objects.create(
+            calle='Córdoba', numero='1200', ciudad='Rosario', provincia='Santa Fe', codigo_postal='2000',
+        )
+        self.assertTrue(GeocodificacionPendiente.objects.filter(direccion=direccion).exists())
+        direccion.refresh_from_db()
+        with self.assertNumQueries(1):
+            direccion.save()
+
+
+class GeocodificadorLaPlataTests(TestCase):
+    """Geocodificador local de la grilla numerada de La Plata (core/geocodificador_la_plata.py)"""
+
+    def test_calle_entre_calles_es_el_punto_medio_de_las_esquinas(self):
+        esperado = {
+            'latitud': -34.911781, 'longitud': -57.951452,
+            'direccion_encontrada': 'Calle 7 e/ 47 y 48, La Plata',
+        }
+        self.assertEqual(geocodificador_la_plata.geocodificar('7', '47-48', 'La Plata'), esperado)
+        self.assertEqual(geocodificador_la_plata.geocodificar('Calle 7', 'e/ 47 y 48', '  LA PLATA '), esperado)
+        self.assertEqual(geocodificador_la_plata.geocodificar('Av. 7', 'entre 48 / 47', 'La Plata')['latitud'],
+                         esperado['latitud'])
+
+    def test_lo_que_no_cubre_la_grilla_se_consulta_afuera(self):
+        for calle, numero, ciudad in (
+            ('7', '47-48', 'City Bell'),  # otra ciudad
+            ('7', '1234', 'La Plata'),  # numeración
+            ('7 bis', '47-48', 'La Plata'),  # calle bis
+            ('7', '8-9', 'La Plata'),  # dos calles paralelas
+            ('Diagonal 74', '47-48', 'La Plata'),
+        ):
+            self.assertIsNone(geocodificador_la_plata.geocodificar(calle, numero, ciudad), (calle, numero, ciudad))
+
+        encontrada = {'latitud': -34.91, 'longitud': -57.95, 'direccion_encontrada': '7 bis'}
+        with mock.patch('core.geocodificacion.geocodificar', return_value=encontrada) as remoto:
+            self.assertEqual(geocodificar_partes('7 bis', '47-48', 'La Plata', 'Buenos Aires'), encontrada)
+            geocodificar_partes('7', '47-48', 'La Plata', 'Buenos Aires')
+        remoto.assert_called_once()
+
+
+class GeocodeDireccionesTests(TestCase):
+    """Comando geocode_direcciones (completar coordenadas en bloque)"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.archivo_control = Path(directorio.name) / 'control'
+
+    def crear_direccion(self, numero):
+        return Direccion.objects.create(
+            calle='Córdoba', numero=numero, ciudad='Rosario', provincia='Santa Fe', codigo_postal='2000',
+        )
+
+    def ejecutar(self, geocodificar):
+        with mock.patch('core.management.commands.geocode_direcciones.geocodificar_partes', side_effect=geocodificar):
+            call_command(
+                'geocode_direcciones', hilos=2, lote=2, archivo_control=str(self.archivo_control),
+                stdout=io.StringIO(), stderr=io.StringIO(),
+            )
+
+    def test_error_inesperado_no_corta_el_proceso(self):
+        direcciones = [self.crear_direccion(str(1000 + i)) for i in range(5)]
+
+        def geocodificar(calle, numero, *args, **kwargs):
+            if numero == '1002':
+                raise KeyError('lat')
+            return {'latitud': -32.9468, 'longitud': -60.6393}
+
+        self.ejecutar(geocodificar)
+        resueltas = Direccion.objects.filter(latitud__isnull=False).values_list('id', flat=True)
+        self.assertCountEqual(resueltas, [d.id for i, d in enumerate(direcciones) if i != 2])
+        self.assertEqual(list(GeocodificacionPendiente.objects.values_list('direccion_id', flat=True)), [direcciones[2].id])
+
+    def test_corrida_completa_borra_el_archivo_de_control(self):
+        self.crear_direccion('1000')
+        self.ejecutar(lambda *args, **kwargs: None)
+        self.assertFalse(self.archivo_control.exists())
+
+        # La próxima corrida vuelve a ver las direcciones de ids anteriores que siguen sin coordenadas
+        consultadas = []
+        self.ejecutar(lambda calle, numero, *args, **kwargs: consultadas.append(numero))
+        self.assertEqual(consultadas, ['1000'])
+
+
+class DistanciasTests(TestCase):
+    """Haversine en lote, con y sin NumPy (core/distancias.py)"""
+
+    PUNTOS = [(-34.9205, -57.9536), (Decimal('-34.6037'), Decimal('-58.3816')), (-35.9205, -57.9536), (-34.9205, -57.9536)]
+
+    def calcular(self):
+        latitudes = [p[0] for p in self.PUNTOS]
+        longitudes = [p[1] for p in self.PUNTOS]
+        return (
+            distancias_km(-34.9205, -57.9536, latitudes, longitudes),
+            [list(fila) for fila in matriz_distancias_km(latitudes[:2], longitudes[:2], latitudes, longitudes)],
+            longitud_recorrido_km(latitudes, longitudes),
+        )
+
+    def test_lote_coincide_con_la_version_escalar(self):
+        distancias, matriz, recorrido = self.calcular()
+        esperadas = [haversine_km(-34.9205, -57.9536, *punto) for punto in self.PUNTOS]
+        # Un grado de latitud con el radio de 6371 km
+        self.assertAlmostEqual(esperadas[2], 111.195, places=3)
+        for calculada, esperada in zip(distancias, esperadas):
+            self.assertAlmostEqual(calculada, esperada, places=9)
+        self.assertEqual(len(matriz), 2)
+        for calculada, esperada in zip(matriz[0], esperadas):
+            self.assertAlmostEqual(calculada, esperada, places=9)
+        self.assertAlmostEqual(matriz[1][1], 0)
+        tramos = [haversine_km(*self.PUNTOS[i], *self.PUNTOS[i + 1]) for i in range(len(self.PUNTOS) - 1)]
+        self.assertAlmostEqual(recorrido, sum(tramos), places=9)
+        self.assertEqual(distancias_km(0, 0, [], []), [])
+        self.assertEqual(longitud_recorrido_km([1.0], [1.0]), 0.0)
+
+    def test_sin_numpy_da_lo_mismo(self):
+        con_numpy = self.calcular()
+        with mock.patch('core.distancias.np', None):
+            sin_numpy = self.calcular()
+        for a, b in zip(con_numpy[0] + [x for fila in con_numpy[1] for x in fila] + [con_numpy[2]],
+                        sin_numpy[0] + [x for fila in sin_numpy[1] for x in fila] + [sin_numpy[2]]):
+            self.assertAlmostEqual(a, b, places=9)
+
+
+class GrillaEspacialTests(TestCase):
+    """Celdas de la grilla espacial y farmacias cercanas (core/geo.py, Farmacia.farmacias_cercanas)"""
+
+    ORIGEN = (-34.92, -57.95)
+
+    def test_celda_sigue_a_las_coordenadas(self):
+        direccion = Direccion.objects.create(
+            calle='7', numero='1200', ciudad='La Plata', provincia='Buenos Aires', codigo_postal='1900',
+            latitud=-34.9205, longitud=-57.9536,
+        )
+        self.assertEqual(direccion.celda_geo, '-1747:-2898')
+        direccion.latitud, direccion.longitud = -34.8700, -58.0500
+        direccion.save(update_fields=['latitud', 'longitud'])
+        direccion.refresh_from_db()
+        self.assertEqual(direccion.celda_geo, celda_para(-34.8700, -58.0500))
+        direccion.latitud = direccion.longitud = None
+        direccion.save()
+        self.assertEqual(direccion.celda_geo, '')
+
+    def test_farmacias_cercanas_incluye_celdas_vecinas(self):
+        cliente = crear_cliente(*self.ORIGEN)
+        cerca = crear_farmacia('Farmacia Centro', *punto_a(*self.ORIGEN, 0.5, 0))
+        # En otra celda que la del cliente, pero dentro del radio
+        borde = crear_farmacia('Farmacia Sur', *punto_a(*self.ORIGEN, 1.9, 135))
+        fuera = crear_farmacia('Farmacia Este', *punto_a(*self.ORIGEN, 2.1, 90))
+        crear_farmacia('Farmacia City Bell', *punto_a(*self.ORIGEN, 15, 315))
+        inactiva = crear_farmacia('Farmacia Cerrada', *punto_a(*self.ORIGEN, 0.3, 180))
+        inactiva.activa = False
+        inactiva.save()
+        self.assertNotEqual(borde.direccion.celda_geo, cliente.direccion.celda_geo)
+
+        cercanas = Farmacia.farmacias_cercanas(cliente.direccion, radio_km=2)
+        self.assertEqual([f['farmacia'] for f in cercanas], [cerca, borde])
+        self.assertAlmostEqual(cercanas[1]['distancia'], 1.9, places=2)
+        self.assertEqual([f['farmacia'] for f in Farmacia.farmacias_cercanas(cliente.direccion, radio_km=3)],
+                         [cerca, borde, fuera])
+
+
+class RadioTests(TestCase):
+    """Caja de coordenadas que prefiltra las búsquedas por radio (core/geo.py)"""
+
+    ORIGEN = (-34.92, -57.95)
+
+    def test_caja_contiene_el_borde_del_circulo(self):
+        for latitud in (self.ORIGEN[0], 0.0, 60.0):
+            lat_min, lat_max, lon_min, lon_max = caja_en_radio(latitud, self.ORIGEN[1], 2)
+            for rumbo in (0, 90, 180, 270):
+                lat, lon = punto_a(latitud, self.ORIGEN[1], 1.998, rumbo)
+                self.assertLessEqual(haversine_km(latitud, self.ORIGEN[1], lat, lon), 2)
+                self.assertTrue(lat_min <= lat <= lat_max and lon_min <= lon <= lon_max, (latitud, rumbo))
+
+    def test_pedidos_en_el_borde_del_radio(self):
+        farmacia = crear_farmacia('Farmacia Centro')
+        cliente = crear_cliente(*self.ORIGEN)
+        repartidor = crear_repartidor(*self.ORIGEN)
+        dentro = [crear_pedido(farmacia, cliente, *punto_a(*self.ORIGEN, 1.998, rumbo)) for rumbo in (0, 90, 180, 270)]
+        for rumbo in (0, 90, 180, 270):
+            crear_pedido(farmacia, cliente, *punto_a(*self.ORIGEN, 2.01, rumbo))
+
+        cercanos = [item['pedido'].id for item in repartidor.pedidos_cercanos(radio_km=2)]
+        self.assertCountEqual(cercanos, [p.id for p in dentro])
+
+
+@override_settings(RADIO_REPARTO_POR_DEFECTO_KM=3)
+class AlcanceRepartoTests(TestCase):
+    """El radio por defecto sale de RADIO_REPARTO_POR_DEFECTO_KM en todas las búsquedas"""
+
+    def test_panel_conteo_y_aceptar_usan_el_mismo_radio(self):
+        origen = (-34.92, -57.95)
+        farmacia = crear_farmacia('Farmacia Centro', *punto_a(*origen, 2.5, 45))
+        cliente = crear_cliente(*punto_a(*origen, 2.5, 90))
+        repartidor = crear_repartidor(*origen)
+        pedido = crear_pedido(farmacia, cliente, *punto_a(*origen, 2.5, 90))
+        grilla_pedidos.invalidar()
+        self.addCleanup(grilla_pedidos.invalidar)
+
+        self.assertEqual([f['farmacia'] for f in Farmacia.farmacias_cercanas(cliente.direccion)], [farmacia])
+        self.assertEqual(grilla_pedidos.contar_cercanos(*origen), 1)
+        self.client.force_login(repartidor.user)
+        disponibles = self.client.get(reverse('api_pedidos_disponibles')).json()['pedidos']
+        self.assertEqual([p['id'] for p in disponibles], [pedido.id])
+        self.assertEqual(self.client.post(reverse('aceptar_pedido', args=[pedido.id])).status_code, 200)
+
+
+@override_settings(
+    ETA_VELOCIDAD_KMH={'BICI': 12, 'MOTO': 24}, ETA_VEHICULO_POR_DEFECTO='BICI', ETA_FACTOR_RUTA=1,
+    ETA_MINUTOS_PREPARACION=15, ETA_MINUTOS_POR_PEDIDO_EN_COLA=5, ETA_MINUTOS_RETIRO=10,
+    ETA_DISTANCIA_POR_DEFECTO_KM=3,
+)
+class EstimacionEntregaTests(TestCase):
+    """Hora estimada de entrega (core/eta.py)"""
+
+    ORIGEN = (-34.92, -57.95)
+    DESDE = timezone.now()
+
+    def setUp(self):
+        estadisticas_farmacias.invalidar()
+        self.addCleanup(estadisticas_farmacias.invalidar)
+        self.farmacia = crear_farmacia('Farmacia Centro', *self.ORIGEN)
+        self.cliente = crear_cliente(*punto_a(*self.ORIGEN, 2, 90))
+
+    def minutos(self, estimada):
+        return round((estimada - self.DESDE).total_seconds() / 60)
+
+    def test_pedido_nuevo_suma_preparacion_cola_retiro_y_viaje(self):
+        for estado in (EstadoPedido.PENDIENTE, EstadoPedido.PREPARANDO, EstadoPedido.LISTO):
+            crear_pedido(self.farmacia, self.cliente, *self.ORIGEN, estado=estado)
+        destino = punto_a(*self.ORIGEN, 2, 90)
+
+        # 15 de preparación + 2 pedidos en cola × 5 + 10 de retiro + 2 km en bici a 12 km/h
+        self.assertEqual(self.minutos(estimar_entrega(self.farmacia.id, *destino, desde=self.DESDE)), 45)
+        with self.assertNumQueries(0):
+            # Sin coordenadas se estima con ETA_DISTANCIA_POR_DEFECTO_KM
+            self.assertEqual(self.minutos(estimar_entrega(self.farmacia.id, None, None, desde=self.DESDE)), 50)
+            estadisticas_farmacias.sumar_a_cola(self.farmacia.id)
+            self.assertEqual(self.minutos(estimar_entrega(self.farmacia.id, *destino, desde=self.DESDE)), 50)
+
+    def test_con_repartidor_usa_su_ubicacion_y_vehiculo(self):
+        pedido = crear_pedido(self.farmacia, self.cliente, *punto_a(*self.ORIGEN, 2, 90))
+        moto = crear_repartidor(*punto_a(*self.ORIGEN, 1.2, 0), tipo_vehiculo='MOTO')
+        # 1,2 km hasta la farmacia y 2 km hasta el cliente a 24 km/h
+        self.assertEqual(self.minutos(estimar_entrega_con_repartidor(pedido, moto, desde=self.DESDE)), 8)
+        sin_ubicacion = crear_repartidor(None, None, ubicacion_fija=False)
+        # Sin ubicación del repartidor el retiro son ETA_MINUTOS_RETIRO; el viaje, en bici
+        self.assertEqual(self.minutos(estimar_entrega_con_repartidor(pedido, sin_ubicacion, desde=self.DESDE)), 20)
+
+
+@override_settings(DESPACHO_CENTRALIZADO=True)
+class DespachoTests(TestCase):
+    """Ofertas del despacho centralizado (core/despacho.py)"""
+
+    def setUp(self):
+        self.farmacia = crear_farmacia('Farmacia Centro')
+        self.cliente = crear_cliente(-34.9250, -57.9550)
+        self.repartidor = crear_repartidor(-34.9210, -57.9540)
+        self.pedido = crear_pedido(self.farmacia, self.cliente, -34.9250, -57.9550)
+
+    def aceptar(self):
+        self.client.force_login(self.repartidor.user)
+        return self.client.post(reverse('aceptar_pedido', args=[self.pedido.id]))
+
+    def test_acepta_el_pedido_ofrecido(self):
+        [oferta] = ronda_de_despacho()
+        self.assertEqual(oferta.repartidor, self.repartidor)
+        self.assertEqual(self.aceptar().status_code, 200)
+        self.pedido.refresh_from_db()
+        self.assertEqual((self.pedido.estado, self.pedido.repartidor), (EstadoPedido.EN_CAMINO, self.repartidor))
+        self.assertIsNotNone(self.pedido.fecha_asignacion)
+        self.assertFalse(OfertaPedido.objects.exists())
+
+    def test_cambio_de_estado_borra_la_oferta(self):
+        ronda_de_despacho()
+        self.pedido.estado = EstadoPedido.CANCELADO
+        self.pedido.save(update_fields=['estado'])
+        self.assertFalse(OfertaPedido.objects.exists())
+        self.assertEqual(self.aceptar().status_code, 400)
+
+    def test_no_acepta_un_pedido_que_ya_no_esta_listo(self):
+        ronda_de_despacho()
+        # QuerySet.update() no pasa por las señales: la oferta queda pero no sirve
+        Pedido.objects.filter(id=self.pedido.id).update(estado=EstadoPedido.PREPARANDO)
+        self.assertEqual(self.aceptar().status_code, 400)
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, EstadoPedido.PREPARANDO)
+        self.assertIsNone(self.pedido.repartidor)
+
+
+class RutasTests(TestCase):
+    """Ruta de un repartidor con varios pedidos y pedidos sugeridos (core/rutas.py)"""
+
+    ORIGEN = (-34.92, -57.95)
+
+    def parada(self, tipo, pedido_id, km_al_este):
+        latitud, longitud = punto_a(*self.ORIGEN, km_al_este, 90)
+        return {'tipo': tipo, 'pedido_id': pedido_id, 'latitud': latitud, 'longitud': longitud}
+
+    def test_retiro_antes_que_la_entrega(self):
+        # Todo sobre una misma calle hacia el este: la entrega de 2 queda detrás de su retiro
+        paradas = [
+            self.parada(RETIRO, 1, 1), self.parada(ENTREGA, 1, 3),
+            self.parada(RETIRO, 2, 2), self.parada(ENTREGA, 2, 0.5),
+        ]
+        ruta = planificar_ruta(self.ORIGEN, paradas)
+        self.assertEqual([(p['tipo'], p['pedido_id']) for p in ruta['paradas']],
+                         [(RETIRO, 1), (RETIRO, 2), (ENTREGA, 1), (ENTREGA, 2)])
+        self.assertAlmostEqual(ruta['distancia_km'], 5.5, places=1)
+        self.assertEqual(planificar_ruta(self.ORIGEN, []), {'paradas': [], 'distancia_km': 0})
+
+    def test_sugiere_los_pedidos_que_quedan_de_paso(self):
+        farmacia = crear_farmacia('Farmacia Centro', *punto_a(*self.ORIGEN, 1, 90))
+        cliente = crear_cliente(*self.ORIGEN)
+        en_curso = crear_pedido(farmacia, cliente, *punto_a(*self.ORIGEN, 3, 90), estado=EstadoPedido.EN_CAMINO)
+        ruta = planificar_ruta(self.ORIGEN, paradas_de_pedido(en_curso))['paradas']
+
+        de_paso = crear_pedido(farmacia, cliente, *punto_a(*self.ORIGEN, 2, 90))
+        con_desvio = crear_pedido(farmacia, cliente, *punto_a(*punto_a(*self.ORIGEN, 2, 90), 0.5, 0))
+        lejos = crear_pedido(farmacia, cliente, *punto_a(*self.ORIGEN, 5, 0))
+        sin_coordenadas = crear_pedido(farmacia, cliente, None, None)
+
+        self.assertAlmostEqual(costo_de_insercion(self.ORIGEN, ruta, *paradas_de_pedido(de_paso)), 0, places=6)
+        sugeridos = sugerir_pedidos(self.ORIGEN, ruta, [lejos, con_desvio, sin_coordenadas, de_paso])
+        self.assertEqual([s['pedido'] for s in sugeridos], [de_paso, con_desvio])
+        # Medio kilómetro al costado de la mitad del tramo: 2 × √(1² + 0,5²) − 2
+        self.assertAlmostEqual(sugeridos[1]['desvio_km'], 0.24, places=2)
+        with override_settings(RUTAS_MAX_SUGERENCIAS=1):
+            self.assertEqual([s['pedido'] for s in sugerir_pedidos(self.ORIGEN, ruta, [con_desvio, de_paso])],
+                             [de_paso])
+
+
+class UbicacionesLoteTests(TestCase):
+    """Subida de varias ubicaciones juntas (/api/ubicacion/lote/, core/ubicaciones.py)"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        configuracion = override_settings(RECORRIDOS_DIR=directorio.name)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        # Las ubicaciones quedan en memoria hasta el volcado: se vuelcan dentro del test
+        self.addCleanup(buffer_ubicaciones.volcar)
+        self.repartidor = crear_repartidor(None, None, ubicacion_fija=False, ultima_actualizacion_ubicacion=None)
+        self.client.force_login(self.repartidor.user)
+
+    def enviar(self, puntos):
+        return self.client.post(
+            reverse('actualizar_ubicacion_lote'), json.dumps({'puntos': puntos}), content_type='application/json',
+        )
+
+    def test_guarda_el_lote_y_la_ultima_ubicacion(self):
+        ahora = timezone.now()
+        respuesta = self.enviar([
+            {'latitud': -34.9210, 'longitud': -57.9540, 'timestamp': (ahora - timedelta(minutes=2)).isoformat()},
+            {'latitud': -34.9220, 'longitud': -57.9550, 'timestamp': ahora.timestamp()},
+        ])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(UbicacionRepartidor.objects.filter(repartidor=self.repartidor).count(), 2)
+        buffer_ubicaciones.volcar()
+        self.repartidor.refresh_from_db()
+        self.assertAlmostEqual(float(self.repartidor.latitud_actual), -34.9220)
+
+    def test_rechaza_fechas_fuera_de_rango_sin_guardar_nada(self):
+        for timestamp in ('1960-01-01T00:00:00+00:00', (timezone.now() - timedelta(days=30)).isoformat(),
+                          (timezone.now() + timedelta(hours=1)).isoformat()):
+            respuesta = self.enviar([
+                {'latitud': -34.9210, 'longitud': -57.9540, 'timestamp': timezone.now().isoformat()},
+                {'latitud': -34.9220, 'longitud': -57.9550, 'timestamp': timestamp},
+            ])
+            self.assertEqual(respuesta.status_code, 400)
+            self.assertEqual(respuesta.json()['errores'][0]['indice'], 1)
+        self.assertFalse(UbicacionRepartidor.objects.exists())
+
+    def test_vistas_del_repartidor_usan_la_ubicacion_sin_volcar(self):
+        farmacia = crear_farmacia('Farmacia Centro', latitud=-34.9280, longitud=-57.9500)
+        pedido = crear_pedido(farmacia, crear_cliente(-34.9300, -57.9500), -34.9300, -57.9500)
+
+        def ping():
+            respuesta = self.client.post(reverse('actualizar_ubicacion_repartidor'),
+                                         {'latitud': -34.9290, 'longitud': -57.9500})
+            return respuesta.json()['pedidos_cercanos']
+
+        self.assertEqual(ping(), 1)
+        self.repartidor.refresh_from_db()
+        self.assertIsNone(self.repartidor.latitud_actual)
+        disponibles = self.client.get(reverse('api_pedidos_disponibles')).json()['pedidos']
+        self.assertEqual([p['id'] for p in disponibles], [pedido.id])
+        self.assertEqual(self.client.post(reverse('aceptar_pedido', args=[pedido.id])).status_code, 200)
+        # Aceptarlo rearma la grilla de pedidos disponibles sin esperar su TTL
+        self.assertEqual(ping(), 0)
+
+
+class RecorridosTests(TestCase):
+    """Archivos diarios de recorridos y su reproducción por pedido (core/recorridos.py)"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+
+    def test_recorrido_empieza_cuando_el_repartidor_toma_el_pedido(self):
+        repartidor = crear_repartidor(-34.9210, -57.9540)
+        pedido = crear_pedido(crear_farmacia('Farmacia Centro'), crear_cliente(-34.93, -57.95), -34.93, -57.95,
+                              estado=EstadoPedido.EN_CAMINO, repartidor=repartidor)
+        asignado = timezone.now() - timedelta(minutes=10)
+        Pedido.objects.filter(id=pedido.id).update(
+            fecha_creacion=asignado - timedelta(hours=1), fecha_asignacion=asignado,
+        )
+        pedido.refresh_from_db()
+        with override_settings(RECORRIDOS_DIR=self.directorio):
+            almacen_recorridos.agregar([
+                # Otro pedido anterior del mismo repartidor, antes de tomar este
+                (repartidor.id, -34.9000, -57.9000, asignado - timedelta(minutes=30)),
+                (repartidor.id, -34.9210, -57.9540, asignado + timedelta(minutes=1)),
+                (repartidor.id, -34.9250, -57.9500, asignado + timedelta(minutes=5)),
+                (repartidor.id + 1, -34.9250, -57.9500, asignado + timedelta(minutes=5)),
+            ])
+            recorrido = recorrido_pedido(pedido)
+
+        self.assertEqual([round(punto['latitud'], 4) for punto in recorrido['puntos']], [-34.921, -34.925])
+        self.assertEqual(recorrido['duracion_minutos'], 4.0)
+
+    @override_settings(RECORRIDOS_MAX_INDICES=2)
+    def test_descarta_los_indices_leidos_hace_mas_tiempo(self):
+        almacen = AlmacenRecorridos(self.directorio)
+        dias = [timezone.now() - timedelta(days=n) for n in (2, 1, 0)]
+        almacen.agregar([(7, -34.92, -57.95, momento) for momento in dias])
+        for momento in dias[:2]:
+            self.assertEqual(len(almacen.leer(7, momento, momento)), 1)
+        # Volver a leer el primero lo deja como el más reciente: se descarta el segundo
+        almacen.leer(7, dias[0], dias[0])
+        almacen.leer(7, dias[2], dias[2])
+        self.assertEqual(list(almacen._indices), [almacen.ruta(m.astimezone(dt_timezone.utc).date())
+                                                  for m in (dias[0], dias[2])])
+
+
+class RepartidoresCercanosTests(TestCase):
+    """k repartidores disponibles más cercanos (Repartidor.repartidores_cercanos)"""
+
+    def setUp(self):
+        self.farmacia = crear_farmacia('Farmacia Centro', latitud=-34.9205, longitud=-57.9536)
+        # A ~0,5, ~1,6 y ~3,3 km; el último está fuera de los 2 km
+        self.repartidores = [crear_repartidor(lat, -57.9536) for lat in (-34.9250, -34.9350, -34.9500)]
+        crear_repartidor(-34.9210, -57.9536, activo=False)
+        crear_repartidor(-34.9210, -57.9536, ultima_actualizacion_ubicacion=timezone.now() - timedelta(hours=1))
+        self.pedido = crear_pedido(self.farmacia, crear_cliente(-34.93, -57.95), -34.93, -57.95)
+
+    def test_devuelve_los_k_mas_cercanos_disponibles(self):
+        cercanos = Repartidor.repartidores_cercanos(-34.9205, -57.9536, k=2, radio_km=5)
+        self.assertEqual([item['repartidor'] for item in cercanos], self.repartidores[:2])
+        self.assertEqual(
+            [item['repartidor'] for item in Repartidor.repartidores_cercanos(-34.9205, -57.9536, k=5, radio_km=2)],
+            self.repartidores[:2],
+        )
+        self.assertEqual(Repartidor.repartidores_cercanos(-34.9205, -57.9536, k=0), [])
+
+    def test_valida_k_en_la_api(self):
+        self.client.force_login(self.farmacia.user)
+        url = reverse('api_repartidores_cercanos', args=[self.pedido.id])
+        self.assertEqual(len(self.client.get(url, {'k': 0}).json()['repartidores']), 1)
+        self.assertEqual(len(self.client.get(url, {'k': -3}).json()['repartidores']), 1)
+        self.assertEqual(len(self.client.get(url, {'k': 500}).json()['repartidores']), 3)
+        self.assertEqual(self.client.get(url, {'k': 'dos'}).status_code, 400)
+
+
+class BusquedaTextoCompletoTests(TestCase):
+    """Índice FTS5 de productos (migración 0018_producto_fts y core/busqueda.py)"""
+
+    def setUp(self):
+        self.cercana = crear_farmacia('Farmacia Cercana')
+        self.lejana = crear_farmacia('Farmacia Lejana', latitud=-34.60, longitud=-58.38)
+
+    def ids(self, texto, productos=None):
+        return [fila[0] for fila in buscar_ids(texto, productos or Producto.objects.all())]
+
+    def test_triggers_mantienen_el_indice(self):
+        producto = crear_producto(self.cercana, 'IBUPRÓFENO 400mg', laboratorio='Bagó')
+        self.assertEqual(self.ids('ibuprofeno'), [producto.id])
+        self.assertEqual(self.ids('bago ibup'), [producto.id])
+
+        producto.nombre = 'Paracetamol 500mg'
+        producto.save()
+        self.assertEqual(self.ids('ibuprofeno'), [])
+        self.assertEqual(self.ids('paracetamol'), [producto.id])
+
+        # También con QuerySet.update(), que no pasa por las señales
+        Producto.objects.filter(id=producto.id).update(descripcion='Analgésico y antifebril')
+        self.assertEqual(self.ids('antifebril'), [producto.id])
+
+        producto.delete()
+        self.assertEqual(self.ids('paracetamol'), [])
+        self.assertEqual(self.ids('antifebril'), [])
+
+    def test_ordena_por_relevancia(self):
+        en_descripcion = crear_producto(self.cercana, 'Antibiótico', descripcion='Contiene amoxicilina')
+        en_laboratorio = crear_producto(self.cercana, 'Jarabe', laboratorio='Amoxi Labs')
+        en_nombre = crear_producto(self.cercana, 'Amoxicilina 500mg')
+        self.assertEqual(self.ids('amoxi'), [en_nombre.id, en_laboratorio.id, en_descripcion.id])
+
+    @override_settings(BUSQUEDA_MAX_RESULTADOS=5)
+    def test_filtros_antes_del_limite(self):
+        for i in range(8):
+            crear_producto(self.lejana, f'Paracetamol {i}')
+        cercanos = [crear_producto(self.cercana, 'Paracetamol 500mg'), crear_producto(self.cercana, 'Paracetamol 1g')]
+
+        # Sin filtro el tope deja afuera a los de la farmacia cercana
+        self.assertEqual(len(self.ids('paracetamol')), 5)
+
+        resultado = resultados_busqueda('paracetamol', None, None, None, {self.cercana.id: 0.4})
+        self.assertFalse(resultado['aproximada'])
+        self.assertCountEqual(resultado['ids'], [p.id for p in cercanos])
+        self.assertEqual(resultado['facetas']['farmacia'], [(self.cercana.id, 'Farmacia Cercana', 2)])
+
+    def test_sin_tope_devuelve_todas_las_coincidencias(self):
+        for i in range(30):
+            crear_producto(self.lejana, f'Paracetamol {i}')
+        self.assertEqual(len(resultados_busqueda('paracetamol', None, None, None, None)['ids']), 30)
+
+
+class BusquedaAproximadaTests(TestCase):
+    """Búsqueda tolerante a errores de tipeo con filtros (core/trigramas.py)"""
+
+    def setUp(self):
+        # El índice vive en memoria: se rearma con los datos de cada test
+        indice_trigramas.invalidar()
+        self.addCleanup(indice_trigramas.invalidar)
+        self.cercana = crear_farmacia('Farmacia Cercana')
+        self.lejana = crear_farmacia('Farmacia Lejana', latitud=-34.60, longitud=-58.38)
+
+    @override_settings(TRIGRAMAS_MAX_RESULTADOS=5)
+    def test_filtra_farmacias_y_categoria_antes_de_limitar(self):
+        for i in range(10):
+            crear_producto(self.lejana, f'Paracetamol {i}', categoria='Analgésicos')
+        cercano = crear_producto(self.cercana, 'Paracetamol 500mg', categoria='Analgésicos')
+        crear_producto(self.cercana, 'Paracetamol Jarabe', categoria='Pediátricos')
+
+        # Sin filtros los 5 más parecidos pueden ser todos de la farmacia lejana
+        self.assertEqual(len(indice_trigramas.buscar('paracetmol')), 5)
+
+        resultado = resultados_busqueda('paracetmol', 'Analgésicos', None, None, {self.cercana.id: 0.4})
+        self.assertTrue(resultado['aproximada'])
+        self.assertEqual(list(resultado['ids']), [cercano.id])
+
+    def test_indice_sigue_los_cambios_de_farmacia(self):
+        producto = crear_producto(self.lejana, 'Amoxicilina 500mg')
+        self.assertEqual(indice_trigramas.buscar('amoxicilna', farmacias={self.cercana.id}), [])
+
+        producto.farmacia = self.cercana
+        producto.save(update_fields=['farmacia'])
+        self.assertEqual([i for i, _ in indice_trigramas.buscar('amoxicilna', farmacias={self.cercana.id})], [producto.id])
+
+
+class AutocompletarTests(TestCase):
+    """Sugerencias de nombres para la caja de búsqueda (core/autocompletar.py)"""
+
+    def setUp(self):
+        for cache in (indice_nombres, cercania_usuarios):
+            cache.invalidar()
+            self.addCleanup(cache.invalidar)
+        self.cercana = crear_farmacia('Farmacia Centro', latitud=-34.9205, longitud=-57.9536)
+        self.lejana = crear_farmacia('Farmacia City Bell', latitud=-34.8700, longitud=-58.0500)
+        self.cliente = crear_cliente(-34.9210, -57.9540)
+        self.client.force_login(self.cliente.user)
+
+    def sugerencias(self, term):
+        respuesta = self.client.get(reverse('api_autocompletar'), {'term': term})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_sugiere_solo_nombres_de_farmacias_cercanas(self):
+        crear_producto(self.cercana, 'Ibuprofeno 400mg')
+        crear_producto(self.cercana, 'Íbupro gel')
+        crear_producto(self.lejana, 'IBUPROFENO  400MG')
+        crear_producto(self.lejana, 'Ibupirac')
+        crear_producto(self.cercana, 'Paracetamol')
+
+        # Sin acentos ni mayúsculas y con el nombre tal como se cargó la primera vez
+        self.assertEqual(self.sugerencias('IBU'), ['Íbupro gel', 'Ibuprofeno 400mg'])
+        self.assertEqual(self.sugerencias('i'), [])
+        self.assertEqual(indice_nombres.sugerir('ibu'), ['Ibupirac', 'Íbupro gel', 'Ibuprofeno 400mg'])
+
+    def test_se_mantiene_al_guardar_y_borrar_productos(self):
+        producto = crear_producto(self.cercana, 'Ibuprofeno 400mg')
+        self.assertEqual(indice_nombres.sugerir('ibu'), ['Ibuprofeno 400mg'])
+
+        nuevo = crear_producto(self.lejana, 'Ibupirac')
+        producto.nombre = 'Ibuprofeno 600mg'
+        producto.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(indice_nombres.sugerir('ibu'), ['Ibupirac', 'Ibuprofeno 600mg'])
+
+        nuevo.activo = False
+        nuevo.save(update_fields=['activo'])
+        producto.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(indice_nombres.sugerir('ibu'), [])
+
+
+class BuscarProductosTests(TestCase):
+    """Vista buscar_productos: filtros, orden, facetas y paginación"""
+
+    def setUp(self):
+        for cache in (cache_busquedas, cercania_usuarios, indice_trigramas):
+            cache.invalidar()
+            self.addCleanup(cache.invalidar)
+        self.farmacia = crear_farmacia('Farmacia Centro')
+        self.cliente = crear_cliente(-34.9210, -57.9540)
+        self.client.force_login(self.cliente.user)
+
+    def buscar(self, **parametros):
+        respuesta = self.client.get(reverse('buscar_productos'), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def ids(self, **parametros):
+        return [item['producto'].id for item in self.buscar(**parametros).context['productos']]
+
+    def test_orden_desconocido_mantiene_busqueda_y_filtros(self):
+        baratos = crear_producto(self.farmacia, 'Ibuprofeno 400mg', precio_base=50, laboratorio='Bagó')
+        caros = crear_producto(self.farmacia, 'Ibuprofeno 600mg', precio_base=90, laboratorio='Bagó')
+        crear_producto(self.farmacia, 'Ibuprofeno 800mg', laboratorio='Roemmers')
+        crear_producto(self.farmacia, 'Paracetamol 500mg', laboratorio='Bagó')
+
+        relevancia = self.ids(busqueda='ibup', laboratorio='Bagó')
+        self.assertCountEqual(relevancia, [baratos.id, caros.id])
+        self.assertEqual(self.ids(busqueda='ibup', laboratorio='Bagó', orden='bogus'), relevancia)
+        self.assertEqual(self.ids(busqueda='ibup', laboratorio='Bagó', orden='precio'), [baratos.id, caros.id])
+
+    def test_paginas_ordenadas_por_distancia_y_paginadas_en_sql(self):
+        lejana = crear_farmacia('Farmacia Sur', latitud=-34.9300, longitud=-57.9536)
+        # Se cargan intercaladas para que el orden por id no coincida con el de distancia
+        cercanos, lejanos = [], []
+        for i in range(15):
+            lejanos.append(crear_producto(lejana, f'Producto {i}').id)
+            cercanos.append(crear_producto(self.farmacia, f'Producto {i}').id)
+        crear_producto(crear_farmacia('Farmacia City Bell', latitud=-34.8700, longitud=-58.0500), 'Producto lejos')
+
+        with CaptureQueriesContext(connection) as consultas:
+            paginas = [self.ids(page=numero) for numero in (1, 2, 3, 4)]
+        self.assertEqual(paginas[0] + paginas[1] + paginas[2], cercanos + lejanos)
+        self.assertEqual(len(paginas[2]), 6)
+        # Una página fuera de rango muestra la última
+        self.assertEqual(paginas[3], paginas[2])
+        self.assertTrue(any('LIMIT 12 OFFSET 12' in c['sql'] for c in consultas.captured_queries))
+        self.assertEqual(self.buscar(page=2).context['total_resultados'], 30)
+
+    def test_categoria_de_faceta_filtra_el_valor_exacto(self):
+        analgesico = crear_producto(self.farmacia, 'Ibuprofeno 400mg', categoria='Analgésicos')
+        crear_producto(self.farmacia, 'Paracetamol gotas', categoria='Analgésicos Pediátricos')
+
+        conteo = {valor: cantidad for valor, _, cantidad in contar_facetas(Producto.objects.all())['categoria']}
+        self.assertEqual(conteo['Analgésicos'], 1)
+
+        respuesta = self.buscar(categoria='Analgésicos')
+        self.assertEqual([item['producto'].id for item in respuesta.context['productos']], [analgesico.id])
+        # La categoría de la faceta sigue seleccionada en el formulario
+        self.assertContains(respuesta, '<option value="Analgésicos" selected>', html=False)
+
+
+class CacheBusquedasTests(TestCase):
+    """Cache de resultados de buscar_productos (core/cache_busqueda.py)"""
+
+    def setUp(self):
+        for cache in (cache_busquedas, cercania_usuarios, indice_trigramas):
+            cache.invalidar()
+            self.addCleanup(cache.invalidar)
+        # Dos farmacias a ~1,5 km; cada cliente está al lado de una y las dos le quedan cerca
+        self.norte = crear_farmacia('Farmacia Norte', latitud=-34.9100, longitud=-57.9500)
+        self.sur = crear_farmacia('Farmacia Sur', latitud=-34.9235, longitud=-57.9500)
+        self.en_norte = crear_producto(self.norte, 'Ibuprofeno 400mg')
+        self.en_sur = crear_producto(self.sur, 'Ibuprofeno 400mg')
+        self.cliente_norte = crear_cliente(-34.9101, -57.9500)
+        self.cliente_sur = crear_cliente(-34.9234, -57.9500)
+        # Las métricas son acumuladas: se cuentan desde acá
+        self.metricas_iniciales = cache_busquedas.metricas()
+
+    def contadores(self):
+        metricas = cache_busquedas.metricas()
+        return tuple(metricas[c] - self.metricas_iniciales[c] for c in ('aciertos', 'fallos'))
+
+    def buscar(self, cliente, **parametros):
+        self.client.force_login(cliente.user)
+        respuesta = self.client.get(reverse('buscar_productos'), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return [item['producto'].id for item in respuesta.context['productos']]
+
+    def test_clave_normaliza_texto_y_farmacias(self):
+        self.assertEqual(
+            clave_busqueda('  IBUPRÓFENO  400 ', 'Analgésicos', None, None, {2: 1.0, 1: 0.5}),
+            clave_busqueda('ibuprofeno 400', 'analgésicos', None, None, [1, 2]),
+        )
+        self.assertNotEqual(
+            clave_busqueda('ibuprofeno', 'Analgésicos', None, None, None),
+            clave_busqueda('ibuprofeno', 'analgesicos', None, None, None),
+        )
+        self.assertNotEqual(
+            clave_busqueda('ibuprofeno', None, None, None, [1, 2]),
+            clave_busqueda('ibuprofeno', None, None, None, [1]),
+        )
+
+    def test_clientes_con_las_mismas_farmacias_ven_su_propio_orden(self):
+        self.assertEqual(self.buscar(self.cliente_norte, busqueda='ibuprofeno'), [self.en_norte.id, self.en_sur.id])
+        # Misma entrada del cache, ordenada por la distancia de este cliente
+        self.assertEqual(self.buscar(self.cliente_sur, busqueda='ibuprofeno'), [self.en_sur.id, self.en_norte.id])
+        self.assertEqual(self.buscar(self.cliente_sur, categoria='venta_libre'), [self.en_sur.id, self.en_norte.id])
+        self.assertEqual(self.buscar(self.cliente_norte, categoria='venta_libre'), [self.en_norte.id, self.en_sur.id])
+        self.assertEqual(self.contadores(), (2, 2))
+
+    def test_guardar_producto_invalida_solo_su_farmacia(self):
+        lejana = crear_farmacia('Farmacia Lejana', latitud=-34.60, longitud=-58.38)
+        self.assertEqual(len(self.buscar(self.cliente_norte, busqueda='ibuprofeno')), 2)
+
+        # Un producto de una farmacia que no está cerca no toca la entrada
+        crear_producto(lejana, 'Ibuprofeno 600mg')
+        self.assertEqual(len(self.buscar(self.cliente_norte, busqueda='ibuprofeno')), 2)
+        self.assertEqual(self.contadores(), (1, 1))
+
+        nuevo = crear_producto(self.sur, 'Ibuprofeno 600mg')
+        self.assertIn(nuevo.id, self.buscar(self.cliente_norte, busqueda='ibuprofeno'))
+        self.assertEqual(self.contadores(), (1, 2))
+
+        # Desactivar un producto también lo saca de la búsqueda guardada
+        self.en_norte.activo = False
+        self.en_norte.save(update_fields=['activo'])
+        self.assertNotIn(self.en_norte.id, self.buscar(self.cliente_norte, busqueda='ibuprofeno'))
+
+    def test_pagina_ordena_solo_los_empates_que_la_tocan(self):
+        class Distancias(dict):
+            consultas = 0
+
+            def get(self, *args):
+                Distancias.consultas += 1
+                return super().get(*args)
+
+        # 10.000 resultados con puntajes distintos salvo un tramo de empates en las posiciones 8 a 15
+        filas = [(i, i % 7, float(i)) for i in range(10000)]
+        filas[8:16] = [(i, i % 7, 8.0) for i in range(8, 16)]
+        distancias = Distancias({farmacia: 7 - farmacia for farmacia in range(7)})
+        ids = IdsPorDistancia(filas_a_resultado(filas), distancias)
+
+        esperado = [fila[0] for fila in sorted(filas, key=lambda f: (f[2], distancias[f[1]], f[0]))]
+        self.assertEqual(ids[:12], esperado[:12])
+        self.assertLessEqual(Distancias.consultas, 16)
+        self.assertEqual(ids[12:24], esperado[12:24])
+        self.assertEqual(len(ids), 10000)
+        self.assertEqual(list(ids), esperado)
+
+    def test_pagina_sin_texto_se_arma_en_sql(self):
+        def consultas_primera_pagina(cantidad):
+            Producto.objects.bulk_create(
+                Producto(farmacia=self.norte, nombre=f'Producto {i}', precio_base=100, stock_disponible=5)
+                for i in range(cantidad)
+            )
+            cache_busquedas.invalidar()
+            self.buscar(self.cliente_norte)
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(len(self.buscar(self.cliente_norte)), 12)
+            return [c['sql'] for c in consultas.captured_queries]
+
+        pocas = consultas_primera_pagina(20)
+        muchas = consultas_primera_pagina(500)
+        self.assertEqual(len(pocas), len(muchas))
+        # Los ids salen de la base de a una página, nunca el catálogo entero
+        self.assertTrue(any('LIMIT 12' in sql for sql in muchas))
+
+    def test_cambio_de_precio_o_stock_reordena_sin_invalidar(self):
+        self.en_norte.precio_base = 80
+        self.en_norte.save(update_fields=['precio_base'])
+        self.assertEqual(self.buscar(self.cliente_sur, busqueda='ibuprofeno', orden='precio'), [self.en_norte.id, self.en_sur.id])
+
+        # Sin stock va al final aunque sea el más barato, con la misma entrada del cache
+        self.en_norte.stock_disponible = 0
+        self.en_norte.save(update_fields=['stock_disponible'])
+        self.assertEqual(self.buscar(self.cliente_sur, busqueda='ibuprofeno', orden='precio'), [self.en_sur.id, self.en_norte.id])
+        self.assertEqual(self.contadores(), (1, 1))
+
+
+class CatalogoProductosTests(TestCase):
+    """Catálogo por código de barras (ProductoCatalogo, Producto.save y ProductoForm)"""
+
+    def setUp(self):
+        self.centro = crear_farmacia('Farmacia Centro')
+        self.norte = crear_farmacia('Farmacia Norte')
+
+    def test_productos_con_el_mismo_codigo_comparten_catalogo(self):
+        en_centro = crear_producto(self.centro, 'Ibuprofeno 400mg', codigo_barras='7790001', laboratorio='Bagó')
+        en_norte = crear_producto(self.norte, 'IBUPROFENO 400', codigo_barras='7790001')
+        sin_codigo = crear_producto(self.centro, 'Alcohol en gel')
+
+        self.assertEqual(en_centro.catalogo, en_norte.catalogo)
+        # La entrada se crea con los datos del primer producto que tiene el código
+        self.assertEqual((en_centro.catalogo.nombre, en_centro.catalogo.laboratorio), ('Ibuprofeno 400mg', 'Bagó'))
+        self.assertIsNone(sin_codigo.catalogo)
+
+        en_norte.codigo_barras = '7790002'
+        en_norte.save(update_fields=['codigo_barras'])
+        en_norte.refresh_from_db()
+        self.assertEqual(en_norte.catalogo.codigo_barras, '7790002')
+        self.assertEqual(ProductoCatalogo.objects.count(), 2)
+        en_norte.codigo_barras = ''
+        en_norte.save()
+        self.assertIsNone(en_norte.catalogo)
+
+    def test_codigo_unico_por_farmacia(self):
+        crear_producto(self.centro, 'Ibuprofeno 400mg', codigo_barras='7790001')
+        crear_producto(self.norte, 'Ibuprofeno 400mg', codigo_barras='7790001')
+        # Sin código de barras se pueden repetir
+        crear_producto(self.centro, 'Alcohol en gel')
+        crear_producto(self.centro, 'Algodón')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            crear_producto(self.centro, 'Ibuprofeno 400mg (otro)', codigo_barras='7790001')
+
+    def test_formulario_rechaza_un_codigo_repetido_en_la_farmacia(self):
+        existente = crear_producto(self.centro, 'Ibuprofeno 400mg', codigo_barras='7790001')
+        datos = {'nombre': 'Ibuprofeno 600mg', 'precio_base': '120', 'codigo_barras': ' 7790001 ', 'stock_disponible': '5'}
+
+        formulario = ProductoForm(datos, farmacia=self.centro)
+        self.assertFalse(formulario.is_valid())
+        self.assertIn('codigo_barras', formulario.errors)
+        # En otra farmacia, o editando el mismo producto, el código es válido
+        self.assertTrue(ProductoForm(datos, farmacia=self.norte).is_valid())
+        formulario = ProductoForm(datos, instance=existente)
+        self.assertTrue(formulario.is_valid())
+        self.assertEqual(formulario.cleaned_data['codigo_barras'], '7790001')
+
+
+class MigracionCatalogoTests(TransactionTestCase):
+    """Migración 0019_catalogo_productos: arma el catálogo y conserva el índice de texto completo"""
+
+    def tearDown(self):
+        migrar(ultima_migracion())
+
+    def triggers_fts(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'core_producto_fts_%'")
+            return {fila[0] for fila in cursor.fetchall()}
+
+    def test_arma_el_catalogo_y_se_puede_revertir(self):
+        apps = migrar('0018_producto_fts')
+        direccion = apps.get_model('core', 'Direccion').objects.create(
+            calle='7', numero='1000', ciudad='La Plata', provincia='Buenos Aires', codigo_postal='1900',
+        )
+        farmacia = apps.get_model('core', 'Farmacia').objects.create(
+            user_id=apps.get_model('auth', 'User').objects.create(username='farmacia').id,
+            nombre='Farmacia Centro', direccion=direccion, matricula='MP1', cuit='30000000001',
+            telefono='221', email_contacto='f@example.com', horario_apertura=time(8), horario_cierre=time(20),
+        )
+        ProductoHistorico = apps.get_model('core', 'Producto')
+        ibuprofeno = ProductoHistorico.objects.create(
+            farmacia=farmacia, nombre='Ibuprofeno', precio_base=100, codigo_barras='7790001', laboratorio='Bagó',
+        )
+        ProductoHistorico.objects.create(farmacia=farmacia, nombre='Paracetamol', precio_base=80, codigo_barras='7790002')
+        sin_codigo = ProductoHistorico.objects.create(farmacia=farmacia, nombre='Alcohol en gel', precio_base=50)
+        triggers = self.triggers_fts()
+        self.assertEqual(len(triggers), 3)
+
+        apps = migrar('0019_catalogo_productos')
+        ProductoHistorico = apps.get_model('core', 'Producto')
+        catalogo = dict(apps.get_model('core', 'ProductoCatalogo').objects.values_list('codigo_barras', 'laboratorio'))
+        self.assertEqual(catalogo, {'7790001': 'Bagó', '7790002': ''})
+        self.assertEqual(ProductoHistorico.objects.get(id=ibuprofeno.id).catalogo.codigo_barras, '7790001')
+        self.assertIsNone(ProductoHistorico.objects.get(id=sin_codigo.id).catalogo)
+        # Rehacer core_producto no se llevó los triggers: un producto nuevo entra al índice
+        self.assertEqual(self.triggers_fts(), triggers)
+        nuevo = ProductoHistorico.objects.create(
+            farmacia_id=farmacia.id, nombre='Amoxicilina', precio_base=90, codigo_barras='7790003',
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid FROM core_producto_fts WHERE core_producto_fts MATCH 'amoxicilina'")
+            self.assertEqual(cursor.fetchall(), [(nuevo.id,)])
+
+        # Antes de 0019 el código era único en toda la tabla (también el vacío)
+        apps = migrar('0018_producto_fts')
+        self.assertEqual(apps.get_model('core', 'Producto').objects.count(), 4)
+        self.assertEqual(self.triggers_fts(), triggers)
+
+
+class BusquedaPorCodigoTests(TestCase):
+    """Búsqueda por código de barras, de a uno o en lote (core/catalogo.py)"""
+
+    def setUp(self):
+        cercania_usuarios.invalidar()
+        self.addCleanup(cercania_usuarios.invalidar)
+        self.centro = crear_farmacia('Farmacia Centro', latitud=-34.9205, longitud=-57.9536)
+        self.sur = crear_farmacia('Farmacia Sur', latitud=-34.9250, longitud=-57.9536)
+        self.lejana = crear_farmacia('Farmacia City Bell', latitud=-34.8700, longitud=-58.0500)
+        self.en_centro = crear_producto(self.centro, 'Ibuprofeno 400mg', codigo_barras='7790001', precio_base=100)
+        self.en_sur = crear_producto(self.sur, 'Ibuprofeno 400', codigo_barras='7790001', precio_base=120)
+        self.en_lejana = crear_producto(self.lejana, 'Ibuprofeno', codigo_barras='7790001', precio_base=50)
+        crear_producto(self.lejana, 'Amoxicilina 500mg', codigo_barras='7790002')
+        # Con la obra social del cliente el de Farmacia Sur queda más barato
+        obra_social = ObraSocial.objects.create(nombre='OSDE', plan='210')
+        DescuentoObraSocial.objects.create(producto=self.en_sur, obra_social=obra_social, descuento_porcentaje=30)
+        self.cliente = crear_cliente(-34.9210, -57.9540)
+        self.cliente.obra_social = obra_social
+        self.cliente.save()
+
+    def por_codigos(self, cuerpo):
+        return self.client.post(reverse('api_productos_por_codigos'), cuerpo, content_type='application/json')
+
+    def test_cliente_ve_las_ofertas_cercanas_con_su_precio(self):
+        self.client.force_login(self.cliente.user)
+        respuesta = self.client.get(reverse('api_producto_por_codigo', args=['7790001']))
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(datos['producto']['nombre'], 'Ibuprofeno 400mg')
+        self.assertEqual([(o['producto_id'], o['precio_final']) for o in datos['ofertas']],
+                         [(self.en_sur.id, 84.0), (self.en_centro.id, 100.0)])
+        self.assertTrue(all(o['distancia'] is not None and 'propia' not in o for o in datos['ofertas']))
+        # Solo lo vende una farmacia fuera de su alcance
+        self.assertEqual(self.client.get(reverse('api_producto_por_codigo', args=['7790002'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_producto_por_codigo', args=['0000000'])).status_code, 404)
+
+    def test_farmacia_ve_todas_las_ofertas_y_la_propia(self):
+        self.client.force_login(self.centro.user)
+        ofertas = self.client.get(reverse('api_producto_por_codigo', args=['7790001'])).json()['ofertas']
+        self.assertEqual([(o['producto_id'], o['precio_final'], o['propia']) for o in ofertas], [
+            (self.en_lejana.id, 50.0, False), (self.en_centro.id, 100.0, True), (self.en_sur.id, 120.0, False),
+        ])
+        self.assertTrue(all('distancia' not in o for o in ofertas))
+
+    def test_lote_de_codigos(self):
+        self.client.force_login(self.centro.user)
+        datos = self.por_codigos({'codigos': ['7790001', ' 7790002 ', '7790001', '0000000']}).json()
+        self.assertEqual(set(datos['productos']), {'7790001', '7790002'})
+        self.assertEqual(datos['no_encontrados'], ['0000000'])
+
+        for cuerpo in ('no es json', {'codigos': '7790001'}, {'codigos': ['7790001', '  ']}, {'codigos': [7790001]}):
+            self.assertEqual(self.por_codigos(cuerpo).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_productos_por_codigos')).status_code, 405)
+        with override_settings(CATALOGO_MAX_CODIGOS_LOTE=2):
+            self.assertEqual(self.por_codigos({'codigos': ['1', '2']}).status_code, 200)
+            self.assertEqual(self.por_codigos({'codigos': ['1', '2', '3']}).status_code, 400)
+
+
+class PreciosObraSocialTests(TestCase):
+    """Tabla de precios finales por obra social (PrecioObraSocial, core/signals.py)"""
+
+    def setUp(self):
+        self.farmacia = crear_farmacia('Farmacia Centro')
+        self.obra_social = ObraSocial.objects.create(nombre='OSDE', plan='210')
+        self.producto = crear_producto(self.farmacia, 'Ibuprofeno 400mg', precio_base=Decimal('200.00'))
+
+    def precio(self):
+        return PrecioObraSocial.objects.filter(producto=self.producto, obra_social=self.obra_social).values_list(
+            'precio_final', flat=True,
+        ).first()
+
+    def test_senales_mantienen_la_tabla(self):
+        descuento = DescuentoObraSocial.objects.create(
+            producto=self.producto, obra_social=self.obra_social, descuento_porcentaje=25,
+        )
+        self.assertEqual(self.precio(), Decimal('150.00'))
+
+        descuento.descuento_porcentaje = 0
+        descuento.descuento_fijo = 30
+        descuento.save()
+        self.assertEqual(self.precio(), Decimal('170.00'))
+
+        self.producto.precio_base = Decimal('100.00')
+        self.producto.save(update_fields=['precio_base'])
+        self.assertEqual(self.precio(), Decimal('70.00'))
+
+        descuento.activo = False
+        descuento.save()
+        self.assertIsNone(self.precio())
+        descuento.activo = True
+        descuento.save()
+        descuento.delete()
+        self.assertIsNone(self.precio())
+
+    def test_recalcular_precios_despues_de_update(self):
+        DescuentoObraSocial.objects.create(producto=self.producto, obra_social=self.obra_social, descuento_porcentaje=10)
+        # QuerySet.update() no pasa por las señales
+        Producto.objects.filter(id=self.producto.id).update(precio_base=Decimal('300.00'))
+        self.assertEqual(self.precio(), Decimal('180.00'))
+        call_command('recalcular_precios', producto=[self.producto.id], stdout=io.StringIO())
+        self.assertEqual(self.precio(), Decimal('270.00'))
+
+    def test_ofertas_ordenadas_por_precio_final(self):
+        otra = crear_farmacia('Farmacia Norte')
+        self.producto.codigo_barras = '7790001000011'
+        self.producto.save()
+        barata_sin_descuento = crear_producto(otra, 'Ibuprofeno 400mg', precio_base=Decimal('180.00'),
+                                              codigo_barras='7790001000011')
+        DescuentoObraSocial.objects.create(producto=self.producto, obra_social=self.obra_social, descuento_porcentaje=50)
+        catalogo = ProductoCatalogo.objects.get(codigo_barras='7790001000011')
+
+        self.assertEqual(list(catalogo.ofertas_disponibles()), [barata_sin_descuento, self.producto])
+        ofertas = list(catalogo.ofertas_disponibles(obra_social_id=self.obra_social.id))
+        self.assertEqual(ofertas, [self.producto, barata_sin_descuento])
+        self.assertEqual(ofertas[0].precio_final, Decimal('100.00'))
+
+
+class MigracionPreciosTests(TransactionTestCase):
+    """Migración 0020_precios_obra_social: arma la tabla con los descuentos existentes"""
+
+    def tearDown(self):
+        migrar(ultima_migracion())
+
+    def test_calcula_los_precios_existentes(self):
+        apps = migrar('0019_catalogo_productos')
+        direccion = apps.get_model('core', 'Direccion').objects.create(
+            calle='7', numero='1000', ciudad='La Plata', provincia='Buenos Aires', codigo_postal='1900',
+        )
+        farmacia = apps.get_model('core', 'Farmacia').objects.create(
+            user_id=apps.get_model('auth', 'User').objects.create(username='farmacia').id,
+            nombre='Farmacia Centro', direccion=direccion, matricula='MP1', cuit='30000000001',
+            telefono='221', email_contacto='f@example.com', horario_apertura=time(8), horario_cierre=time(20),
+        )
+        producto = apps.get_model('core', 'Producto').objects.create(
+            farmacia=farmacia, nombre='Ibuprofeno', precio_base=Decimal('200.00'),
+        )
+        ObraSocialHistorica = apps.get_model('core', 'ObraSocial')
+        porcentaje = ObraSocialHistorica.objects.create(nombre='OSDE', plan='210')
+        fijo = ObraSocialHistorica.objects.create(nombre='IOMA', plan='Único')
+        inactiva = ObraSocialHistorica.objects.create(nombre='PAMI', plan='Único')
+        Descuento = apps.get_model('core', 'DescuentoObraSocial')
+        Descuento.objects.create(producto=producto, obra_social=porcentaje, descuento_porcentaje=15)
+        Descuento.objects.create(producto=producto, obra_social=fijo, descuento_fijo=50)
+        Descuento.objects.create(producto=producto, obra_social=inactiva, descuento_porcentaje=90, activo=False)
+
+        apps = migrar('0020_precios_obra_social')
+        precios = dict(apps.get_model('core', 'PrecioObraSocial').objects.values_list('obra_social_id', 'precio_final'))
+        self.assertEqual(precios, {porcentaje.id: Decimal('170.00'), fijo.id: Decimal('150.00')})
@@ -0,0 +1,183 @@
+"""
+Búsqueda aproximada de productos por trigramas (tolera errores de tipeo).
+
+Se indexan las palabras de Producto.nombre y Producto.laboratorio: cada
+palabra se parte en trigramas ("  ibu", " ib", "ibu", "bup", ...) y se guarda
+qué palabras tienen cada trigrama y qué productos tienen cada palabra.
+
+Para una búsqueda, cada palabra buscada se compara contra el vocabulario
+(similitud de Jaccard entre conjuntos de trigramas, contando solo las
+palabras que comparten algún trigrama) y el puntaje de un producto es el
+promedio, sobre las palabras buscadas, de la mejor similitud entre sus
+palabras. Así "amoxicilna" encuentra "Amoxicilina" e "ibupirak" encuentra
+"Ibupirac". El índice sabe la farmacia de cada producto, así la búsqueda se
+puede limitar a las farmacias cercanas antes de quedarse con los mejores.
+
+El índice vive en memoria: se arma en la primera búsqueda y se actualiza al
+guardar o borrar un producto (ver core/signals.py). Cada TRIGRAMAS_TTL
+segundos se rearma completo para tomar cambios de otros procesos o de
+QuerySet.update().
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Producto
+
+_PATRON_PALABRA = re.compile(r'[a-z0-9]+')
+
+
+def _configuracion():
+    return {
+        'umbral': getattr(settings, 'TRIGRAMAS_UMBRAL', 0.25),
+        'ttl': getattr(settings, 'TRIGRAMAS_TTL', 600),
+        'max_resultados': getattr(settings, 'TRIGRAMAS_MAX_RESULTADOS', 50),
+    }
+
+
+def max_resultados_aproximados():
+    return _configuracion()['max_resultados']
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def palabras_de(*textos):
+    return {palabra for texto in textos for palabra in _PATRON_PALABRA.findall(normalizar(texto))}
+
+
+def trigramas(palabra):
+    """Trigramas de una palabra con relleno al inicio y al final (como pg_trgm)"""
+    relleno = f"  {palabra} "
+    return frozenset(relleno[i:i + 3] for i in range(len(relleno) - 2))
+
+
+class IndiceTrigramas:
+    """Vocabulario de nombres y laboratorios con sus trigramas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._armado = None
+        self._palabras_de_producto = {}
+        self._farmacia_de_producto = {}
+        self._productos_de_palabra = defaultdict(set)
+        self._trigramas_de_palabra = {}
+        self._palabras_de_trigrama = defaultdict(set)
+
+    def _agregar(self, producto_id, palabras, farmacia_id):
+        self._palabras_de_producto[producto_id] = palabras
+        self._farmacia_de_producto[producto_id] = farmacia_id
+        for palabra in palabras:
+            self._productos_de_palabra[palabra].add(producto_id)
+            if palabra not in self._trigramas_de_palabra:
+                tri = trigramas(palabra)
+                self._trigramas_de_palabra[palabra] = tri
+                for t in tri:
+                    self._palabras_de_trigrama[t].add(palabra)
+
+    def _quitar(self, producto_id):
+        self._farmacia_de_producto.pop(producto_id, None)
+        for palabra in self._palabras_de_producto.pop(producto_id, ()):
+            productos = self._productos_de_palabra[palabra]
+            productos.discard(producto_id)
+            if not productos:
+                # La palabra ya no está en ningún producto: sale del vocabulario
+                del self._productos_de_palabra[palabra]
+                for t in self._trigramas_de_palabra.pop(palabra, ()):
+                    self._palabras_de_trigrama[t].discard(palabra)
+                    if not self._palabras_de_trigrama[t]:
+                        del self._palabras_de_trigrama[t]
+
+    def _armar_si_vencido(self):
+        # Se llama con el lock tomado
+        if self._armado is not None and time.monotonic() - self._armado < _configuracion()['ttl']:
+            return
+        self._palabras_de_producto = {}
+        self._farmacia_de_producto = {}
+        self._productos_de_palabra = defaultdict(set)
+        self._trigramas_de_palabra = {}
+        self._palabras_de_trigrama = defaultdict(set)
+        for producto_id, nombre, laboratorio, farmacia_id in Producto.objects.filter(activo=True).values_list(
+            'id', 'nombre', 'laboratorio', 'farmacia_id'
+        ).iterator(chunk_size=2000):
+            self._agregar(producto_id, palabras_de(nombre, laboratorio), farmacia_id)
+        self._armado = time.monotonic()
+
+    def actualizar(self, producto):
+        """Reindexa un producto después de guardarlo (no hace nada si el índice no está armado)"""
+        with self._lock:
+            if self._armado is None:
+                return
+            self._quitar(producto.id)
+            if producto.activo:
+                self._agregar(producto.id, palabras_de(producto.nombre, producto.laboratorio), producto.farmacia_id)
+
+    def quitar(self, producto_id):
+        with self._lock:
+            if self._armado is not None:
+                self._quitar(producto_id)
+
+    def invalidar(self):
+        with self._lock:
+            self._armado = None
+
+    def _palabras_parecidas(self, palabra, umbral):
+        """{palabra del vocabulario: similitud} para las que superan el umbral"""
+        buscados = trigramas(palabra)
+        compartidos = defaultdict(int)
+        for t in buscados:
+            for candidata in self._palabras_de_trigrama.get(t, ()):
+                compartidos[candidata] += 1
+        parecidas = {}
+        for candidata, comunes in compartidos.items():
+            similitud = comunes / (len(buscados) + len(self._trigramas_de_palabra[candidata]) - comunes)
+            if similitud >= umbral:
+                parecidas[candidata] = similitud
+        return parecidas
+
+    def buscar(self, texto, limite=None, farmacias=None):
+        """
+        [(producto_id, puntaje)] de los productos más parecidos al texto, de
+        mayor a menor puntaje. `farmacias` (ids) descarta los productos de
+        otras farmacias antes de limitar; `limite` None = TRIGRAMAS_MAX_RESULTADOS
+        y 0 = sin límite (para filtrar después por otros campos).
+        """
+        config = _configuracion()
+        umbral = config['umbral']
+        if limite is None:
+            limite = config['max_resultados']
+        buscadas = palabras_de(texto)
+        if not buscadas:
+            return []
+
+        with self._lock:
+            self._armar_si_vencido()
+            puntajes = defaultdict(float)
+            for palabra in buscadas:
+                mejor_por_producto = {}
+                for parecida, similitud in self._palabras_parecidas(palabra, umbral).items():
+                    for producto_id in self._productos_de_palabra[parecida]:
+                        if farmacias is not None and self._farmacia_de_producto[producto_id] not in farmacias:
+                            continue
+                        if similitud > mejor_por_producto.get(producto_id, 0):
+                            mejor_por_producto[producto_id] = similitud
+                for producto_id, similitud in mejor_por_producto.items():
+                    puntajes[producto_id] += similitud
+
+        resultados = [
+            (producto_id, total / len(buscadas))
+            for producto_id, total in puntajes.items()
+            if total / len(buscadas) >= umbral
+        ]
+        resultados.sort(key=lambda r: (-r[1], r[0]))
+        return resultados[:limite] if limite else resultados
+
+
+indice_trigramas = IndiceTrigramas()
@@ -0,0 +1,299 @@
+"""
+Ingesta de ubicaciones de repartidores con escritura diferida.
+
+Cada ping de GPS se guarda en memoria y se vuelca a la base en lotes (un
+bulk_update con solo los campos de ubicación) cada pocos segundos o cuando se
+acumulan muchos pings. Así miles de repartidores enviando su posición no
+generan una escritura completa de fila por ping. Las vistas del propio
+repartidor superponen su ubicación pendiente (BufferUbicaciones.aplicar) para
+no trabajar con una posición de hasta un intervalo de volcado de atraso.
+
+La cantidad de pedidos cercanos que se devuelve en cada ping se calcula sobre
+una grilla en memoria de los pedidos disponibles, que se refresca cada pocos
+segundos (o antes, cuando un pedido cambia de estado o de repartidor) en vez
+de recorrer la tabla de pedidos en cada ping.
+
+Los repartidores con mala conexión pueden subir varios puntos juntos
+(registrar_lote): todos van al historial en un solo bulk_create y solo el más
+reciente pasa a ser la ubicación actual.
+
+Además, todos los puntos se agregan al almacén de recorridos (core/recorridos.py)
+para poder reproducir después el trayecto de una entrega.
+"""
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .distancias import distancias_km
+from .geo import (
+    caja_de_poligono, celda_para, celdas_en_caja, celdas_en_radio, punto_en_poligono, radio_reparto_km,
+)
+from .models import EstadoPedido, Pedido, Repartidor, UbicacionRepartidor
+from .recorridos import almacen_recorridos
+
+
+def _configuracion():
+    return {
+        'intervalo_volcado': getattr(settings, 'UBICACIONES_INTERVALO_VOLCADO', 5),
+        'max_pendientes': getattr(settings, 'UBICACIONES_MAX_PENDIENTES', 500),
+        'ttl_pedidos': getattr(settings, 'UBICACIONES_TTL_PEDIDOS', 10),
+        'max_puntos_lote': getattr(settings, 'UBICACIONES_MAX_PUNTOS_LOTE', 1000),
+        'max_dias_atraso': getattr(settings, 'UBICACIONES_MAX_DIAS_ATRASO', 7),
+    }
+
+
+class BufferUbicaciones:
+    """Últimas ubicaciones recibidas por repartidor, pendientes de guardar en la base"""
+
+    def __init__(self):
+        self._pendientes = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def registrar(self, repartidor_id, latitud, longitud, momento=None):
+        """Guarda la ubicación en memoria; se escribe en la base en el próximo volcado"""
+        config = _configuracion()
+        momento = momento or timezone.now()
+        with self._lock:
+            anterior = self._pendientes.get(repartidor_id)
+            # Un punto atrasado (subido tarde) no pisa uno más nuevo
+            if anterior is None or anterior[2] <= momento:
+                self._pendientes[repartidor_id] = (latitud, longitud, momento)
+            lleno = len(self._pendientes) >= config['max_pendientes']
+            if not lleno and self._timer is None:
+                self._timer = threading.Timer(config['intervalo_volcado'], self._volcar_desde_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if lleno:
+            self.volcar()
+
+    def pendiente(self, repartidor_id):
+        """(latitud, longitud, momento) aún no guardada para un repartidor, o None"""
+        with self._lock:
+            return self._pendientes.get(repartidor_id)
+
+    def aplicar(self, repartidor):
+        """Pasa al repartidor (leído de la base) su ubicación pendiente, si es más nueva"""
+        pendiente = self.pendiente(repartidor.id)
+        if pendiente is None:
+            return repartidor
+        latitud, longitud, momento = pendiente
+        ultima = repartidor.ultima_actualizacion_ubicacion
+        if ultima is None or momento >= ultima:
+            repartidor.latitud_actual = latitud
+            repartidor.longitud_actual = longitud
+            repartidor.ultima_actualizacion_ubicacion = momento
+        return repartidor
+
+    def volcar(self):
+        """Escribe en la base todas las ubicaciones pendientes; retorna cuántas escribió"""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pendientes:
+            return 0
+
+        # Los repartidores con ubicación fija conservan la celda de esa ubicación
+        con_ubicacion_fija = set(
+            Repartidor.objects.filter(
+                id__in=pendientes, ubicacion_fija=True,
+                latitud_fija__isnull=False, longitud_fija__isnull=False,
+            ).values_list('id', flat=True)
+        )
+        con_gps, fijos = [], []
+        for repartidor_id, (latitud, longitud, momento) in pendientes.items():
+            repartidor = Repartidor(
+                id=repartidor_id,
+                latitud_actual=latitud,
+                longitud_actual=longitud,
+                ultima_actualizacion_ubicacion=momento,
+                celda_geo=celda_para(latitud, longitud),
+            )
+            (fijos if repartidor_id in con_ubicacion_fija else con_gps).append(repartidor)
+
+        campos = ['latitud_actual', 'longitud_actual', 'ultima_actualizacion_ubicacion']
+        Repartidor.objects.bulk_update(con_gps, campos + ['celda_geo'], batch_size=500)
+        Repartidor.objects.bulk_update(fijos, campos, batch_size=500)
+        return len(pendientes)
+
+    def _volcar_desde_timer(self):
+        try:
+            self.volcar()
+        finally:
+            # El timer corre en su propio hilo, con su propia conexión
+            connection.close()
+
+
+class GrillaPedidos:
+    """Coordenadas de los pedidos disponibles agrupadas por celda, refrescadas cada pocos segundos"""
+
+    def __init__(self):
+        self._celdas = {}
+        self._actualizada = None
+        self._lock = threading.Lock()
+
+    def _refrescar_si_vencida(self):
+        ttl = _configuracion()['ttl_pedidos']
+        with self._lock:
+            if self._actualizada is not None and time.monotonic() - self._actualizada < ttl:
+                return self._celdas
+            celdas = {}
+            coordenadas = Pedido.objects.filter(
+                estado__in=[EstadoPedido.LISTO, EstadoPedido.EN_CAMINO],
+                repartidor__isnull=True,
+                direccion_entrega__latitud__isnull=False,
+                direccion_entrega__longitud__isnull=False,
+            ).values_list('direccion_entrega__latitud', 'direccion_entrega__longitud')
+            for latitud, longitud in coordenadas:
+                celdas.setdefault(celda_para(latitud, longitud), []).append((float(latitud), float(longitud)))
+            self._celdas = celdas
+            self._actualizada = time.monotonic()
+            return celdas
+
+    def invalidar(self):
+        with self._lock:
+            self._actualizada = None
+
+    def contar_cercanos(self, latitud, longitud, radio_km=None, poligono=None):
+        """
+        Cantidad de pedidos disponibles dentro del radio (por defecto
+        RADIO_REPARTO_POR_DEFECTO_KM), o dentro del polígono si se indica
+        (mismo criterio que Repartidor.pedidos_cercanos)
+        """
+        if radio_km is None:
+            radio_km = radio_reparto_km()
+        celdas = self._refrescar_si_vencida()
+        candidatos = []
+        if poligono:
+            for celda in celdas_en_caja(*caja_de_poligono(poligono)):
+                candidatos.extend(celdas.get(celda, ()))
+            return sum(1 for c in candidatos if punto_en_poligono(c[0], c[1], poligono))
+        for celda in celdas_en_radio(latitud, longitud, radio_km):
+            candidatos.extend(celdas.get(celda, ()))
+        if not candidatos:
+            return 0
+        distancias = distancias_km(latitud, longitud, [c[0] for c in candidatos], [c[1] for c in candidatos])
+        return sum(1 for distancia in distancias if distancia <= radio_km)
+
+
+buffer_ubicaciones = BufferUbicaciones()
+grilla_pedidos = GrillaPedidos()
+
+# No perder las últimas ubicaciones al apagar el proceso
+atexit.register(buffer_ubicaciones.volcar)
+
+
+def registrar_ubicacion(repartidor, latitud, longitud):
+    """
+    Registra un ping de GPS y retorna la cantidad de pedidos cercanos a la
+    ubicación con la que busca el repartidor (la fija, si la tiene habilitada).
+    """
+    momento = timezone.now()
+    buffer_ubicaciones.registrar(repartidor.id, latitud, longitud, momento)
+    almacen_recorridos.agregar([(repartidor.id, latitud, longitud, momento)])
+
+    repartidor.latitud_actual = latitud
+    repartidor.longitud_actual = longitud
+    ubicacion = repartidor.ubicacion_para_busqueda()
+    if ubicacion is None:
+        return 0
+    return grilla_pedidos.contar_cercanos(ubicacion[0], ubicacion[1], poligono=repartidor.zona_poligono)
+
+
+def _leer_momento(valor):
+    """Acepta fecha ISO 8601 o segundos desde epoch; retorna un datetime con zona horaria o None"""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        try:
+            return datetime.fromtimestamp(valor, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            return None
+    if not isinstance(valor, str):
+        return None
+    try:
+        momento = parse_datetime(valor)
+    except ValueError:
+        return None
+    if momento is not None and timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
+
+
+def validar_puntos(puntos):
+    """
+    Valida en una sola pasada una lista de puntos {'latitud', 'longitud', 'timestamp'}.
+    Retorna (puntos_validos, errores); cada punto válido es (latitud, longitud, momento).
+    """
+    if not isinstance(puntos, list) or not puntos:
+        return [], [{'indice': None, 'error': 'Se esperaba una lista de puntos no vacía'}]
+    config = _configuracion()
+    maximo = config['max_puntos_lote']
+    if len(puntos) > maximo:
+        return [], [{'indice': None, 'error': f'Se aceptan como máximo {maximo} puntos por envío'}]
+
+    # Tolerancia para relojes de celulares algo adelantados; hacia atrás se
+    # aceptan puntos atrasados unos días (el almacén de recorridos además no
+    # puede guardar fechas anteriores a 1970)
+    ahora = timezone.now()
+    limite_futuro = ahora + timedelta(minutes=5)
+    limite_pasado = ahora - timedelta(days=config['max_dias_atraso'])
+    validos, errores = [], []
+    for indice, punto in enumerate(puntos):
+        if not isinstance(punto, dict):
+            errores.append({'indice': indice, 'error': 'Punto inválido'})
+            continue
+        try:
+            latitud = float(punto.get('latitud'))
+            longitud = float(punto.get('longitud'))
+        except (TypeError, ValueError):
+            errores.append({'indice': indice, 'error': 'Coordenadas inválidas'})
+            continue
+        if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+            errores.append({'indice': indice, 'error': 'Coordenadas fuera de rango'})
+            continue
+        momento = _leer_momento(punto.get('timestamp'))
+        if momento is None:
+            errores.append({'indice': indice, 'error': 'Timestamp inválido'})
+            continue
+        if momento > limite_futuro:
+            errores.append({'indice': indice, 'error': 'Timestamp en el futuro'})
+            continue
+        if momento < limite_pasado:
+            errores.append({'indice': indice, 'error': 'Timestamp demasiado antiguo'})
+            continue
+        validos.append((latitud, longitud, momento))
+    return validos, errores
+
+
+def registrar_lote(repartidor, puntos):
+    """
+    Guarda puntos ya validados: todos al historial en un bulk_create y el más
+    reciente como ubicación actual (si es más nuevo que la que ya tenemos).
+    Retorna la cantidad de pedidos cercanos, como registrar_ubicacion().
+    """
+    # Varios INSERT (batch_size): o se guardan todos o ninguno
+    with transaction.atomic():
+        UbicacionRepartidor.objects.bulk_create([
+            UbicacionRepartidor(repartidor_id=repartidor.id, latitud=latitud, longitud=longitud, fecha=momento)
+            for latitud, longitud, momento in puntos
+        ], batch_size=500)
+    almacen_recorridos.agregar([(repartidor.id, latitud, longitud, momento) for latitud, longitud, momento in puntos])
+
+    latitud, longitud, momento = max(puntos, key=lambda punto: punto[2])
+    ultima = repartidor.ultima_actualizacion_ubicacion
+    if ultima is None or momento >= ultima:
+        buffer_ubicaciones.registrar(repartidor.id, latitud, longitud, momento)
+        repartidor.latitud_actual = latitud
+        repartidor.longitud_actual = longitud
+
+    ubicacion = repartidor.ubicacion_para_busqueda()
+    if ubicacion is None:
+        return 0
+    return grilla_pedidos.contar_cercanos(ubicacion[0], ubicacion[1], poligono=repartidor.zona_poligono)
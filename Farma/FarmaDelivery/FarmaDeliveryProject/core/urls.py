@@ -32,8 +32,13 @@ urlpatterns = [
     path('accounts/signup/repartidor/', views.repartidor_signup, name='repartidor_signup'),
 
     # API endpoints
+    path('api/autocompletar/', views.api_autocompletar, name='api_autocompletar'),
+    path('api/busqueda/metricas/', views.api_metricas_busqueda, name='api_metricas_busqueda'),
+    path('api/productos/por-codigo/', views.api_productos_por_codigos, name='api_productos_por_codigos'),
+    path('api/productos/por-codigo/<str:codigo>/', views.api_producto_por_codigo, name='api_producto_por_codigo'),
     path('api/geocodificar/', views.geocodificar_direccion, name='geocodificar_direccion'),
     path('api/ubicacion/', views.actualizar_ubicacion_repartidor, name='actualizar_ubicacion_repartidor'),
+    path('api/ubicacion/lote/', views.actualizar_ubicacion_lote, name='actualizar_ubicacion_lote'),
     path('api/pedidos-disponibles/', views.api_pedidos_disponibles, name='api_pedidos_disponibles'),
     path('api/pedidos-activos/', views.api_pedidos_activos, name='api_pedidos_activos'),
 
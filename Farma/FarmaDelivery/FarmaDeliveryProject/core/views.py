@@ -13,19 +13,39 @@ from django.db import transaction
 from django.core.paginator import Paginator
 import uuid
 import os
-from datetime import datetime, timedelta
+import json
+import time
+from datetime import datetime
 
 from .models import (
     Cliente, Farmacia, Repartidor, Producto, Pedido, 
     DetallePedido, Direccion, ObraSocial, MetodoPago,
-    EstadoPedido, DescuentoObraSocial, RecetaMedica,
+    EstadoPedido, DescuentoObraSocial, PrecioObraSocial, RecetaMedica,
     PedidoRechazado, # <--- asegurarse de importar el modelo
+    OfertaPedido,
 )
 from .forms import (
     BusquedaProductoForm, RecetaForm, ConfirmacionPedidoForm,
     DireccionForm, PerfilClienteForm, ContactoForm,
     ClienteSignUpForm, FarmaciaSignUpForm, RepartidorSignUpForm
 )
+from .geocodificacion import (
+    ErrorGeocodificacion, geocodificar_partes,
+)
+from .autocompletar import cercania_usuarios, indice_nombres
+from .busqueda import (
+    IdsPorDistancia, buscar_ids, coinciden_con_texto, contar_facetas, filas_a_resultado, filas_por_ids,
+    filtrar_por_texto, productos_por_distancia,
+)
+from .cache_busqueda import cache_busquedas, clave_busqueda
+from .catalogo import max_codigos_lote, ofertas_por_codigo
+from .despacho import despacho_activo, pedidos_ofrecidos, tiene_oferta
+from .eta import estadisticas_farmacias, estimar_entrega, estimar_entrega_con_repartidor
+from .ranking import ordenar
+from .recorridos import recorrido_pedido
+from .trigramas import indice_trigramas, max_resultados_aproximados
+from .rutas import caja_de_ruta, paradas_de_pedido, planificar_ruta, sugerir_pedidos
+from .ubicaciones import buffer_ubicaciones, registrar_lote, registrar_ubicacion, validar_puntos
 
 # Vista principal - página de inicio
 @login_required 
@@ -37,43 +57,30 @@ def home_page(request):
     try:
         cliente = Cliente.objects.get(user=request.user)
         direccion_cliente = cliente.direccion
+        obra_social_id = cliente.obra_social_id
     except Cliente.DoesNotExist:
         direccion_cliente = None
+        obra_social_id = None
+    
+    # Productos con el precio final para la obra social del cliente (un solo JOIN)
+    activos = PrecioObraSocial.anotar(Producto.objects.filter(activo=True), obra_social_id)
     
-    # Intentar completar coordenadas faltantes de la dirección del cliente
-    if direccion_cliente and (not direccion_cliente.latitud or not direccion_cliente.longitud):
-        try:
-            import requests
-            direccion_completa = f"{direccion_cliente.calle} {direccion_cliente.numero}, {direccion_cliente.ciudad}, {direccion_cliente.provincia}, Argentina"
-            url = "https://nominatim.openstreetmap.org/search"
-            params = {'q': direccion_completa, 'format': 'json', 'limit': 1, 'countrycodes': 'ar'}
-            headers = {'User-Agent': 'FarmaDelivery/1.0'}
-            r = requests.get(url, params=params, headers=headers, timeout=6)
-            if r.status_code == 200 and r.json():
-                lat = float(r.json()[0]['lat'])
-                lon = float(r.json()[0]['lon'])
-                direccion_cliente.latitud = lat
-                direccion_cliente.longitud = lon
-                direccion_cliente.save()
-        except Exception:
-            pass
-
     # Obtener productos destacados de farmacias cercanas
     productos_destacados = []
     if direccion_cliente and direccion_cliente.latitud and direccion_cliente.longitud:
-        farmacias_cercanas = Farmacia.farmacias_cercanas(direccion_cliente, radio_km=2)
-        farmacias_ids = [f['farmacia'].id for f in farmacias_cercanas]
-        productos = Producto.objects.filter(activo=True, farmacia_id__in=farmacias_ids)[:6]
+        farmacias_cercanas = Farmacia.farmacias_cercanas(direccion_cliente)
+        # Distancias ya calculadas en lote por farmacias_cercanas
+        distancias = {f['farmacia'].id: f['distancia'] for f in farmacias_cercanas}
+        productos = activos.filter(farmacia_id__in=distancias).select_related('farmacia')[:6]
         
         for producto in productos:
-            distancia = producto.farmacia.distancia_a_cliente(direccion_cliente)
             productos_destacados.append({
                 'producto': producto,
-                'distancia': round(distancia, 2) if distancia else None
+                'distancia': distancias.get(producto.farmacia_id)
             })
     else:
         # Si no hay dirección, mostrar productos aleatorios
-        productos = Producto.objects.filter(activo=True)[:6]
+        productos = activos[:6]
         productos_destacados = [{'producto': p, 'distancia': None} for p in productos]
     
     context = {
@@ -95,79 +102,130 @@ def buscar_productos(request):
     try:
         cliente = Cliente.objects.get(user=request.user)
         direccion_cliente = cliente.direccion
+        obra_social_id = cliente.obra_social_id
     except Cliente.DoesNotExist:
         direccion_cliente = None
+        obra_social_id = None
     
+    busqueda = categoria = farmacia = laboratorio = orden = None
     if form.is_valid():
         busqueda = form.cleaned_data.get('busqueda')
         categoria = form.cleaned_data.get('categoria')
         farmacia = form.cleaned_data.get('farmacia')
-        
-        if busqueda:
-            productos = productos.filter(nombre__icontains=busqueda)
-        
-        if categoria:
-            if categoria == 'con_receta':
-                productos = productos.filter(requiere_receta=True)
-            elif categoria == 'venta_libre':
-                productos = productos.filter(requiere_receta=False)
-            else:
-                productos = productos.filter(categoria__icontains=categoria)
-            
-        if farmacia:
-            productos = productos.filter(farmacia=farmacia)
+        laboratorio = form.cleaned_data.get('laboratorio')
+        orden = form.cleaned_data.get('orden')
     
-    # Intentar completar coordenadas faltantes de la dirección del cliente
-    if direccion_cliente and (not direccion_cliente.latitud or not direccion_cliente.longitud):
-        try:
-            import requests
-            direccion_completa = f"{direccion_cliente.calle} {direccion_cliente.numero}, {direccion_cliente.ciudad}, {direccion_cliente.provincia}, Argentina"
-            url = "https://nominatim.openstreetmap.org/search"
-            params = {'q': direccion_completa, 'format': 'json', 'limit': 1, 'countrycodes': 'ar'}
-            headers = {'User-Agent': 'FarmaDelivery/1.0'}
-            r = requests.get(url, params=params, headers=headers, timeout=6)
-            if r.status_code == 200 and r.json():
-                lat = float(r.json()[0]['lat'])
-                lon = float(r.json()[0]['lon'])
-                direccion_cliente.latitud = lat
-                direccion_cliente.longitud = lon
-                direccion_cliente.save()
-        except Exception:
-            pass
-
-    # Filtrar productos por farmacias cercanas (2km) si el cliente tiene dirección
-    productos_cercanos = []
+    # Farmacias cercanas y sus distancias si el cliente tiene dirección (en memoria por usuario)
+    distancias = None
     if direccion_cliente and direccion_cliente.latitud and direccion_cliente.longitud:
-        farmacias_cercanas = Farmacia.farmacias_cercanas(direccion_cliente, radio_km=2)
-        farmacias_ids = [f['farmacia'].id for f in farmacias_cercanas]
-        productos = productos.filter(farmacia_id__in=farmacias_ids)
-        
-        # Agregar información de distancia a cada producto
-        for producto in productos:
-            distancia = producto.farmacia.distancia_a_cliente(direccion_cliente)
-            productos_cercanos.append({
-                'producto': producto,
-                'distancia': round(distancia, 2) if distancia else None
-            })
+        distancias = cercania_usuarios.distancias(request.user)
+    
+    # Resultados compartidos entre clientes con la misma búsqueda y las mismas farmacias cercanas
+    clave = clave_busqueda(busqueda, categoria, farmacia.id if farmacia else None, laboratorio, distancias)
+    resultado = cache_busquedas.obtener(clave)
+    if resultado is None:
+        inicio = time.perf_counter()
+        resultado = resultados_busqueda(busqueda, categoria, farmacia, laboratorio, distancias)
+        if farmacia:
+            dependencias = {farmacia.id}
+        else:
+            dependencias = set(distancias) if distancias is not None else None
+        cache_busquedas.guardar(clave, resultado, dependencias, time.perf_counter() - inicio)
+    
+    # El orden por distancia y por precio final (según la obra social del
+    # cliente) y stock va después del cache porque depende de cada cliente
+    if resultado['ids'] is None:
+        # Sin puntaje de relevancia: se ordena por distancia y se pagina en SQL
+        productos = filtrar_productos(categoria, farmacia, laboratorio, distancias)
+        if busqueda:
+            productos = filtrar_por_texto(productos, busqueda)
+        ids = productos_por_distancia(productos, distancias).values_list('id', flat=True)
     else:
-        # Si no hay dirección del cliente, mostrar todos los productos
-        productos_cercanos = [{'producto': p, 'distancia': None} for p in productos]
+        ids = IdsPorDistancia(resultado, distancias)
+    if orden:
+        ids = ordenar(list(ids), orden, obra_social_id=obra_social_id, distancias=distancias)
     
-    # Paginación
-    paginator = Paginator(productos_cercanos, 12)
+    # Paginación sobre los ids; solo se traen los productos de la página
+    paginator = Paginator(ids, 12)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    en_pagina = PrecioObraSocial.anotar(
+        Producto.objects.select_related('farmacia'), obra_social_id,
+    ).in_bulk(list(page_obj.object_list))
+    page_obj.object_list = [
+        {'producto': en_pagina[producto_id], 'distancia': distancias.get(en_pagina[producto_id].farmacia_id) if distancias is not None else None}
+        for producto_id in page_obj.object_list
+        if producto_id in en_pagina
+    ]
     
     context = {
         'form': form,
         'productos': page_obj,
-        'total_resultados': len(productos_cercanos),
+        'total_resultados': paginator.count,
         'direccion_cliente': direccion_cliente,
-        'aplico_cercania': bool(direccion_cliente and direccion_cliente.latitud and direccion_cliente.longitud),
+        'aplico_cercania': distancias is not None,
         'tiene_direccion': bool(direccion_cliente),
+        'busqueda_aproximada': resultado['aproximada'],
+        'facetas': datos_facetas(request, resultado['facetas']),
     }
     return render(request, 'core/buscar_productos.html', context)
 
+# Vista de autocompletado para la caja de búsqueda
+@login_required
+def api_autocompletar(request):
+    """Nombres de productos que empiezan con `term`, de farmacias cercanas al cliente"""
+    term = request.GET.get('term', '').strip()
+    if len(term) < 2:
+        return JsonResponse([], safe=False)
+    farmacias = cercania_usuarios.farmacias(request.user)
+    return JsonResponse(indice_nombres.sugerir(term, farmacias=farmacias), safe=False)
+
+# Vista de métricas del cache de búsquedas
+@login_required
+def api_metricas_busqueda(request):
+    """Aciertos, fallos y tiempo ahorrado por el cache de búsquedas (solo staff)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No tienes permisos'}, status=403)
+    return JsonResponse({'success': True, **cache_busquedas.metricas()})
+
+# Vista de búsqueda por código de barras
+@login_required
+def api_producto_por_codigo(request, codigo):
+    """Producto del catálogo con ese código de barras, sus ofertas y el precio final para el usuario"""
+    productos = datos_productos_por_codigo(request.user, [codigo])
+    if codigo not in productos:
+        return JsonResponse({'error': 'No hay productos disponibles con ese código de barras'}, status=404)
+    return JsonResponse({'success': True, **productos[codigo]})
+
+# Vista de búsqueda de varios códigos de barras juntos (lector de la farmacia, receta con varios productos)
+@login_required
+def api_productos_por_codigos(request):
+    """
+    API endpoint que recibe un JSON {"codigos": ["779...", ...]} y resuelve todos
+    los códigos en una sola consulta.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    try:
+        datos = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    
+    codigos = datos.get('codigos') if isinstance(datos, dict) else None
+    if not isinstance(codigos, list) or not all(isinstance(c, str) and c.strip() for c in codigos):
+        return JsonResponse({'error': 'Se esperaba una lista de códigos de barras'}, status=400)
+    if len(codigos) > max_codigos_lote():
+        return JsonResponse({'error': f'Como máximo {max_codigos_lote()} códigos por consulta'}, status=400)
+    
+    codigos = [c.strip() for c in codigos]
+    productos = datos_productos_por_codigo(request.user, codigos)
+    return JsonResponse({
+        'success': True,
+        'productos': productos,
+        'no_encontrados': [c for c in dict.fromkeys(codigos) if c not in productos],
+    })
+
 # Vista de detalle del producto
 @login_required
 def detalle_producto(request, producto_id):
@@ -181,31 +239,25 @@ def detalle_producto(request, producto_id):
         messages.error(request, 'Debes completar tu perfil de cliente primero.')
         return redirect('perfil_cliente')
     
-    # Calcular precio con descuento de obra social
-    precio_final = producto.precio_base
-    descuento_aplicado = 0
-    
-    if cliente.obra_social:
-        try:
-            descuento_obj = DescuentoObraSocial.objects.get(
-                producto=producto,
-                obra_social=cliente.obra_social,
-                activo=True
-            )
-            if descuento_obj.descuento_porcentaje > 0:
-                descuento_aplicado = (producto.precio_base * descuento_obj.descuento_porcentaje) / 100
-            elif descuento_obj.descuento_fijo > 0:
-                descuento_aplicado = descuento_obj.descuento_fijo
-            
-            precio_final = producto.precio_base - descuento_aplicado
-        except DescuentoObraSocial.DoesNotExist:
-            pass
+    # Precio con descuento de obra social (ya calculado en PrecioObraSocial)
+    precio_final, descuento_aplicado = producto.precio_para(cliente.obra_social_id)
     
     # Formularios - pasar la dirección del cliente para autocompletado si existe
     receta_form = RecetaForm(requiere_receta=producto.requiere_receta)
     direccion_form = DireccionForm(direccion_cliente=getattr(cliente, 'direccion', None))
     confirmacion_form = ConfirmacionPedidoForm()
     
+    # El mismo producto (por código de barras) en otras farmacias cercanas, del más barato al más caro
+    otras_ofertas = []
+    if producto.catalogo_id:
+        distancias = cercania_usuarios.distancias(request.user)
+        otras_ofertas = [
+            {'producto': oferta, 'distancia': distancias.get(oferta.farmacia_id) if distancias is not None else None}
+            for oferta in producto.catalogo.ofertas_disponibles(
+                distancias, obra_social_id=cliente.obra_social_id,
+            ).exclude(id=producto.id)[:5]
+        ]
+    
     context = {
         'producto': producto,
         'cliente': cliente,
@@ -215,6 +267,7 @@ def detalle_producto(request, producto_id):
         'direccion_form': direccion_form,
         'confirmacion_form': confirmacion_form,
         'requiere_receta': producto.requiere_receta,
+        'otras_ofertas': otras_ofertas,
     }
     return render(request, 'core/detalle_producto.html', context)
 
@@ -280,23 +333,7 @@ def procesar_compra(request, producto_id):
     
     # Calcular precios
     precio_base = producto.precio_base
-    descuento_aplicado = 0
-    
-    if cliente.obra_social:
-        try:
-            descuento_obj = DescuentoObraSocial.objects.get(
-                producto=producto,
-                obra_social=cliente.obra_social,
-                activo=True
-            )
-            if descuento_obj.descuento_porcentaje > 0:
-                descuento_aplicado = (precio_base * descuento_obj.descuento_porcentaje) / 100
-            elif descuento_obj.descuento_fijo > 0:
-                descuento_aplicado = descuento_obj.descuento_fijo
-        except DescuentoObraSocial.DoesNotExist:
-            pass
-    
-    precio_final = precio_base - descuento_aplicado
+    precio_final, descuento_aplicado = producto.precio_para(cliente.obra_social_id)
     
     # Crear pedido
     numero_pedido = f"FD{datetime.now().strftime('%Y%m%d')}{str(uuid.uuid4())[:8].upper()}"
@@ -312,8 +349,9 @@ def procesar_compra(request, producto_id):
         total=precio_final,
         direccion_entrega=direccion,
         observaciones=confirmacion_form.cleaned_data['observaciones'],
-        fecha_entrega_estimada=timezone.now() + timedelta(hours=2)
+        fecha_entrega_estimada=estimar_entrega(producto.farmacia_id, direccion.latitud, direccion.longitud)
     )
+    estadisticas_farmacias.sumar_a_cola(producto.farmacia_id)
     
     # Crear detalle del pedido
     DetallePedido.objects.create(
@@ -327,7 +365,7 @@ def procesar_compra(request, producto_id):
     
     # Reducir stock
     producto.stock_disponible -= 1
-    producto.save()
+    producto.save(update_fields=['stock_disponible'])
     
     # Guardar receta si se subió
     if receta_form.cleaned_data.get('archivo_receta'):
@@ -406,6 +444,8 @@ def perfil_cliente(request):
         form = PerfilClienteForm(request.POST, instance=cliente)
         if form.is_valid():
             form.save()
+            # La dirección pudo cambiar: recalcular farmacias cercanas para el autocompletado
+            cercania_usuarios.invalidar(request.user.id)
             messages.success(request, 'Perfil actualizado correctamente.')
             return redirect('perfil_cliente')
     else:
@@ -445,8 +485,14 @@ def panel_repartidor(request):
         messages.error(request, 'No tienes permisos de repartidor.')
         return redirect('home')
     
-    # Obtener pedidos cercanos
-    pedidos_cercanos = repartidor.pedidos_cercanos(radio_km=2)
+    # La última ubicación recibida todavía puede no estar volcada a la base
+    buffer_ubicaciones.aplicar(repartidor)
+    
+    # Obtener pedidos cercanos (con despacho centralizado, solo los ofrecidos a este repartidor)
+    if despacho_activo():
+        pedidos_cercanos = pedidos_ofrecidos(repartidor)
+    else:
+        pedidos_cercanos = repartidor.pedidos_cercanos()
     
     context = {
         'repartidor': repartidor,
@@ -471,12 +517,13 @@ def actualizar_ubicacion_repartidor(request):
         latitud = float(request.POST.get('latitud'))
         longitud = float(request.POST.get('longitud'))
         
-        repartidor.actualizar_ubicacion(latitud, longitud)
+        # El ping queda en memoria y se guarda en la base en el próximo volcado por lotes
+        cantidad_cercanos = registrar_ubicacion(repartidor, latitud, longitud)
         
         return JsonResponse({
             'success': True,
             'mensaje': 'Ubicación actualizada correctamente',
-            'pedidos_cercanos': len(repartidor.pedidos_cercanos())
+            'pedidos_cercanos': cantidad_cercanos
         })
         
     except (ValueError, TypeError) as e:
@@ -484,6 +531,42 @@ def actualizar_ubicacion_repartidor(request):
     except Exception as e:
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 
+# Vista para subir varias ubicaciones juntas (repartidores con mala conexión)
+@login_required
+def actualizar_ubicacion_lote(request):
+    """
+    API endpoint que recibe un JSON {"puntos": [{"latitud", "longitud", "timestamp"}, ...]}.
+    Todos los puntos se guardan en el historial y el más reciente queda como ubicación actual.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    try:
+        repartidor = Repartidor.objects.get(user=request.user)
+    except Repartidor.DoesNotExist:
+        return JsonResponse({'error': 'No tienes permisos de repartidor'}, status=403)
+    
+    try:
+        datos = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    
+    puntos, errores = validar_puntos(datos.get('puntos') if isinstance(datos, dict) else None)
+    if errores:
+        return JsonResponse({'error': 'Puntos inválidos', 'errores': errores}, status=400)
+    
+    try:
+        cantidad_cercanos = registrar_lote(repartidor, puntos)
+    except Exception as e:
+        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
+    
+    return JsonResponse({
+        'success': True,
+        'mensaje': f'{len(puntos)} ubicaciones registradas',
+        'puntos_registrados': len(puntos),
+        'pedidos_cercanos': cantidad_cercanos
+    })
+
 # API endpoint para obtener pedidos disponibles para repartidores
 @login_required
 def api_pedidos_disponibles(request):
@@ -493,8 +576,14 @@ def api_pedidos_disponibles(request):
     except Repartidor.DoesNotExist:
         return JsonResponse({'error': 'No tienes permisos de repartidor'}, status=403)
     
-    # Obtener pedidos cercanos
-    pedidos_cercanos = repartidor.pedidos_cercanos_filtrado(radio_km=2)
+    # La última ubicación recibida todavía puede no estar volcada a la base
+    buffer_ubicaciones.aplicar(repartidor)
+    
+    # Obtener pedidos cercanos (con despacho centralizado, solo los ofrecidos a este repartidor)
+    if despacho_activo():
+        pedidos_cercanos = pedidos_ofrecidos(repartidor)
+    else:
+        pedidos_cercanos = repartidor.pedidos_cercanos_filtrado()
     
     # Formatear datos para el frontend
     pedidos_data = []
@@ -532,8 +621,15 @@ def api_pedidos_activos(request):
         repartidor = Repartidor.objects.get(user=request.user)
     except Repartidor.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'No tienes permisos de repartidor'}, status=403)
+    # La ruta arranca desde la última ubicación recibida, aunque no esté volcada a la base
+    buffer_ubicaciones.aplicar(repartidor)
 
-    pedidos = Pedido.objects.filter(repartidor=repartidor, estado=EstadoPedido.EN_CAMINO).order_by('-fecha_creacion')
+    pedidos = list(
+        Pedido.objects.filter(repartidor=repartidor, estado=EstadoPedido.EN_CAMINO)
+        .select_related('farmacia__direccion', 'direccion_entrega', 'cliente__user')
+        .prefetch_related('detalles__producto')
+        .order_by('-fecha_creacion')
+    )
 
     data = []
     for pedido in pedidos:
@@ -551,7 +647,8 @@ def api_pedidos_activos(request):
             'total': float(pedido.total),
         })
 
-    return JsonResponse({'success': True, 'pedidos': data})
+    ruta, sugeridos = datos_ruta_repartidor(repartidor, pedidos)
+    return JsonResponse({'success': True, 'pedidos': data, 'ruta': ruta, 'sugeridos': sugeridos})
 
 # Vista para aceptar un pedido
 @login_required
@@ -562,23 +659,33 @@ def aceptar_pedido(request, pedido_id):
     except Repartidor.DoesNotExist:
         return JsonResponse({'error': 'No tienes permisos de repartidor'}, status=403)
     
-    pedido = get_object_or_404(Pedido, id=pedido_id)
-    
-    # Verificar que el pedido esté disponible y cercano
-    pedidos_cercanos = repartidor.pedidos_cercanos()
-    pedido_cercano = None
+    # La última ubicación recibida todavía puede no estar volcada a la base
+    buffer_ubicaciones.aplicar(repartidor)
     
-    for item in pedidos_cercanos:
-        if item['pedido'].id == pedido.id:
-            pedido_cercano = item
-            break
+    pedido = get_object_or_404(Pedido, id=pedido_id)
     
-    if not pedido_cercano:
-        return JsonResponse({'error': 'Pedido no disponible o fuera de alcance'}, status=400)
+    if despacho_activo():
+        # Con despacho centralizado solo puede tomarlo el repartidor al que se le ofreció
+        if not tiene_oferta(repartidor, pedido) or pedido.repartidor_id is not None:
+            return JsonResponse({'error': 'Pedido no disponible o fuera de alcance'}, status=400)
+    else:
+        # Verificar que el pedido esté disponible y cercano
+        pedidos_cercanos = repartidor.pedidos_cercanos()
+        pedido_cercano = None
+        
+        for item in pedidos_cercanos:
+            if item['pedido'].id == pedido.id:
+                pedido_cercano = item
+                break
+        
+        if not pedido_cercano:
+            return JsonResponse({'error': 'Pedido no disponible o fuera de alcance'}, status=400)
     
-    # Asignar el pedido al repartidor
+    # Asignar el pedido al repartidor y reestimar la entrega con su ubicación y vehículo
     pedido.repartidor = repartidor
     pedido.estado = EstadoPedido.EN_CAMINO
+    pedido.fecha_asignacion = timezone.now()
+    pedido.fecha_entrega_estimada = estimar_entrega_con_repartidor(pedido, repartidor)
     pedido.save()
     
     # Enviar email de notificación
@@ -603,55 +710,33 @@ def rechazar_pedido(request, pedido_id):
     pedido = get_object_or_404(Pedido, id=pedido_id)
     # Registrar rechazo si no existe
     PedidoRechazado.objects.get_or_create(pedido=pedido, repartidor=repartidor)
+    # Liberar la oferta para que la próxima ronda de despacho se la ofrezca a otro
+    OfertaPedido.objects.filter(pedido=pedido, repartidor=repartidor).delete()
     return JsonResponse({'success': True, 'mensaje': 'Pedido rechazado'})
 
 # Vista para geocodificar direcciones
 def geocodificar_direccion(request):
     """API endpoint para geocodificar una dirección"""
     if request.method == 'POST':
+        calle = request.POST.get('calle')
+        numero = request.POST.get('numero')
+        ciudad = request.POST.get('ciudad')
+        provincia = request.POST.get('provincia')
+        
+        if not all([calle, numero, ciudad, provincia]):
+            return JsonResponse({'error': 'Faltan datos de la dirección'}, status=400)
+        
+        # Se intenta la grilla local de La Plata, luego la caché y por último Nominatim
         try:
-            import requests
-            
-            calle = request.POST.get('calle')
-            numero = request.POST.get('numero')
-            ciudad = request.POST.get('ciudad')
-            provincia = request.POST.get('provincia')
-            
-            if not all([calle, numero, ciudad, provincia]):
-                return JsonResponse({'error': 'Faltan datos de la dirección'}, status=400)
-            
-            # Usar Nominatim (OpenStreetMap) para geocodificación gratuita
-            direccion_completa = f"{calle} {numero}, {ciudad}, {provincia}, Argentina"
-            url = f"https://nominatim.openstreetmap.org/search"
-            params = {
-                'q': direccion_completa,
-                'format': 'json',
-                'limit': 1,
-                'countrycodes': 'ar'
-            }
-            headers = {
-                'User-Agent': 'FarmaDelivery/1.0'
-            }
-            
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    lat = float(data[0]['lat'])
-                    lon = float(data[0]['lon'])
-                    return JsonResponse({
-                        'latitud': lat,
-                        'longitud': lon,
-                        'direccion_encontrada': data[0]['display_name']
-                    })
-                else:
-                    return JsonResponse({'error': 'Dirección no encontrada'}, status=404)
-            else:
-                return JsonResponse({'error': 'Error en el servicio de geocodificación'}, status=500)
-                
+            resultado = geocodificar_partes(calle, numero, ciudad, provincia, timeout=10)
+        except ErrorGeocodificacion:
+            return JsonResponse({'error': 'Error en el servicio de geocodificación'}, status=500)
         except Exception as e:
             return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
+        
+        if resultado is None:
+            return JsonResponse({'error': 'Dirección no encontrada'}, status=404)
+        return JsonResponse(resultado)
     
     return JsonResponse({'error': 'Método no permitido'}, status=405)
 
@@ -828,7 +913,56 @@ def entregar_al_repartidor(request, pedido_id):
     return JsonResponse({
         'success': True,
         'mensaje': 'Pedido entregado al repartidor',
-        'nuevo_estado': pedido.get_estado_display()
+        'nuevo_estado': pedido.get_estado_display(),
+        'repartidores_cercanos': datos_repartidores_cercanos(farmacia.direccion),
+    })
+
+# API endpoint para ver los repartidores disponibles más cercanos a la farmacia
+@login_required
+def api_repartidores_cercanos(request, pedido_id):
+    """Repartidores activos y disponibles más cercanos a la farmacia de un pedido"""
+    try:
+        farmacia = Farmacia.objects.select_related('direccion').get(user=request.user)
+    except Farmacia.DoesNotExist:
+        return JsonResponse({'error': 'No tienes permisos de farmacia'}, status=403)
+    
+    pedido = get_object_or_404(Pedido, id=pedido_id, farmacia=farmacia)
+    
+    try:
+        k = int(request.GET.get('k', 5))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetro k inválido'}, status=400)
+    k = max(1, min(k, 50))
+    
+    return JsonResponse({
+        'success': True,
+        'pedido_id': pedido.id,
+        'repartidores': datos_repartidores_cercanos(farmacia.direccion, k=k),
+    })
+
+# API para reproducir el recorrido del repartidor de un pedido
+@login_required
+def api_recorrido_pedido(request, pedido_id):
+    """Puntos del recorrido del repartidor durante un pedido (farmacia del pedido o staff)"""
+    if request.user.is_staff:
+        pedido = get_object_or_404(Pedido, id=pedido_id)
+    else:
+        try:
+            farmacia = Farmacia.objects.get(user=request.user)
+        except Farmacia.DoesNotExist:
+            return JsonResponse({'error': 'No tienes permisos de farmacia'}, status=403)
+        pedido = get_object_or_404(Pedido, id=pedido_id, farmacia=farmacia)
+    
+    recorrido = recorrido_pedido(pedido)
+    if recorrido is None:
+        return JsonResponse({'error': 'El pedido no tiene repartidor asignado'}, status=404)
+    
+    return JsonResponse({
+        'success': True,
+        'pedido': pedido.numero_pedido,
+        'repartidor_id': pedido.repartidor_id,
+        'estado': pedido.estado,
+        **recorrido,
     })
 
 # Vista para marcar pedido como listo para retiro
@@ -919,7 +1053,8 @@ def actualizar_stock(request, producto_id):
                 return JsonResponse({'error': 'El stock no puede ser negativo'}, status=400)
             
             producto.stock_disponible = nuevo_stock
-            producto.save()
+            # Solo el stock: no invalida las búsquedas ni los índices de productos
+            producto.save(update_fields=['stock_disponible'])
             
             return JsonResponse({
                 'success': True,
@@ -998,6 +1133,189 @@ def configuracion_cuenta_farmacia(request):
     return render(request, 'core/configuracion_cuenta_farmacia.html', context)
 
 # Funciones auxiliares
+def datos_productos_por_codigo(user, codigos):
+    """
+    Ofertas por código de barras listas para serializar. Un cliente ve el precio
+    con su obra social y, si tiene dirección, solo las farmacias cercanas (con
+    la distancia); una farmacia ve todas las ofertas y cuál es la suya.
+    """
+    obra_social_id = None
+    distancias = None
+    farmacia_propia_id = None
+    try:
+        cliente = Cliente.objects.get(user=user)
+        obra_social_id = cliente.obra_social_id
+        distancias = cercania_usuarios.distancias(user)
+    except Cliente.DoesNotExist:
+        farmacia_propia_id = Farmacia.objects.filter(user=user).values_list('id', flat=True).first()
+    
+    productos = ofertas_por_codigo(codigos, obra_social_id=obra_social_id, farmacias_ids=distancias)
+    for datos in productos.values():
+        for oferta in datos['ofertas']:
+            oferta['precio_base'] = float(oferta['precio_base'])
+            oferta['precio_final'] = float(oferta['precio_final'])
+            if distancias is not None:
+                oferta['distancia'] = distancias.get(oferta['farmacia_id'])
+            if farmacia_propia_id is not None:
+                oferta['propia'] = oferta['farmacia_id'] == farmacia_propia_id
+    return productos
+
+def filtrar_productos(categoria, farmacia, laboratorio, distancias):
+    """Productos activos con los filtros de la búsqueda (sin el texto)"""
+    productos = Producto.objects.filter(activo=True)
+    if categoria:
+        if categoria == 'con_receta':
+            productos = productos.filter(requiere_receta=True)
+        elif categoria == 'venta_libre':
+            productos = productos.filter(requiere_receta=False)
+        else:
+            # Valor exacto, como lo agrupa contar_facetas (lo que cuenta la faceta es lo que se filtra)
+            productos = productos.filter(categoria__iexact=categoria)
+    if farmacia:
+        productos = productos.filter(farmacia=farmacia)
+    if laboratorio:
+        productos = productos.filter(laboratorio__iexact=laboratorio)
+    if distancias is not None:
+        productos = productos.filter(farmacia_id__in=distancias)
+    return productos
+
+def resultados_busqueda(busqueda, categoria, farmacia, laboratorio, distancias):
+    """
+    Productos que coinciden con la búsqueda y los filtros (ids, farmacias y
+    puntaje de relevancia, ordenados por relevancia e id) y sus facetas. No
+    depende de la ubicación del cliente más allá del conjunto de farmacias
+    cercanas: se guarda en el cache y se ordena por distancia al usarlo.
+    
+    Sin puntaje de relevancia (sin texto o sin índice FTS) no se guardan los
+    ids ('ids' es None): pueden ser todo el catálogo, y la vista los ordena y
+    pagina en SQL.
+    """
+    productos = filtrar_productos(categoria, farmacia, laboratorio, distancias)
+    
+    # (id, farmacia_id, puntaje) de cada resultado; a menor puntaje más relevante
+    filas = None
+    aproximada = False
+    productos_filtrados = productos
+    if busqueda:
+        # Índice de texto completo con los filtros aplicados en la misma consulta
+        filas = buscar_ids(busqueda, productos)
+        if filas is None:
+            # Base sin índice de texto completo
+            productos = filtrar_por_texto(productos, busqueda)
+        else:
+            productos = coinciden_con_texto(productos, busqueda)
+        
+        # Sin resultados exactos: probar con la búsqueda tolerante a errores de tipeo.
+        # El índice ya descarta las farmacias que no corresponden; el resto de los
+        # filtros se aplica en SQL y recién después se toman los más parecidos
+        if not (filas if filas is not None else productos.exists()):
+            if farmacia:
+                farmacias = {farmacia.id}
+            else:
+                farmacias = set(distancias) if distancias is not None else None
+            puntajes = dict(indice_trigramas.buscar(busqueda, limite=0, farmacias=farmacias))
+            filas = [
+                (producto_id, farmacia_id, -puntajes[producto_id])
+                for producto_id, farmacia_id in filas_por_ids(productos_filtrados, puntajes)
+            ]
+            filas.sort(key=lambda fila: (fila[2], fila[0]))
+            del filas[max_resultados_aproximados():]
+            productos = productos_filtrados.filter(id__in=[fila[0] for fila in filas])
+            aproximada = True
+    
+    # Cantidades por categoría, laboratorio, receta y farmacia sobre los mismos resultados
+    facetas = contar_facetas(productos)
+    
+    if filas is None:
+        return {'ids': None, 'farmacias': None, 'puntajes': None, 'facetas': facetas, 'aproximada': False}
+    filas.sort(key=lambda fila: (fila[2], fila[0]))
+    return {
+        **filas_a_resultado(filas),
+        'facetas': facetas,
+        'aproximada': aproximada,
+    }
+
+def datos_facetas(request, facetas):
+    """
+    Agrega a cada valor de faceta el enlace que aplica ese filtro manteniendo
+    los demás (o lo quita si ya está aplicado). La faceta de receta usa el
+    parámetro `categoria`, igual que el select de categorías.
+    """
+    parametros = {'categoria': 'categoria', 'requiere_receta': 'categoria', 'laboratorio': 'laboratorio', 'farmacia': 'farmacia'}
+    titulos = {'requiere_receta': 'Receta', 'categoria': 'Categoría', 'laboratorio': 'Laboratorio', 'farmacia': 'Farmacia'}
+    datos = []
+    for faceta, valores in facetas.items():
+        parametro = parametros[faceta]
+        opciones = []
+        for valor, etiqueta, cantidad in valores:
+            query = request.GET.copy()
+            query.pop('page', None)
+            activo = query.get(parametro, '').lower() == str(valor).lower()
+            if activo:
+                query.pop(parametro)
+            else:
+                query[parametro] = valor
+            opciones.append({
+                'etiqueta': etiqueta,
+                'cantidad': cantidad,
+                'activo': activo,
+                'url': f'?{query.urlencode()}',
+            })
+        if opciones:
+            datos.append({'titulo': titulos[faceta], 'opciones': opciones})
+    return datos
+
+def datos_repartidores_cercanos(direccion, k=5):
+    """Repartidores disponibles más cercanos a una dirección, listos para serializar"""
+    if not (direccion.latitud and direccion.longitud):
+        return []
+    cercanos = Repartidor.repartidores_cercanos(direccion.latitud, direccion.longitud, k=k)
+    return [
+        {
+            'id': item['repartidor'].id,
+            'nombre': item['repartidor'].user.get_full_name(),
+            'tipo_vehiculo': item['repartidor'].tipo_vehiculo,
+            'distancia': item['distancia'],
+        }
+        for item in cercanos
+    ]
+
+def datos_ruta_repartidor(repartidor, pedidos):
+    """Ruta ordenada de los pedidos en curso y pedidos LISTO que convienen sumar, listos para serializar"""
+    paradas = [parada for pedido in pedidos for parada in paradas_de_pedido(pedido)]
+    if not paradas:
+        return {'paradas': [], 'distancia_km': 0}, []
+    
+    # Sin ubicación se arranca desde el retiro del pedido más viejo
+    ubicacion = repartidor.ubicacion_para_busqueda()
+    origen = (float(ubicacion[0]), float(ubicacion[1])) if ubicacion else (paradas[-2]['latitud'], paradas[-2]['longitud'])
+    ruta = planificar_ruta(origen, paradas)
+    
+    # Con despacho centralizado el repartidor no elige pedidos: no hay sugerencias
+    if despacho_activo():
+        return ruta, []
+    
+    lat_min, lat_max, lon_min, lon_max = caja_de_ruta(origen, ruta['paradas'])
+    rechazados_ids = PedidoRechazado.objects.filter(repartidor=repartidor).values_list('pedido_id', flat=True)
+    candidatos = Pedido.objects.filter(
+        estado=EstadoPedido.LISTO,
+        repartidor__isnull=True,
+        farmacia__direccion__latitud__range=(lat_min, lat_max),
+        farmacia__direccion__longitud__range=(lon_min, lon_max),
+        direccion_entrega__latitud__range=(lat_min, lat_max),
+        direccion_entrega__longitud__range=(lon_min, lon_max),
+    ).exclude(id__in=rechazados_ids).select_related('farmacia__direccion', 'direccion_entrega')
+    sugeridos = [
+        {
+            'id': item['pedido'].id,
+            'numero': item['pedido'].numero_pedido,
+            'farmacia': item['pedido'].farmacia.nombre,
+            'desvio_km': item['desvio_km'],
+        }
+        for item in sugerir_pedidos(origen, ruta['paradas'], candidatos[:50])
+    ]
+    return ruta, sugeridos
+
 def enviar_email_confirmacion_pedido(pedido):
     """Envía email de confirmación del pedido"""
     try:
@@ -0,0 +1,79 @@
+"""
+Índice de zonas de reparto (polígonos) de farmacias y repartidores.
+
+Cada polígono se registra en todas las celdas de la grilla de core/geo.py que
+toca su caja. Para saber qué zonas contienen un punto se buscan los
+polígonos de la celda del punto, se descartan por caja y solo a los que
+quedan se les hace la prueba exacta de punto en polígono.
+
+El índice se arma en memoria la primera vez que se usa, se invalida cuando se
+guarda una zona (ver core/signals.py) y además se rearma cada ZONAS_TTL
+segundos, para tomar los cambios hechos desde otros procesos.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .geo import caja_de_poligono, celda_para, celdas_en_caja, punto_en_poligono
+from .models import Farmacia, Repartidor
+
+
+class IndiceZonas:
+    """Polígonos agrupados por celda; `cargar` retorna pares (id, polígono)"""
+
+    def __init__(self, cargar):
+        self._cargar = cargar
+        self._celdas = {}
+        self._poligonos = {}
+        self._armado = None
+        self._lock = threading.Lock()
+
+    def _indice(self):
+        ttl = getattr(settings, 'ZONAS_TTL', 60)
+        with self._lock:
+            if self._armado is not None and time.monotonic() - self._armado < ttl:
+                return self._celdas, self._poligonos
+            celdas = {}
+            poligonos = {}
+            for zona_id, poligono in self._cargar():
+                if not poligono:
+                    continue
+                caja = caja_de_poligono(poligono)
+                poligonos[zona_id] = poligono
+                for celda in celdas_en_caja(*caja):
+                    celdas.setdefault(celda, []).append((zona_id, caja, poligono))
+            self._celdas, self._poligonos = celdas, poligonos
+            self._armado = time.monotonic()
+            return celdas, poligonos
+
+    def invalidar(self):
+        with self._lock:
+            self._armado = None
+
+    def que_contienen(self, latitud, longitud):
+        """Ids de las zonas que contienen el punto"""
+        celdas, _ = self._indice()
+        latitud = float(latitud)
+        longitud = float(longitud)
+        return {
+            zona_id
+            for zona_id, (lat_min, lat_max, lon_min, lon_max), poligono in celdas.get(celda_para(latitud, longitud), ())
+            if lat_min <= latitud <= lat_max and lon_min <= longitud <= lon_max
+            and punto_en_poligono(latitud, longitud, poligono)
+        }
+
+    def con_zona(self):
+        """Ids que tienen zona definida"""
+        return self._indice()[1].keys()
+
+    def poligono(self, zona_id):
+        return self._indice()[1].get(zona_id)
+
+
+zonas_farmacias = IndiceZonas(
+    lambda: Farmacia.objects.filter(activa=True, zona_entrega__isnull=False).values_list('id', 'zona_entrega')
+)
+zonas_repartidores = IndiceZonas(
+    lambda: Repartidor.objects.filter(activo=True, zona_poligono__isnull=False).values_list('id', 'zona_poligono')
+)
@@ -413,8 +413,8 @@ def crear_productos_para_farmacias(farmacias):
             precio_variado = producto_data['precio_base'] + (hash(farmacia.nombre) % 50 - 25)
             stock_variado = producto_data['stock_disponible'] + (hash(farmacia.nombre) % 20 - 10)
             
-            # Crear código de barras único para evitar conflictos
-            codigo_barras = f"7891234567{i:03d}{j:03d}"
+            # Mismo código de barras en todas las farmacias: es el mismo producto del catálogo
+            codigo_barras = f"7891234567{j:03d}"
             
             Producto.objects.create(
                 farmacia=farmacia,
@@ -433,8 +433,8 @@ def crear_productos_para_farmacias(farmacias):
         if farmacia.nombre == 'Farmacia Central':
             print(f"   💊 Agregando medicamentos con receta exclusivos a {farmacia.nombre}...")
             for k, medicamento_data in enumerate(medicamentos_receta_central):
-                # Crear código de barras único para medicamentos con receta
-                codigo_barras_receta = f"RX{i:03d}{k:04d}"
+                # Código de barras del medicamento (entrada del catálogo)
+                codigo_barras_receta = f"RX{k:04d}"
                 
                 Producto.objects.create(
                     farmacia=farmacia,